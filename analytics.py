@@ -0,0 +1,349 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import importlib.util
+
+DB_PATH = 'vast_ads.db'
+
+# Columnar reports over vast_ads in an embedded DuckDB. DuckDB is optional
+# and only imported when a report runs. Reports read the view `ads`: the
+# hot rows unioned with every archived Parquet partition. The hot rows come
+# from a Parquet snapshot refreshed at most every ANALYTICS_SNAPSHOT_SECONDS,
+# so report scans never hold a lock on the live database. The snapshot is
+# written with sqlite3 and pyarrow, so it needs no DuckDB extension.
+# ANALYTICS_SOURCE=sqlite scans the live file read-only instead, which
+# holds a shared lock for the duration of each scan. That needs DuckDB's
+# sqlite extension, which is never downloaded at request time: run
+# `python analytics.py install` once per host (or pre-seed
+# ~/.duckdb/extensions on offline hosts).
+ANALYTICS_SOURCE = os.environ.get('ANALYTICS_SOURCE', 'snapshot')
+ANALYTICS_DIR = os.environ.get('ANALYTICS_DIR', 'analytics')
+ANALYTICS_SNAPSHOT_SECONDS = float(os.environ.get('ANALYTICS_SNAPSHOT_SECONDS', 300))
+ANALYTICS_THREADS = int(os.environ.get('ANALYTICS_THREADS', os.cpu_count() or 1))
+SNAPSHOT_PATH = os.path.join(ANALYTICS_DIR, 'vast_ads_hot.parquet')
+CALLS_SNAPSHOT_PATH = os.path.join(ANALYTICS_DIR, 'vast_calls.parquet')
+DEFAULT_LIMIT = 100
+SNAPSHOT_CHUNK_ROWS = 50000
+
+# Light columns only; SQLite is dynamically typed, so everything is read as
+# text (the snapshot stores it that way too) and cast here.
+ADS_COLUMNS_SQL = '''
+    TRY_CAST(id AS BIGINT) AS id,
+    TRY_CAST(call_number AS INTEGER) AS call_number,
+    CAST(ad_id AS VARCHAR) AS ad_id,
+    CAST(creative_id AS VARCHAR) AS creative_id,
+    CAST(ssai_creative_id AS VARCHAR) AS ssai_creative_id,
+    CAST(adomain AS VARCHAR) AS adomain,
+    CAST(channel_name AS VARCHAR) AS channel_name,
+    CAST(creative_hash AS VARCHAR) AS creative_hash,
+    COALESCE(TRY_CAST(wrapped_ad AS INTEGER), 0) AS wrapped_ad,
+    TRY_CAST(created_at AS TIMESTAMP) AS created_at
+'''
+
+# One row per parse_vast_and_store call, from its stored 'call' span
+CALLS_COLUMNS_SQL = '''
+    CAST(call_id AS VARCHAR) AS call_id,
+    CAST(host AS VARCHAR) AS host,
+    CAST(status AS VARCHAR) AS status,
+    TRY_CAST(duration_ms AS DOUBLE) AS duration_ms,
+    TRY_CAST(created_at AS TIMESTAMP) AS created_at
+'''
+
+ADS_SNAPSHOT_COLUMNS = ['id', 'call_number', 'ad_id', 'creative_id', 'ssai_creative_id', 'adomain', 'channel_name',
+                        'creative_hash', 'wrapped_ad', 'created_at']
+CALLS_SNAPSHOT_COLUMNS = ['call_id', 'host', 'status', 'duration_ms', 'created_at']
+
+DUCKDB_MISSING = "Analytics needs the optional duckdb package (pip install duckdb)."
+
+_snapshot_lock = threading.Lock()
+_refreshing = False
+_refresh_error = None
+
+
+class AnalyticsUnavailable(RuntimeError):
+    """DuckDB, its sqlite extension or the snapshot is not ready; app.py answers 503."""
+
+
+def available():
+    return importlib.util.find_spec('duckdb') is not None
+
+
+def _duckdb():
+    try:
+        import duckdb
+    except ImportError:
+        raise AnalyticsUnavailable(DUCKDB_MISSING)
+    # LOAD must never fall back to downloading the extension
+    con = duckdb.connect(config={'autoinstall_known_extensions': False})
+    con.execute(f"SET threads TO {ANALYTICS_THREADS}")
+    return con
+
+
+def install_extension():
+    """Download DuckDB's sqlite extension; the only step that needs the network."""
+    con = _duckdb()
+    try:
+        con.execute("INSTALL sqlite")
+    finally:
+        con.close()
+
+
+def _attach_live(con, db_path):
+    import duckdb
+    try:
+        con.execute("LOAD sqlite")
+    except duckdb.Error as e:
+        raise AnalyticsUnavailable(f"DuckDB's sqlite extension is not installed; run `python analytics.py install` ({e})")
+    con.execute("SET sqlite_all_varchar = true")
+    con.execute(f"ATTACH '{db_path}' AS live (TYPE SQLITE, READ_ONLY)")
+
+
+def _as_text(columns):
+    return ', '.join(f"CAST({c} AS TEXT)" for c in columns)
+
+
+def _write_snapshot(conn, sql, columns, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(c, pa.string()) for c in columns])
+    rows = 0
+    writer = pq.ParquetWriter(path + '.tmp', schema, compression='zstd')
+    try:
+        cur = conn.execute(sql)
+        while True:
+            chunk = cur.fetchmany(SNAPSHOT_CHUNK_ROWS)
+            if not chunk:
+                break
+            writer.write_table(pa.table([pa.array(col, pa.string()) for col in zip(*chunk)], schema=schema))
+            rows += len(chunk)
+    finally:
+        writer.close()
+    os.replace(path + '.tmp', path)
+    return rows
+
+
+def refresh_snapshot(db_path=DB_PATH):
+    """Copy the hot rows and call timings to Parquet, one sequential read each; returns the ad row count."""
+    os.makedirs(ANALYTICS_DIR, exist_ok=True)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    try:
+        rows = _write_snapshot(conn, f"SELECT {_as_text(ADS_SNAPSHOT_COLUMNS)} FROM vast_ads",
+                               ADS_SNAPSHOT_COLUMNS, SNAPSHOT_PATH)
+        _write_snapshot(conn, f"SELECT {_as_text(CALLS_SNAPSHOT_COLUMNS)} FROM vast_call_metrics WHERE stage = 'call'",
+                        CALLS_SNAPSHOT_COLUMNS, CALLS_SNAPSHOT_PATH)
+    finally:
+        conn.close()
+    return rows
+
+
+def _refresh_in_background(db_path):
+    global _refreshing, _refresh_error
+    try:
+        refresh_snapshot(db_path)
+        _refresh_error = None
+    except Exception as e:
+        _refresh_error = str(e)
+        print(f"❌ Analytics snapshot refresh failed: {e}")
+    finally:
+        with _snapshot_lock:
+            _refreshing = False
+
+
+def _ensure_snapshot(db_path):
+    """Start a background refresh when the snapshot is stale; reports read the current one meanwhile."""
+    global _refreshing
+    try:
+        age = time.time() - os.path.getmtime(CALLS_SNAPSHOT_PATH)
+    except OSError:
+        age = None
+    with _snapshot_lock:
+        if (age is None or age > ANALYTICS_SNAPSHOT_SECONDS) and not _refreshing:
+            _refreshing = True
+            threading.Thread(target=_refresh_in_background, args=(db_path,), name='analytics-snapshot',
+                             daemon=True).start()
+    if age is None:
+        if _refresh_error:
+            raise AnalyticsUnavailable(f"The analytics snapshot could not be built: {_refresh_error}")
+        raise AnalyticsUnavailable("The analytics snapshot is being built; retry shortly.")
+
+
+def _archive_paths(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        paths = [r[0] for r in conn.execute("SELECT path FROM vast_ads_partitions ORDER BY min_created_at")]
+    except sqlite3.OperationalError:
+        paths = []
+    finally:
+        conn.close()
+    return [p for p in paths if os.path.exists(p)]
+
+
+def connect(db_path=DB_PATH, source=None):
+    """DuckDB connection with the `ads` and `calls` views defined."""
+    source = source or ANALYTICS_SOURCE
+    if source == 'snapshot':
+        _ensure_snapshot(db_path)
+    con = _duckdb()
+    if source == 'snapshot':
+        hot = f"SELECT {ADS_COLUMNS_SQL} FROM read_parquet('{SNAPSHOT_PATH}')"
+        con.execute(f"CREATE VIEW calls AS SELECT {CALLS_COLUMNS_SQL} FROM read_parquet('{CALLS_SNAPSHOT_PATH}')")
+    else:
+        _attach_live(con, db_path)
+        hot = f"SELECT {ADS_COLUMNS_SQL} FROM live.vast_ads"
+        con.execute(f"CREATE VIEW calls AS SELECT {CALLS_COLUMNS_SQL} FROM live.vast_call_metrics WHERE stage = 'call'")
+    archives = _archive_paths(db_path)
+    if archives:
+        files = '[' + ', '.join(f"'{p}'" for p in archives) + ']'
+        hot += f" UNION ALL SELECT {ADS_COLUMNS_SQL} FROM read_parquet({files}, union_by_name = true)"
+    con.execute(f"CREATE VIEW ads AS {hot}")
+    return con
+
+
+# --- Reports ---------------------------------------------------------------
+# Each takes a where(columns) helper, which renders the request filters that
+# apply to those columns as (clause, params), and the row limit; it returns
+# (sql, params).
+
+def _distinct_creatives_daily(where, limit):
+    clause, params = where(('created_at', 'channel_name'))
+    return f'''
+        SELECT channel_name, CAST(date_trunc('day', created_at) AS DATE) AS day,
+               COUNT(*) AS ads, COUNT(DISTINCT creative_hash) AS distinct_creatives
+        FROM ads {clause}
+        GROUP BY ALL
+        ORDER BY day DESC, ads DESC
+        LIMIT ?
+    ''', params + [limit]
+
+
+def _call_variance(where, limit):
+    # Per channel, how ads and creatives per call_number vary across calls
+    clause, params = where(('created_at', 'channel_name'))
+    return f'''
+        WITH per_call AS (
+            SELECT channel_name, call_number, COUNT(*) AS ads, COUNT(DISTINCT creative_hash) AS creatives
+            FROM ads {clause}
+            GROUP BY ALL
+        )
+        SELECT channel_name, COUNT(*) AS call_numbers,
+               AVG(ads) AS mean_ads, STDDEV_SAMP(ads) AS stddev_ads, MIN(ads) AS min_ads, MAX(ads) AS max_ads,
+               AVG(creatives) AS mean_creatives, STDDEV_SAMP(creatives) AS stddev_creatives
+        FROM per_call
+        GROUP BY channel_name
+        ORDER BY stddev_ads DESC NULLS LAST
+        LIMIT ?
+    ''', params + [limit]
+
+
+def _duplicate_rates(where, limit):
+    clause, params = where(('created_at', 'channel_name'))
+    return f'''
+        SELECT channel_name, COUNT(*) AS ads, COUNT(DISTINCT creative_hash) AS distinct_creatives,
+               1 - COUNT(DISTINCT creative_hash) / COUNT(*) AS duplicate_rate,
+               AVG(wrapped_ad) AS wrapped_ratio
+        FROM ads {clause}
+        GROUP BY channel_name
+        ORDER BY ads DESC
+        LIMIT ?
+    ''', params + [limit]
+
+
+def _fill_rates(where, limit):
+    # Calls have a host but no channel; only the date range applies. Calls
+    # host_guard refused are counted apart and left out of the fill rate.
+    clause, params = where(('created_at',))
+    return f'''
+        SELECT host, CAST(date_trunc('day', created_at) AS DATE) AS day, COUNT(*) AS calls,
+               COUNT(*) FILTER (WHERE status IN ('circuit_open', 'rate_limited')) AS rejected,
+               AVG(CASE WHEN status = 'ok' THEN 1 ELSE 0 END) FILTER (WHERE status IN ('ok', 'no_ads')) AS fill_rate,
+               quantile_cont(duration_ms, 0.5) AS p50_ms, quantile_cont(duration_ms, 0.95) AS p95_ms
+        FROM calls {clause}
+        GROUP BY ALL
+        ORDER BY day DESC, calls DESC
+        LIMIT ?
+    ''', params + [limit]
+
+
+def _top_creatives(where, limit):
+    clause, params = where(('created_at', 'channel_name'))
+    return f'''
+        SELECT creative_hash, any_value(creative_id) AS creative_id, any_value(adomain) AS adomain,
+               COUNT(*) AS ads, COUNT(DISTINCT channel_name) AS channels,
+               MIN(created_at) AS first_seen, MAX(created_at) AS last_seen
+        FROM ads {clause}
+        GROUP BY creative_hash
+        ORDER BY ads DESC
+        LIMIT ?
+    ''', params + [limit]
+
+
+REPORTS = {
+    'distinct_creatives_daily': _distinct_creatives_daily,
+    'call_variance': _call_variance,
+    'duplicate_rates': _duplicate_rates,
+    'fill_rates': _fill_rates,
+    'top_creatives': _top_creatives,
+}
+
+
+def run_report(name, created_from=None, created_to=None, channel_name=None, limit=DEFAULT_LIMIT, db_path=DB_PATH):
+    """Returns {'report', 'columns', 'rows', 'duration_ms'}; raises KeyError for unknown reports."""
+    build = REPORTS[name]
+    filters = [
+        ('created_at', 'created_at >= CAST(? AS TIMESTAMP)', created_from),
+        ('created_at', 'created_at < CAST(? AS TIMESTAMP)', created_to),
+        ('channel_name', 'channel_name = ?', channel_name),
+    ]
+
+    def where(columns):
+        applied = [(cond, value) for column, cond, value in filters if value and column in columns]
+        clause = f"WHERE {' AND '.join(cond for cond, _ in applied)}" if applied else ''
+        return clause, [value for _, value in applied]
+
+    sql, sql_params = build(where, int(limit))
+    started = time.perf_counter()
+    if not available():
+        raise AnalyticsUnavailable(DUCKDB_MISSING)
+    import duckdb
+    try:
+        con = connect(db_path)
+        try:
+            cur = con.execute(sql, sql_params)
+            columns = [d[0] for d in cur.description]
+            rows = [[v if isinstance(v, (int, float, str)) or v is None else str(v) for v in row]
+                    for row in cur.fetchall()]
+        finally:
+            con.close()
+    except duckdb.Error as e:
+        # e.g. an unreadable database or archive file
+        raise AnalyticsUnavailable(f"Report {name} failed: {e}")
+    return {'report': name, 'columns': columns, 'rows': rows,
+            'duration_ms': round((time.perf_counter() - started) * 1000.0, 1)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Columnar reports over vast_ads with DuckDB.')
+    ap.add_argument('command', choices=['install', 'snapshot'] + sorted(REPORTS))
+    ap.add_argument('--db', default=DB_PATH)
+    ap.add_argument('--created-from')
+    ap.add_argument('--created-to')
+    ap.add_argument('--channel-name')
+    ap.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    args = ap.parse_args()
+    if args.command == 'install':
+        install_extension()
+        print("✅ DuckDB sqlite extension installed.")
+        return
+    if args.command == 'snapshot':
+        print(f"✅ Snapshot of {refresh_snapshot(args.db)} rows written to {SNAPSHOT_PATH}.")
+        return
+    result = run_report(args.command, args.created_from, args.created_to, args.channel_name, args.limit, args.db)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
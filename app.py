@@ -1,48 +1,279 @@
 import joblib
+import numpy as np
 import pandas as pd
 import xgboost as xgb
 from flask import jsonify
-from flask import Flask, request, render_template_string, send_file, redirect, url_for, jsonify
+from flask import Flask, Response, request, render_template_string, send_file, redirect, url_for, jsonify
 import os
-from parser_1 import parse_vast_and_store
+import hmac
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from parser_1 import parse_vast_and_store, lookup_creative_mapping
+from metrics import render_prometheus
+from profiling import init_profiling
+from jobs import submit_job, submit_task, job_status, list_jobs, queue_stats
+import host_guard
+import sweeps
 
 app = Flask(__name__)
 
 # --- Load model and encoders for inference ---
 MODEL_PATH = 'creative_id_xgb_model.pkl'
 DATA_PATH = 'creative_id_dataset.csv'
-try:
-    clf = joblib.load(MODEL_PATH)
-    print("✅ Model loaded successfully")
-    ref_df = pd.read_csv(DATA_PATH)
-    print("✅ Data CSV loaded successfully")
-    features = ['initial_creative_id', 'wrapper_count', 'adomain', 'ssai_creative_id', 'wrapper_chain']
+features = ['initial_creative_id', 'wrapper_count', 'adomain', 'ssai_creative_id', 'wrapper_chain']
+
+# --- Prediction cache ---
+# Inference traffic repeats the same encoded feature tuples, so predictions
+# are memoised per loaded model. PREDICTION_CACHE_DB optionally points at a
+# SQLite file shared by all workers on the host.
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 4096))
+PREDICTION_CACHE_DB = os.environ.get('PREDICTION_CACHE_DB')
+prediction_cache_stats = {'disk_hits': 0, 'disk_misses': 0, 'invalidations': 0}
+_disk_cache = threading.local()
+
+# --- Native inference path ---
+# Single-row predictions spend most of their time building a DataFrame, so
+# by default the booster is called directly on a reused numpy buffer.
+PREDICT_FAST_PATH = os.environ.get('PREDICT_FAST_PATH', '1') != '0'
+PREDICT_NTHREAD = int(os.environ.get('PREDICT_NTHREAD', 1))
+FAST_PATH_CHECK_ROWS = 200
+
+# --- Hot reload ---
+# The loaded model lives in one bundle dict that is replaced wholesale, so a
+# request always sees a consistent clf/encoders/label_encoder triple. Set
+# MODEL_WATCH_SECONDS=0 to disable polling the artifacts for changes.
+MODEL_WATCH_SECONDS = float(os.environ.get('MODEL_WATCH_SECONDS', 5))
+# The reload/rollback and profile endpoints require an X-Admin-Token header
+# matching ADMIN_TOKEN; without one configured they only answer requests from
+# localhost.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+_model = {'current': None, 'previous': None, 'reloading': False, 'last_error': None, 'watched_signature': None}
+_model_lock = threading.Lock()
+
+def model_signature(model_path=MODEL_PATH, data_path=DATA_PATH):
+    """Identity of the model and dataset files; changes whenever either is replaced."""
+    parts = []
+    for path in (model_path, data_path):
+        try:
+            st = os.stat(path)
+            parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+        except OSError:
+            parts.append('-')
+    return '|'.join(parts)
+
+def _disk_cache_conn():
+    conn = getattr(_disk_cache, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(PREDICTION_CACHE_DB, timeout=5, isolation_level=None)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS prediction_cache (
+                model_signature TEXT NOT NULL,
+                features_key TEXT NOT NULL,
+                label TEXT NOT NULL,
+                PRIMARY KEY (model_signature, features_key)
+            ) WITHOUT ROWID
+        ''')
+        _disk_cache.conn = conn
+    return conn
+
+def _predict_dataframe(clf, row):
+    """Reference path: sklearn-style predict on a one-row DataFrame."""
+    X = pd.DataFrame([list(row)], columns=features)
+    return clf.predict(X)[0]
+
+def _make_native_predictor(clf):
+    """Predict straight from the booster, skipping DataFrame construction.
+
+    Mirrors XGBClassifier.predict: same tree range (best_iteration when early
+    stopping was used), same output-to-class mapping and feature order.
+    """
+    booster = clf.get_booster()
+    booster.set_param({'nthread': PREDICT_NTHREAD})
+    best = getattr(clf, 'best_iteration', None)
+    iteration_range = (0, best + 1) if best is not None else (0, 0)
+    objective = str(clf.get_params().get('objective') or '')
+    classes = getattr(clf, 'classes_', None)
+    order = [features.index(f) for f in booster.feature_names] if booster.feature_names else None
+    buffers = threading.local()
+
+    def predict_native(row):
+        X = getattr(buffers, 'X', None)
+        if X is None:
+            X = buffers.X = np.empty((1, len(features)), dtype=np.float32)
+        X[0, :] = [row[i] for i in order] if order else row
+        out = booster.inplace_predict(X, iteration_range=iteration_range, validate_features=False)
+        out = np.asarray(out)
+        if out.ndim == 2:
+            idx = int(out[0].argmax())
+        elif objective.startswith('binary:'):
+            idx = int(out[0] > 0.5)
+        else:
+            idx = int(out[0])
+        return classes[idx] if classes is not None else idx
+    return predict_native
+
+def _make_predictor(bundle):
+    clf, label_encoder, signature = bundle['clf'], bundle['label_encoder'], bundle['signature']
+    predict_code = bundle['predict_native'] or (lambda row: _predict_dataframe(clf, row))
+
+    @lru_cache(maxsize=PREDICTION_CACHE_SIZE)
+    def predict_encoded(row):
+        if PREDICTION_CACHE_DB:
+            key = ','.join(map(str, row))
+            hit = _disk_cache_conn().execute(
+                "SELECT label FROM prediction_cache WHERE model_signature = ? AND features_key = ?", (signature, key)
+            ).fetchone()
+            if hit:
+                prediction_cache_stats['disk_hits'] += 1
+                return hit[0]
+            prediction_cache_stats['disk_misses'] += 1
+        pred_code = predict_code(row)
+        pred_label = label_encoder[pred_code] if pred_code < len(label_encoder) else 'unknown'
+        if PREDICTION_CACHE_DB:
+            _disk_cache_conn().execute(
+                "INSERT OR REPLACE INTO prediction_cache (model_signature, features_key, label) VALUES (?, ?, ?)",
+                (signature, key, str(pred_label))
+            )
+        return pred_label
+    return predict_encoded
+
+def _sample_rows(bundle, ref_df, n=FAST_PATH_CHECK_ROWS):
+    rows = [tuple(encode_input(r, bundle)) for r in ref_df[features].head(n).to_dict('records')]
+    return rows + [tuple([-1] * len(features))]
+
+def load_model_bundle(model_path=MODEL_PATH, data_path=DATA_PATH):
+    """Load and warm up a model, returning a bundle ready to be swapped in."""
+    signature = model_signature(model_path, data_path)
+    clf = joblib.load(model_path)
+    ref_df = pd.read_csv(data_path)
+    # Predictions are cached on disk under this signature, so it must name the
+    # files actually loaded; if one was replaced mid-load the watcher retries
+    if model_signature(model_path, data_path) != signature:
+        raise RuntimeError('Model files changed while loading')
     encoders = {col: ref_df[col].astype(str).astype('category').cat.categories for col in features}
     label_encoder = ref_df['final_creative_id'].astype(str).astype('category').cat.categories
-except Exception as e:
-    print(f"❌ Error loading model or data: {e}")
-    clf = None
-    encoders = {}
-    label_encoder = []
+    bundle = {
+        'clf': clf,
+        'encoders': encoders,
+        # value -> code, so encoding is a dict lookup instead of a list scan
+        'code_maps': {col: {v: i for i, v in enumerate(cats)} for col, cats in encoders.items()},
+        'label_encoder': label_encoder,
+        'signature': signature,
+        'loaded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'predict_native': None,
+    }
+    if PREDICT_FAST_PATH:
+        # Only keep the fast path if it agrees with clf.predict on real rows
+        try:
+            native = _make_native_predictor(clf)
+            mismatches = [r for r in _sample_rows(bundle, ref_df) if native(r) != _predict_dataframe(clf, r)]
+            if mismatches:
+                print(f"⚠️ Native predict disagrees with clf.predict on {len(mismatches)} rows, using DataFrame path")
+            else:
+                bundle['predict_native'] = native
+        except Exception as e:
+            print(f"⚠️ Native predict unavailable, using DataFrame path: {e}")
+    bundle['predict'] = _make_predictor(bundle)
+    # Warm-up: the first predict call pays xgboost's lazy initialisation
+    bundle['predict'].__wrapped__(tuple(encode_input({}, bundle)))
+    return bundle
 
-def encode_input(input_dict):
+def swap_model(bundle):
+    """Make `bundle` current; returns False (keeping `previous`) if it is the model already loaded."""
+    with _model_lock:
+        current = _model['current']
+        if current is not None and current['signature'] == bundle['signature']:
+            return False
+        _model['previous'] = current
+        _model['current'] = bundle
+        prediction_cache_stats['invalidations'] += 1
+        return True
+
+def rollback_model():
+    with _model_lock:
+        if _model['previous'] is None:
+            return False
+        _model['current'], _model['previous'] = _model['previous'], _model['current']
+        prediction_cache_stats['invalidations'] += 1
+        return True
+
+def _reload_worker():
+    # Remember what we tried, so a broken artifact or a rollback is not
+    # retried until the files change again
+    _model['watched_signature'] = model_signature()
+    try:
+        current = _model['current']
+        if current is not None and current['signature'] == _model['watched_signature']:
+            print("✅ Model files unchanged, nothing to reload")
+        elif swap_model(load_model_bundle()):
+            print("✅ Model reloaded")
+        _model['last_error'] = None
+    except Exception as e:
+        _model['last_error'] = str(e)
+        print(f"❌ Error reloading model, keeping current one: {e}")
+    finally:
+        _model['reloading'] = False
+
+def reload_model_async():
+    """Start a background reload; returns False if one is already running."""
+    with _model_lock:
+        if _model['reloading']:
+            return False
+        _model['reloading'] = True
+    threading.Thread(target=_reload_worker, name='model-reload', daemon=True).start()
+    return True
+
+def _watch_model_files():
+    while True:
+        time.sleep(MODEL_WATCH_SECONDS)
+        if model_signature() != _model['watched_signature'] and not _model['reloading']:
+            reload_model_async()
+
+def model_status():
+    def describe(bundle):
+        return {k: bundle[k] for k in ('signature', 'loaded_at')} if bundle else None
+    return {
+        'current': describe(_model['current']),
+        'previous': describe(_model['previous']),
+        'reloading': _model['reloading'],
+        'last_error': _model['last_error'],
+    }
+
+def encode_input(input_dict, bundle=None):
+    bundle = bundle or _model['current']
+    code_maps = bundle['code_maps'] if bundle else {}
     row = []
     for col in features:
         val = str(input_dict.get(col, ''))
-        if val in encoders.get(col, []):
-            code = list(encoders[col]).index(val)
-        else:
-            code = -1
-        row.append(code)
+        row.append(code_maps.get(col, {}).get(val, -1))
     return row
 
 def predict_creative_id(input_dict):
-    if clf is None:
+    bundle = _model['current']
+    if bundle is None:
         return {'error': 'Model not loaded'}
-    X = pd.DataFrame([encode_input(input_dict)], columns=features)
-    pred_code = clf.predict(X)[0]
-    pred_label = label_encoder[pred_code] if pred_code < len(label_encoder) else 'unknown'
+    pred_label = bundle['predict'](tuple(encode_input(input_dict, bundle)))
     return {'predicted_final_creative_id': pred_label}
+
+def prediction_cache_info():
+    bundle = _model['current']
+    info = bundle['predict'].cache_info() if bundle else None
+    return dict(prediction_cache_stats, hits=info.hits if info else 0, misses=info.misses if info else 0,
+                size=info.currsize if info else 0, maxsize=PREDICTION_CACHE_SIZE,
+                model_signature=bundle['signature'] if bundle else None)
+
+_model['watched_signature'] = model_signature()
+try:
+    _model['current'] = load_model_bundle()
+    print("✅ Model loaded successfully")
+except Exception as e:
+    print(f"❌ Error loading model or data: {e}")
+    _model['last_error'] = str(e)
+if MODEL_WATCH_SECONDS > 0:
+    threading.Thread(target=_watch_model_files, name='model-watch', daemon=True).start()
+
 # --- API endpoint for model inference ---
 @app.route('/predict_creative_id', methods=['POST'])
 def api_predict_creative_id():
@@ -50,6 +281,150 @@ def api_predict_creative_id():
     result = predict_creative_id(data)
     return jsonify(result)
 
+@app.route('/predict_creative_id/cache')
+def api_prediction_cache():
+    return jsonify(prediction_cache_info())
+
+# --- Admin endpoints: hot model reload and request profiles ---
+def _admin_allowed():
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN)
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+init_profiling(app, authorize=_admin_allowed)
+
+@app.route('/admin/model', methods=['GET'])
+def admin_model_status():
+    return jsonify(model_status())
+
+@app.route('/admin/model/reload', methods=['POST'])
+def admin_model_reload():
+    if not _admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    started = reload_model_async()
+    return jsonify(dict(model_status(), started=started)), 202
+
+@app.route('/admin/model/rollback', methods=['POST'])
+def admin_model_rollback():
+    if not _admin_allowed():
+        return jsonify({'error': 'Forbidden'}), 403
+    if not rollback_model():
+        return jsonify({'error': 'No previous model to roll back to'}), 409
+    return jsonify(model_status())
+
+# --- Exact wrapper -> final creative lookup, model only on a miss ---
+@app.route('/resolve_creative_id', methods=['GET', 'POST'])
+def api_resolve_creative_id():
+    data = request.get_json(force=True) if request.method == 'POST' else request.args.to_dict()
+    conn = sqlite3.connect('vast_ads.db')
+    cur = conn.cursor()
+    mappings = []
+    for key, id_kind in [('initial_creative_id', 'creative_id'), ('ssai_creative_id', 'ssai_creative_id')]:
+        if data.get(key):
+            mappings = lookup_creative_mapping(cur, str(data[key]), id_kind)
+            if mappings:
+                break
+    conn.close()
+    if mappings:
+        return jsonify({
+            'source': 'index',
+            'final_creative_id': mappings[0]['final_creative_id'],
+            'final_ssai_creative_id': mappings[0]['final_ssai_creative_id'],
+            'mappings': mappings,
+        })
+    result = predict_creative_id(data)
+    result['source'] = 'model'
+    return jsonify(result)
+
+
+# --- Background ingestion jobs ---
+@app.route('/jobs', methods=['GET', 'POST'])
+def api_jobs():
+    if request.method == 'GET':
+        return jsonify({'jobs': list_jobs(), 'queue': queue_stats()})
+    data = request.get_json(silent=True) or request.form
+    url = (data.get('url') or '').strip()
+    if not url:
+        return jsonify({'error': 'url is required'}), 400
+    try:
+        job_id = submit_job(url, data.get('num_calls', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'num_calls must be an integer'}), 400
+    return jsonify({'job_id': job_id, 'status_url': url_for('api_job_status', job_id=job_id)}), 202
+
+@app.route('/jobs/<job_id>')
+def api_job_status(job_id):
+    status = job_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+# --- Scheduled sweeps (scheduler runs only with SWEEP_SCHEDULER=1) ---
+SWEEP_FIELDS = ['name', 'interval_seconds', 'calls_per_run', 'jitter_seconds', 'runs_remaining', 'enabled']
+
+@app.route('/sweeps', methods=['GET', 'POST'])
+def api_sweeps():
+    conn = sqlite3.connect('vast_ads.db', timeout=30, isolation_level=None)
+    try:
+        if request.method == 'GET':
+            return jsonify({'scheduler': sweeps.SWEEP_SCHEDULER, 'tags': sweeps.list_tags(conn)})
+        data = request.get_json(silent=True) or request.form
+        url = (data.get('url') or '').strip()
+        if not url or not data.get('interval_seconds'):
+            return jsonify({'error': 'url and interval_seconds are required'}), 400
+        try:
+            tag_id = sweeps.add_tag(conn, url, data['interval_seconds'], data.get('calls_per_run', 1),
+                                    data.get('jitter_seconds', 0), data.get('runs_remaining'), data.get('name'))
+        except (TypeError, ValueError):
+            return jsonify({'error': f"{', '.join(SWEEP_FIELDS[1:])} must be integers"}), 400
+        return jsonify({'id': tag_id, 'status_url': url_for('api_sweep', tag_id=tag_id)}), 201
+    finally:
+        conn.close()
+
+@app.route('/sweeps/<int:tag_id>', methods=['GET', 'POST', 'DELETE'])
+def api_sweep(tag_id):
+    conn = sqlite3.connect('vast_ads.db', timeout=30, isolation_level=None)
+    try:
+        if request.method == 'DELETE':
+            if not sweeps.delete_tag(conn, tag_id):
+                return jsonify({'error': 'Sweep not found'}), 404
+            return jsonify({'deleted': tag_id})
+        try:
+            runs = int(request.args.get('runs', 50))
+            if request.method == 'POST':
+                data = request.get_json(silent=True) or request.form
+                sweeps.update_tag(conn, tag_id, **{k: data[k] for k in SWEEP_FIELDS if k in data})
+        except (TypeError, ValueError):
+            return jsonify({'error': f"runs and {', '.join(SWEEP_FIELDS[1:])} must be integers"}), 400
+        tag = sweeps.get_tag(conn, tag_id, runs=runs)
+        if tag is None:
+            return jsonify({'error': 'Sweep not found'}), 404
+        return jsonify(tag)
+    finally:
+        conn.close()
+
+@app.route('/sweeps/<int:tag_id>/run', methods=['POST'])
+def api_sweep_run(tag_id):
+    conn = sqlite3.connect('vast_ads.db', timeout=30, isolation_level=None)
+    try:
+        run_id = sweeps.run_tag_now(conn, tag_id)
+    finally:
+        conn.close()
+    if run_id is None:
+        return jsonify({'error': 'Sweep not found'}), 404
+    return jsonify({'run_id': run_id, 'status_url': url_for('api_sweep', tag_id=tag_id)}), 202
+
+sweeps.start_scheduler()
+
+# Prometheus scrape endpoint for pipeline stage timings
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+# Per-host limiter / circuit breaker state for outbound fetches
+@app.route('/admin/hosts')
+def admin_hosts():
+    return jsonify(host_guard.snapshot())
 
 # Route to download the entire SQLite database file
 @app.route('/export_db')
@@ -119,18 +494,7 @@ def index():
     </div>
     ''', result=result)
 
-@app.route('/multi', methods=['GET', 'POST'])
-def multi():
-    result = None
-    if request.method == 'POST':
-        url = request.form['url']
-        num_calls = int(request.form.get('num_calls', 3))
-        messages = []
-        for i in range(num_calls):
-            msg = parse_vast_and_store(url, call_number=i+1)
-            messages.append(f"Call {i+1}: {msg}")
-        result = "<br>".join(messages)
-    return render_template_string('''
+MULTI_TEMPLATE = '''
     <style>
       body { font-family: 'Segoe UI', Arial, sans-serif; background: #f4f6fa; margin: 0; padding: 0; }
       .container { max-width: 700px; margin: 60px auto; background: #fff; border-radius: 12px; box-shadow: 0 2px 12px #0001; padding: 32px 40px 40px 40px; }
@@ -152,6 +516,7 @@ def multi():
         <input type="text" name="url" size="100"><br>
         <label for="num_calls">Number of times to run:</label>
         <input type="number" name="num_calls" min="1" max="20" value="3"><br><br>
+        <label><input type="checkbox" name="background" value="1"> Run in background (poll progress under /jobs)</label><br><br>
         <input type="submit" value="Parse Multiple">
       </form>
       <div class="nav-links">
@@ -162,44 +527,346 @@ def multi():
         <div class="result-msg"><strong>Result:</strong><br>{{ result|safe }}</div>
       {% endif %}
     </div>
-    ''', result=result)
+'''
+
+@app.route('/multi', methods=['GET', 'POST'])
+def multi():
+    result = None
+    if request.method == 'POST':
+        url = request.form['url']
+        try:
+            num_calls = int(request.form.get('num_calls', 3))
+        except ValueError:
+            return render_template_string(MULTI_TEMPLATE, result='Number of times to run must be an integer.'), 400
+        if request.form.get('background'):
+            job_id = submit_job(url, num_calls)
+            status_url = url_for('api_job_status', job_id=job_id)
+            return render_template_string(MULTI_TEMPLATE, result=f'Queued job <a href="{status_url}">{job_id}</a> ({num_calls} calls).')
+        messages = []
+        for i in range(num_calls):
+            msg = parse_vast_and_store(url, call_number=i+1)
+            messages.append(f"Call {i+1}: {msg}")
+        result = "<br>".join(messages)
+    return render_template_string(MULTI_TEMPLATE, result=result)
 
 
-import sqlite3
 import csv
 import io
 import json
+from datetime import datetime, timedelta
+from partitions import load_rows
+from purge import purge_rows, purge_ids, PURGE_SYNC_MAX_ROWS
+import analytics
+from media_probe import probe_health
+
+FILTER_FIELDS = ['ad_id','creative_id','ssai_creative_id','title','duration','clickthrough','adomain','creative_hash']
+SEARCH_FIELDS = ['ad_id','creative_id','ssai_creative_id','title','duration','clickthrough','media_urls','adomain','creative_hash']
+
+def created_at_range(args):
+    """created_from/created_to query args as a half-open [start, end) range."""
+    bounds = []
+    for key in ('created_from', 'created_to'):
+        v = args.get(key, '').strip()
+        try:
+            datetime.strptime(v[:10], '%Y-%m-%d')
+        except ValueError:
+            v = None
+        bounds.append(v)
+    start, end = bounds
+    if end and len(end) == 10:
+        # A bare date is inclusive of that whole day
+        end = (datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+    return start, end
+
+# The creatives table has every filterable column except the per-call ad_id
+CREATIVE_FILTER_FIELDS = [f for f in FILTER_FIELDS if f != 'ad_id']
+CREATIVE_SEARCH_FIELDS = [f for f in SEARCH_FIELDS if f != 'ad_id']
+
+def build_ads_filter(args, time_column='created_at', filter_fields=FILTER_FIELDS, search_fields=SEARCH_FIELDS):
+    """WHERE clause and params for the /results filter args."""
+    where = []
+    params = []
+    for f in filter_fields:
+        v = args.get(f, '').strip()
+        if v:
+            where.append(f"{f} LIKE ?")
+            params.append(f"%{v}%")
+    global_search = args.get('q', '').strip()
+    if global_search:
+        where.append('(' + ' OR '.join([f"{f} LIKE ?" for f in search_fields]) + ')')
+        params.extend([f"%{global_search}%"]*len(search_fields))
+    # Range on the created_at index; also what archived partitions are pruned by
+    start, end = created_at_range(args)
+    if start:
+        where.append(f"{time_column} >= ?")
+        params.append(start)
+    if end:
+        where.append(f"{time_column} < ?")
+        params.append(end)
+    where_clause = f"WHERE {' AND '.join(where)}" if where else ''
+    return where_clause, params
+
+CREATIVES_TEMPLATE = '''
+    <style>
+      body {
+        font-family: 'Inter', 'Segoe UI', Arial, sans-serif;
+        background: linear-gradient(120deg, #f4f6fa 0%, #e8eefa 100%);
+        margin: 0; padding: 0; color: #222;
+      }
+      .container {
+        max-width: 1200px; margin: 40px auto; background: #fff; border-radius: 18px;
+        box-shadow: 0 4px 32px #0002; padding: 36px 48px 48px 48px;
+      }
+      h2 {
+        margin-top: 0; font-size: 2.3em; letter-spacing: 1px; color: #2a3b4c;
+        background: linear-gradient(90deg, #2a7be4 10%, #4caf50 90%);
+        -webkit-background-clip: text;
+        -webkit-text-fill-color: transparent;
+      }
+      .nav-links { margin-bottom: 18px; }
+      .nav-links a {
+        display: inline-block; margin-right: 18px; padding: 7px 18px;
+        border-radius: 8px; background: #e8eefa; color: #2a3b4c;
+        text-decoration: none; font-weight: 500; transition: background 0.2s, color 0.2s;
+        box-shadow: 0 1px 4px #0001;
+      }
+      .nav-links a:hover { background: #2a3b4c; color: #fff; }
+      .filter-form { margin-bottom: 18px; display: flex; flex-wrap: wrap; gap: 10px; align-items: center; }
+      .filter-form input[type="text"] { padding: 7px; border-radius: 6px; border: 1px solid #d0d6e2; font-size: 1em; }
+      .filter-form input[type="submit"] {
+        background: linear-gradient(90deg, #2a7be4, #4caf50);
+        color: #fff; border: none; border-radius: 8px; padding: 7px 18px;
+        font-size: 1em; font-weight: 500; cursor: pointer; box-shadow: 0 1px 4px #0001;
+      }
+      .results-table { border-collapse: separate; border-spacing: 0 8px; width: 100%; margin-top: 18px; }
+      .results-table th {
+        background: #e8eefa; color: #2a3b4c; font-weight: 600; padding: 10px 14px; text-align: left;
+        position: sticky; top: 0; border-right: 2px solid #e3e8f0;
+      }
+      .results-table th a { color: #2a3b4c; text-decoration: none; }
+      .results-table tr { background: #fff; box-shadow: 0 2px 12px #0001; }
+      .results-table tr:hover { background: #f0f6ff; }
+      .results-table td { border-right: 2px solid #e3e8f0; padding: 12px 14px; font-size: 1.05em; }
+      .results-table th:last-child, .results-table td:last-child { border-right: none; }
+      .pager { margin: 18px 0; }
+      .pager span { margin: 0 12px; }
+    </style>
+    <div class="container">
+      <div class="nav-links">
+        <a href="{{ rows_url }}">All Rows</a>
+        <a href="/">Parse One</a>
+        <a href="/multi">Parse Multiple</a>
+      </div>
+      <h2>Unique Creatives</h2>
+      <form method="get" class="filter-form">
+        <input type="hidden" name="view" value="creatives">
+        <input type="text" name="q" value="{{ request.args.get('q','') }}" placeholder="Any field">
+        <input type="text" name="adomain" value="{{ request.args.get('adomain','') }}" placeholder="Adomain">
+        <input type="text" name="created_from" value="{{ request.args.get('created_from','') }}" placeholder="Last seen from YYYY-MM-DD">
+        <input type="text" name="created_to" value="{{ request.args.get('created_to','') }}" placeholder="Last seen to YYYY-MM-DD">
+        <input type="submit" value="Filter">
+      </form>
+      <p>{{ total_rows }} distinct creatives</p>
+      <table class="results-table">
+        <thead>
+          <tr>{% for col in columns %}<th><a href="{{ sort_urls[col] }}">{{ col|replace('_', ' ')|title }}</a></th>{% endfor %}</tr>
+        </thead>
+        <tbody>
+        {% for r in rows %}
+          <tr>
+            {% for col in columns %}
+              {% if col == 'creative_hash' %}
+                <td><a href="{{ url_for('results', creative_hash=r[loop.index0]) }}">{{ r[loop.index0][:12] }}</a></td>
+              {% else %}
+                <td>{{ r[loop.index0] if r[loop.index0] is not none else '' }}</td>
+              {% endif %}
+            {% endfor %}
+          </tr>
+        {% endfor %}
+        </tbody>
+      </table>
+      <div class="pager">
+        {% if prev_url %}<a href="{{ prev_url }}">&larr; Prev</a>{% endif %}
+        <span>Page {{ page }}</span>
+        {% if next_url %}<a href="{{ next_url }}">Next &rarr;</a>{% endif %}
+      </div>
+    </div>
+'''
+
+def creatives_view():
+    """/results?view=creatives: one row per creative_hash with its occurrence count."""
+    from urllib.parse import urlencode
+    columns = ['creative_hash', 'creative_id', 'ssai_creative_id', 'title', 'duration', 'clickthrough', 'adomain',
+               'occurrence_count', 'first_seen', 'last_seen']
+    sort = request.args.get('sort', 'occurrence_count')
+    if sort not in columns:
+        sort = 'occurrence_count'
+    order = 'asc' if request.args.get('order') == 'asc' else 'desc'
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        return 'Page must be an integer.', 400
+    per_page = 50
+    # Same filter args as the row view; the date range applies to last_seen
+    where_clause, params = build_ads_filter(request.args, time_column='last_seen',
+                                            filter_fields=CREATIVE_FILTER_FIELDS,
+                                            search_fields=CREATIVE_SEARCH_FIELDS)
+    conn = sqlite3.connect('vast_ads.db')
+    cur = conn.cursor()
+    cur.execute(f"SELECT COUNT(*) FROM creatives {where_clause}", params)
+    total_rows = cur.fetchone()[0]
+    cur.execute(f"""
+        SELECT {', '.join(columns)} FROM creatives {where_clause}
+        ORDER BY {sort} {order.upper()} LIMIT {per_page} OFFSET {(page - 1) * per_page}
+    """, params)
+    rows = cur.fetchall()
+    conn.close()
+
+    def build_url(**kwargs):
+        merged = dict(request.args, view='creatives')
+        merged.update(kwargs)
+        return url_for('results') + '?' + urlencode(merged)
+
+    sort_urls = {col: build_url(sort=col, order='asc' if sort == col and order == 'desc' else 'desc', page=1)
+                 for col in columns}
+    rows_args = {k: v for k, v in request.args.items() if k not in ('view', 'sort', 'order', 'page')}
+    return render_template_string(
+        CREATIVES_TEMPLATE, rows=rows, columns=columns, total_rows=total_rows, page=page, sort_urls=sort_urls,
+        prev_url=build_url(page=page - 1) if page > 1 else None,
+        next_url=build_url(page=page + 1) if page * per_page < total_rows else None,
+        rows_url=url_for('results') + ('?' + urlencode(rows_args) if rows_args else ''),
+    )
+
+ROLLUP_GROUPS = ['hour', 'day', 'channel_name', 'adomain']
+
+# Answers "ads per channel per hour" / "top advertisers by channel" from the
+# trigger-maintained rollup tables instead of scanning vast_ads.
+@app.route('/rollups')
+def rollups():
+    group_by = [g for g in request.args.get('group_by', 'channel_name,adomain').split(',') if g in ROLLUP_GROUPS]
+    if not group_by:
+        return jsonify({'error': f"group_by must be a comma-separated subset of {ROLLUP_GROUPS}"}), 400
+    try:
+        limit = min(int(request.args.get('limit', 100)), 10000)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    where = []
+    params = []
+    start, end = created_at_range(request.args)
+    if start:
+        where.append("hour >= ?")
+        params.append(start)
+    if end:
+        where.append("hour < ?")
+        params.append(end)
+    for f in ('channel_name', 'adomain'):
+        v = request.args.get(f, '').strip()
+        if v:
+            where.append(f"{f} = ?")
+            params.append(v)
+    where_clause = f"WHERE {' AND '.join(where)}" if where else ''
+    keys = ', '.join("substr(hour, 1, 10)" if g == 'day' else g for g in group_by)
+
+    conn = sqlite3.connect('vast_ads.db')
+    totals = conn.execute(f"""
+        SELECT {keys}, SUM(ad_count), SUM(wrapped_count)
+        FROM ad_rollups_hourly {where_clause}
+        GROUP BY {keys} ORDER BY SUM(ad_count) DESC LIMIT ?
+    """, params + [limit]).fetchall()
+    distinct = {}
+    if totals:
+        for row in conn.execute(f"""
+            SELECT {keys}, COUNT(DISTINCT creative_hash) FROM ad_rollup_creatives {where_clause} GROUP BY {keys}
+        """, params):
+            distinct[row[:-1]] = row[-1]
+    conn.close()
+
+    out = []
+    for row in totals:
+        key = row[:len(group_by)]
+        ad_count, wrapped_count = row[len(group_by):]
+        entry = dict(zip(group_by, key))
+        entry.update({
+            'ad_count': ad_count,
+            'wrapped_count': wrapped_count,
+            'wrapped_ratio': round(wrapped_count / ad_count, 4) if ad_count else None,
+            'distinct_creatives': distinct.get(tuple(key), 0),
+        })
+        out.append(entry)
+    return jsonify({'group_by': group_by, 'created_from': start, 'created_to': end, 'rows': out})
+
+# Columnar reports (optional DuckDB); see analytics.py
+@app.route('/analytics')
+def analytics_index():
+    return jsonify({'available': analytics.available(), 'source': analytics.ANALYTICS_SOURCE,
+                    'reports': sorted(analytics.REPORTS)})
+
+@app.route('/analytics/<report>')
+def analytics_report(report):
+    if report not in analytics.REPORTS:
+        return jsonify({'error': f"Unknown report; choose from {sorted(analytics.REPORTS)}"}), 404
+    start, end = created_at_range(request.args)
+    try:
+        limit = min(int(request.args.get('limit', analytics.DEFAULT_LIMIT)), 10000)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    try:
+        result = analytics.run_report(report, start, end, request.args.get('channel_name', '').strip() or None, limit)
+    except analytics.AnalyticsUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    return jsonify(dict(result, created_from=start, created_to=end))
+
+def purge_in_background(where_clause, params):
+    conn = sqlite3.connect('vast_ads.db', timeout=30, isolation_level=None, check_same_thread=False)
+    try:
+        return f"Purged {purge_rows(conn, where_clause, params)} rows."
+    finally:
+        conn.close()
 
 @app.route('/results', methods=['GET', 'POST'])
 def results():
+    if request.args.get('view') == 'creatives' and request.method == 'GET':
+        return creatives_view()
     # Advanced filtering/search
     sort = request.args.get('sort', 'id')
     order = request.args.get('order', 'desc')
-    page = int(request.args.get('page', 1))
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+    except ValueError:
+        return 'Page must be an integer.', 400
     per_page = 50
     offset = (page - 1) * per_page
-    # Multi-field filters
-    filters = {}
-    for f in ['ad_id','creative_id','ssai_creative_id','title','duration','clickthrough','adomain','creative_hash']:
-        v = request.args.get(f, '').strip()
-        if v:
-            filters[f] = v
-    global_search = request.args.get('q', '').strip()
     allowed_sorts = ['id', 'call_number', 'ad_id', 'creative_id', 'ssai_creative_id', 'title', 'duration', 'clickthrough', 'media_urls', 'adomain', 'creative_hash', 'created_at', 'wrapped_ad']
     if sort not in allowed_sorts:
         sort = 'id'
     if order not in ['asc', 'desc']:
         order = 'desc'
-    where = []
-    params = []
-    for k, v in filters.items():
-        where.append(f"{k} LIKE ?")
-        params.append(f"%{v}%")
-    if global_search:
-        search_fields = ['ad_id','creative_id','ssai_creative_id','title','duration','clickthrough','media_urls','adomain','creative_hash']
-        where.append('(' + ' OR '.join([f"{f} LIKE ?" for f in search_fields]) + ')')
-        params.extend([f"%{global_search}%"]*len(search_fields))
-    where_clause = f"WHERE {' AND '.join(where)}" if where else ''
+    # Multi-field filters
+    where_clause, params = build_ads_filter(request.args)
+
+    # Bulk delete: checked rows, or every row matching the current filters.
+    # Both go through purge_rows' short batches so ingestion is not blocked;
+    # filter purges over PURGE_SYNC_MAX_ROWS run as a background job.
+    if request.method == 'POST' and request.form.get('action') in ('delete', 'purge'):
+        try:
+            ids_to_delete = [int(i) for i in request.form.getlist('delete_id')]
+        except ValueError:
+            return 'Row ids must be integers.', 400
+        conn = sqlite3.connect('vast_ads.db', timeout=30, isolation_level=None)
+        try:
+            if request.form['action'] == 'delete':
+                if ids_to_delete:
+                    purge_ids(conn, ids_to_delete)
+            elif where_clause:
+                matching = conn.execute(f"SELECT COUNT(*) FROM vast_ads {where_clause}", params).fetchone()[0]
+                if matching > PURGE_SYNC_MAX_ROWS:
+                    job_id = submit_task('purge', purge_in_background, where_clause, params)
+                    return redirect(url_for('results', purge_job=job_id))
+                purge_rows(conn, where_clause, params)
+        finally:
+            conn.close()
+        return redirect(request.full_path if request.form['action'] == 'delete' else url_for('results'))
+
     conn = sqlite3.connect('vast_ads.db')
     cur = conn.cursor()
     cur.execute(f"SELECT COUNT(*) FROM vast_ads {where_clause}", params)
@@ -223,6 +890,10 @@ def results():
             r_media_urls = []
         r.append(r_media_urls)  # Add as last element
         parsed_rows.append(r)
+    # Media health comes from the probe cache only; no network calls here
+    conn = sqlite3.connect('vast_ads.db')
+    media_health = probe_health(conn, [u for r in parsed_rows for u in r[-1]])
+    conn.close()
     # For ad comparison (select up to 2)
     compare_ids = request.args.getlist('compare')
     compare_ads = []
@@ -264,24 +935,13 @@ def results():
     # For easy lookup in table
     dup_lookup = {f['field']: f['dupset'] for f in uniqueness}
 
-    # Bulk delete
-    if request.method == 'POST' and request.form.get('action') == 'delete':
-        ids_to_delete = request.form.getlist('delete_id')
-        if ids_to_delete:
-            conn = sqlite3.connect('vast_ads.db')
-            cur = conn.cursor()
-            qmarks = ','.join(['?']*len(ids_to_delete))
-            cur.execute(f"DELETE FROM vast_ads WHERE id IN ({qmarks})", ids_to_delete)
-            conn.commit()
-            conn.close()
-            return redirect(url_for('results'))
-
     # Precompute export CSV URL (Jinja2 does not support **request.args)
     from urllib.parse import urlencode
     args_dict = request.args.to_dict(flat=False)
     export_csv_url = url_for('export_csv')
     if request.args:
         export_csv_url += '?' + urlencode(request.args, doseq=True)
+    export_archive_csv_url = url_for('export_csv') + '?' + urlencode(dict(request.args, include_archive='1'), doseq=True)
 
     # Precompute prev/next/sort URLs for pagination and sorting
     def build_url(**kwargs):
@@ -401,6 +1061,8 @@ def results():
       .badge-wrapped { background: #2a7be4; }
       .badge-inline { background: #4caf50; }
       .badge-dup { background: #e53935; }
+      .badge-media-ok { background: #4caf50; }
+      .badge-media-bad { background: #e53935; }
       .dup { background-color: #ffe0e0; }
       .filter-form { margin-bottom: 18px; display: flex; flex-wrap: wrap; gap: 10px; align-items: center; }
       .filter-form label { font-size: 0.95em; color: #2a3b4c; margin-right: 4px; }
@@ -562,6 +1224,7 @@ def results():
         <div style="display:flex;align-items:center;gap:12px;">
           <a href="/" class="nav-btn">Parse One</a>
           <a href="/multi" class="nav-btn">Parse Multiple</a>
+          <a href="{{ url_for('results', view='creatives') }}" class="nav-btn">Unique Creatives</a>
         </div>
         <div class="theme-switcher" style="display:flex;align-items:center;gap:6px;">
           <label for="theme-select" style="font-size:1em;font-weight:500;">Theme:</label>
@@ -573,6 +1236,9 @@ def results():
         </div>
       </div>
       <h2 style="margin-bottom:18px;">Parsed Ads</h2>
+      {% if purge_job %}
+        <p>Purge running in the background: <a href="{{ url_for('api_job_status', job_id=purge_job) }}">job {{ purge_job }}</a>.</p>
+      {% endif %}
       <form method="get" class="filter-form" style="margin-bottom:0;">
         <details style="margin-bottom:16px;">
           <summary style="font-weight:500;cursor:pointer;">Customize Columns</summary>
@@ -607,10 +1273,19 @@ def results():
               <input type="text" name="{{f}}" value="{{ request.args.get(f,'') }}" style="width:100%;">
             </div>
           {% endfor %}
+          <div>
+            <label style="font-weight:500;">Created From:</label>
+            <input type="text" name="created_from" value="{{ request.args.get('created_from','') }}" placeholder="YYYY-MM-DD" style="width:100%;">
+          </div>
+          <div>
+            <label style="font-weight:500;">Created To:</label>
+            <input type="text" name="created_to" value="{{ request.args.get('created_to','') }}" placeholder="YYYY-MM-DD" style="width:100%;">
+          </div>
         </div>
         <div class="action-bar" style="display:flex;gap:12px;align-items:center;margin-bottom:0;">
           <button type="submit" class="action-btn filter-btn">Filter</button>
           <a href="{{ export_csv_url }}" class="action-btn export-btn">Export CSV</a>
+          <a href="{{ export_archive_csv_url }}" class="action-btn export-btn" title="Includes archived partitions in the Created From/To range">Export CSV + Archive</a>
           <a href="{{ export_db_url }}" class="action-btn export-btn">Export Full DB</a>
           <button type="button" onclick="compareAds()" class="action-btn compare-btn">Compare Selected</button>
           <span style="color:#888;font-size:0.98em;">(Select 2 ads to compare side-by-side)</span>
@@ -655,6 +1330,11 @@ def results():
                 {% set urls = r[-1] %}
                 {% if urls %}
                   {% for url in urls %}
+                    {% set probe = media_health.get(url) %}
+                    {% if probe %}
+                      <span class="badge badge-media-{{ 'ok' if probe.status == 'ok' else 'bad' }}"
+                            title="HTTP {{ probe.http_status }} {{ probe.content_type or '' }} {{ probe.size or '?' }} bytes, {{ probe.latency_ms }} ms, probed {{ probe.probed_at }}">{{ probe.status|replace('_', ' ') }}</span>
+                    {% endif %}
                     <a href="{{ url }}" target="_blank">{{ url }}</a><br>
                   {% endfor %}
                 {% endif %}
@@ -682,6 +1362,12 @@ def results():
       </table>
       <input class="delete-btn" type="submit" value="Delete Selected" onclick="return confirm('Delete selected ads?')">
       </form>
+      {% if has_filter %}
+      <form method="post">
+        <input type="hidden" name="action" value="purge">
+        <input class="delete-btn" type="submit" value="Delete All {{ total_rows }} Matching" onclick="return confirm('Delete all {{ total_rows }} ads matching the current filters?')">
+      </form>
+      {% endif %}
       <div style="margin:18px 0;">
         {% if prev_url %}<a href="{{ prev_url }}">&larr; Prev</a>{% endif %}
         <span style="margin:0 12px;">Page {{ page }} of {{ (total_rows // per_page) + (1 if total_rows % per_page else 0) }}</span>
@@ -707,7 +1393,7 @@ def results():
         </div>
       {% endif %}
     </div>
-    ''', parsed_rows=parsed_rows, columns=columns, uniqueness=uniqueness, page=page, per_page=per_page, total_rows=total_rows, compare_ads=compare_ads if 'compare_ads' in locals() else [], compare_cols=compare_cols if 'compare_ads' in locals() else [], compare_table=compare_table if 'compare_ads' in locals() else [], export_csv_url=export_csv_url, export_db_url=export_db_url, prev_url=prev_url, next_url=next_url, sort_urls=sort_urls, all_columns=all_columns, selected_columns=selected_columns)
+    ''', parsed_rows=parsed_rows, columns=columns, uniqueness=uniqueness, page=page, per_page=per_page, total_rows=total_rows, compare_ads=compare_ads if 'compare_ads' in locals() else [], compare_cols=compare_cols if 'compare_ads' in locals() else [], compare_table=compare_table if 'compare_ads' in locals() else [], export_csv_url=export_csv_url, export_archive_csv_url=export_archive_csv_url, export_db_url=export_db_url, has_filter=bool(where_clause), purge_job=request.args.get('purge_job'), media_health=media_health, prev_url=prev_url, next_url=next_url, sort_urls=sort_urls, all_columns=all_columns, selected_columns=selected_columns)
 
 # Export CSV endpoint
 @app.route('/export_csv')
@@ -720,35 +1406,39 @@ def export_csv():
         sort = 'id'
     if order not in ['asc', 'desc']:
         order = 'desc'
-    # Check for any filter params
-    filter_fields = ['ad_id','creative_id','ssai_creative_id','title','duration','clickthrough','adomain','creative_hash']
-    filters = {f: request.args.get(f, '').strip() for f in filter_fields}
-    filters = {k: v for k, v in filters.items() if v}
-    global_search = request.args.get('q', '').strip()
-    where = []
-    params = []
-    if filters:
-        for k, v in filters.items():
-            where.append(f"{k} LIKE ?")
-            params.append(f"%{v}%")
-    if global_search:
-        search_fields = ['ad_id','creative_id','ssai_creative_id','title','duration','clickthrough','media_urls','adomain','creative_hash']
-        where.append('(' + ' OR '.join([f"{f} LIKE ?" for f in search_fields]) + ')')
-        params.extend([f"%{global_search}%"]*len(search_fields))
-    where_clause = f"WHERE {' AND '.join(where)}" if where else ''
+    where_clause, params = build_ads_filter(request.args)
+    csv_columns = ['call_number','ad_id','creative_id','ssai_creative_id','title','duration','clickthrough','media_urls','adomain','creative_hash','created_at']
     conn = sqlite3.connect('vast_ads.db')
     cur = conn.cursor()
-    cur.execute(f'''
-        SELECT call_number, ad_id, creative_id, ssai_creative_id, title, duration, clickthrough, media_urls, adomain, creative_hash, created_at
-        FROM vast_ads
-        {where_clause}
-        ORDER BY {sort} {order.upper()}
-    ''', params)
+    if request.args.get('include_archive') == '1':
+        # Only the archived partitions overlapping the created_at range are
+        # loaded, into a temp table; the hot rows stay in SQLite and both
+        # sides get the same filter SQL.
+        start, end = created_at_range(request.args)
+        df = load_rows(conn, start, end, columns=['id'] + csv_columns, include_hot=False)
+        cur.execute(f"CREATE TEMP TABLE archived_ads ({', '.join(df.columns)})")
+        cur.executemany(f"INSERT INTO archived_ads VALUES ({', '.join('?' * len(df.columns))})",
+                        df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+        cur.execute(f'''
+            SELECT {', '.join(csv_columns)} FROM (
+                SELECT id, {', '.join(csv_columns)} FROM main.vast_ads {where_clause}
+                UNION ALL
+                SELECT id, {', '.join(csv_columns)} FROM temp.archived_ads {where_clause}
+            )
+            ORDER BY {sort} {order.upper()}
+        ''', params * 2)
+    else:
+        cur.execute(f'''
+            SELECT {', '.join(csv_columns)}
+            FROM vast_ads
+            {where_clause}
+            ORDER BY {sort} {order.upper()}
+        ''', params)
     rows = cur.fetchall()
     conn.close()
     output = io.StringIO()
     writer = csv.writer(output)
-    writer.writerow(['call_number','ad_id','creative_id','ssai_creative_id','title','duration','clickthrough','media_urls','adomain','creative_hash','created_at'])
+    writer.writerow(csv_columns)
     for row in rows:
         # media_urls is JSON, flatten for CSV
         row = list(row)
@@ -772,6 +1462,9 @@ def ad_details(ad_id):
     if not row:
         return "Ad not found", 404
     media_urls = json.loads(row[7]) if row[7] else []
+    conn = sqlite3.connect('vast_ads.db')
+    media_health = probe_health(conn, media_urls)
+    conn.close()
     # Build ad dict for JSON view
     ad_dict = {col: row[i] for i, col in enumerate(columns[:-2])}
     ad_dict['media_urls'] = media_urls
@@ -782,6 +1475,15 @@ def ad_details(ad_id):
     show_initial = request.args.get('show_initial') == '1'
 
     ad_xml = row[12] if show_xml else None
+    shared_xml_since = None
+    if show_xml and ad_xml is None and row[10]:
+        # With DEDUP_AD_XML=1 only the first occurrence's XML is kept, on the
+        # creative; this ad's tracking URLs may differ, so it is labelled
+        conn = sqlite3.connect('vast_ads.db')
+        found = conn.execute("SELECT ad_xml, first_seen FROM creatives WHERE creative_hash = ?", (row[10],)).fetchone()
+        conn.close()
+        if found and found[0]:
+            ad_xml, shared_xml_since = found
     xml_error = None
     initial_metadata_json = row[-1]
     initial_metadata_pretty = None
@@ -845,6 +1547,8 @@ def ad_details(ad_id):
       tr:last-child td { border-bottom: none; }
       .wrapped { color: #2a7be4; font-weight: bold; }
       .inline { color: #4caf50; font-weight: bold; }
+      .media-bad { color: #e53935; font-weight: bold; }
+      .media-unprobed { color: #888; }
       .back-link { display: inline-block; margin-top: 24px; color: #2a7be4; text-decoration: none; font-weight: 500; }
       .back-link:hover { text-decoration: underline; }
     </style>
@@ -866,6 +1570,10 @@ def ad_details(ad_id):
       {% if show_xml %}
         <div class="section">
           <h4>Raw XML</h4>
+          {% if shared_xml_since %}
+            <p style="color:#6b7a8c;">Representative XML for creative {{ row[10] }}, as first seen {{ shared_xml_since }}.
+              This ad's own XML was not kept; its tracking URLs and ids may differ.</p>
+          {% endif %}
           {% if ad_xml %}
             <pre>{{ ad_xml }}</pre>
           {% elif xml_error %}
@@ -890,7 +1598,17 @@ def ad_details(ad_id):
               <td>
                 {% if col == 'media_urls' %}
                   {% for url in media_urls %}
-                    <a href="{{ url }}" target="_blank">{{ url }}</a><br>
+                    <a href="{{ url }}" target="_blank">{{ url }}</a>
+                    {% set probe = media_health.get(url) %}
+                    {% if probe %}
+                      <span class="{{ 'inline' if probe.status == 'ok' else 'media-bad' }}">{{ probe.status|replace('_', ' ') }}</span>
+                      (HTTP {{ probe.http_status or '-' }}, {{ probe.content_type or 'unknown type' }},
+                      {{ probe.size if probe.size is not none else '?' }} bytes, {{ probe.latency_ms }} ms,
+                      probed {{ probe.probed_at }}{% if probe.error %}: {{ probe.error }}{% endif %})
+                    {% else %}
+                      <span class="media-unprobed">not probed</span>
+                    {% endif %}
+                    <br>
                   {% endfor %}
                 {% else %}
                   {{ row[columns.index(col)] }}
@@ -906,7 +1624,7 @@ def ad_details(ad_id):
       </div>
       <a class="back-link" href="{{ url_for('results') }}">&larr; Back to Results</a>
     </div>
-    ''', row=row, columns=columns, media_urls=media_urls, raw_json=raw_json, show_json=show_json, ad_xml=ad_xml, show_xml=show_xml, xml_error=xml_error, show_initial=show_initial, initial_metadata_pretty=initial_metadata_pretty)
+    ''', row=row, columns=columns, media_urls=media_urls, raw_json=raw_json, show_json=show_json, ad_xml=ad_xml, shared_xml_since=shared_xml_since, show_xml=show_xml, xml_error=xml_error, show_initial=show_initial, initial_metadata_pretty=initial_metadata_pretty, media_health=media_health)
 
 if __name__ == '__main__':
     app.run(debug=True)
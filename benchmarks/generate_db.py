@@ -0,0 +1,183 @@
+"""Populate vast_ads with realistic synthetic rows, fast.
+
+    python benchmarks/generate_db.py --db /tmp/big.db --rows 5000000 --days 365
+
+Creatives, ad ids and advertisers are drawn from Zipf-like distributions,
+so a few creative_hash values repeat thousands of times and there is a
+long tail, like real sweeps. The load runs with journaling and fsync off
+and with the vast_ads indexes and rollup triggers dropped. Both are
+restored at the end, and the derived tables are rebuilt.
+Do not point this at a database you care about while other processes write
+to it.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import itertools
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import (migrate, rebuild_derived_tables, drop_rollup_triggers, create_rollup_triggers,
+                        make_creative_hash)
+
+INSERT_COLUMNS = [
+    'call_number', 'ad_id', 'creative_id', 'ssai_creative_id', 'title', 'duration', 'clickthrough',
+    'media_urls', 'channel_name', 'adomain', 'creative_hash', 'created_at', 'ad_xml', 'wrapped_ad',
+    'initial_metadata_json', 'wrapper_chain', 'wrapper_count',
+]
+
+
+def zipf_cum_weights(n, s):
+    total = 0.0
+    cum = []
+    for k in range(1, n + 1):
+        total += 1.0 / (k ** s)
+        cum.append(total)
+    return cum
+
+
+def build_creatives(rnd, args):
+    advertisers = [f"advertiser{i}.example" for i in range(args.advertisers)]
+    adv_weights = zipf_cum_weights(len(advertisers), args.skew)
+    padding = 'x' * (args.xml_kb * 1024)
+    creatives = []
+    for i in range(args.creatives):
+        creative_id = f"cr-{i}"
+        ssai = f"ssai-{i}" if rnd.random() < 0.8 else None
+        adomain = rnd.choices(advertisers, cum_weights=adv_weights)[0]
+        media_urls = [f"https://cdn.example/{creative_id}/{q}.mp4" for q in ('1080', '720', '360')]
+        duration = rnd.choice(['00:00:15', '00:00:30', '00:00:30', '00:01:00'])
+        clickthrough = f"https://{adomain}/landing?c={creative_id}"
+        ad_xml = (f'<Ad id="ad-{i}"><InLine><AdTitle>Creative {i}</AdTitle><Creatives><Creative id="{creative_id}">'
+                  f'<Linear><Duration>{duration}</Duration><MediaFiles>'
+                  + ''.join(f'<MediaFile>{u}</MediaFile>' for u in media_urls)
+                  + f'</MediaFiles></Linear></Creative></Creatives>'
+                  f'<Extensions><Extension type="padding">{padding}</Extension></Extensions></InLine></Ad>')
+        creatives.append({
+            'creative_id': creative_id,
+            'ssai_creative_id': ssai,
+            'title': f"Creative {i}",
+            'duration': duration,
+            'clickthrough': clickthrough,
+            'media_urls': json.dumps(media_urls),
+            'adomain': adomain,
+            'creative_hash': make_creative_hash(ssai, creative_id, ','.join(media_urls), adomain),
+            'ad_xml': ad_xml,
+        })
+    return creatives
+
+
+def generate_rows(rnd, args, creatives):
+    creative_weights = zipf_cum_weights(len(creatives), args.skew)
+    channels = [f"channel{i}" for i in range(args.channels)]
+    end = datetime.utcnow()
+    span_seconds = args.days * 86400
+    step = span_seconds / max(args.rows, 1)
+    start = end - timedelta(seconds=span_seconds)
+    for n in range(args.rows):
+        c = rnd.choices(creatives, cum_weights=creative_weights)[0]
+        wrapped = rnd.random() < args.wrapped_ratio
+        meta = json.dumps({'creative_id': f"w{c['creative_id']}", 'ssai_creative_id': None}) if wrapped else '{}'
+        chain = [f"wrapper{rnd.randrange(20)}.example" for _ in range(rnd.randint(1, 3))] if wrapped else []
+        created_at = (start + timedelta(seconds=n * step + rnd.random() * step)).strftime('%Y-%m-%d %H:%M:%S')
+        yield (
+            rnd.randint(1, 5),
+            f"ad-{rnd.randrange(args.ad_ids)}",
+            c['creative_id'],
+            c['ssai_creative_id'],
+            c['title'],
+            c['duration'],
+            c['clickthrough'],
+            c['media_urls'],
+            rnd.choice(channels),
+            c['adomain'],
+            c['creative_hash'],
+            created_at,
+            c['ad_xml'] if args.row_ad_xml else None,
+            int(wrapped),
+            meta,
+            ' > '.join(chain),
+            len(chain),
+        )
+
+
+def build_parser():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--db', default='vast_ads.db')
+    ap.add_argument('--rows', type=int, default=1000000)
+    ap.add_argument('--creatives', type=int, default=20000, help='distinct creative_hash values')
+    ap.add_argument('--ad-ids', type=int, default=50000, help='distinct ad_id values')
+    ap.add_argument('--advertisers', type=int, default=2000)
+    ap.add_argument('--channels', type=int, default=200)
+    ap.add_argument('--skew', type=float, default=1.1, help='Zipf exponent for duplicate distribution')
+    ap.add_argument('--xml-kb', type=int, default=2, help='approximate ad_xml padding per row')
+    ap.add_argument('--days', type=int, default=90, help='created_at spread, ending now')
+    ap.add_argument('--wrapped-ratio', type=float, default=0.6)
+    ap.add_argument('--row-ad-xml', action='store_true',
+                    help='also store ad_xml on every vast_ads row, like ingestion with DEDUP_AD_XML=0')
+    ap.add_argument('--batch', type=int, default=50000)
+    ap.add_argument('--seed', type=int, default=0)
+    return ap
+
+
+def generate(args):
+    rnd = random.Random(args.seed)
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    migrate(conn)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-262144")
+
+    indexes = [r for r in conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'vast_ads' AND sql IS NOT NULL"
+    )]
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    drop_rollup_triggers(conn)
+
+    started = time.time()
+    creatives = build_creatives(rnd, args)
+    rows = generate_rows(rnd, args, creatives)
+    sql = f"INSERT INTO vast_ads ({', '.join(INSERT_COLUMNS)}) VALUES ({', '.join('?' * len(INSERT_COLUMNS))})"
+    inserted = 0
+    while True:
+        batch = list(itertools.islice(rows, args.batch))
+        if not batch:
+            break
+        conn.execute('BEGIN')
+        conn.executemany(sql, batch)
+        conn.execute('COMMIT')
+        inserted += len(batch)
+        print(f"\r{inserted}/{args.rows} rows ({inserted / (time.time() - started):.0f}/s)", end='', flush=True)
+    print()
+
+    print(f"Rebuilding {len(indexes)} indexes and derived tables...")
+    for _, index_sql in indexes:
+        conn.execute(index_sql)
+    create_rollup_triggers(conn)
+    rebuild_derived_tables(conn)
+    if not args.row_ad_xml:
+        # The rebuild copies ad_xml from vast_ads; ingestion keeps it here only
+        conn.execute('BEGIN')
+        conn.executemany("UPDATE creatives SET ad_xml = ? WHERE creative_hash = ?",
+                         [(c['ad_xml'], c['creative_hash']) for c in creatives])
+        conn.execute('COMMIT')
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    print(f"✅ Generated {inserted} rows in {time.time() - started:.1f}s into {args.db}")
+    return inserted
+
+
+def main():
+    generate(build_parser().parse_args())
+
+
+if __name__ == "__main__":
+    main()
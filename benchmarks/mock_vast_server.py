@@ -0,0 +1,147 @@
+"""Local stand-in for a VAST ad server, for reproducible benchmarks.
+
+    python benchmarks/mock_vast_server.py --port 8765
+    curl 'http://127.0.0.1:8765/vast?ads=3&depth=2&latency_ms=20'
+
+/vast query parameters:
+    ads         ads in the pod (default 1)
+    depth       wrapper levels before the inline ads (default 0)
+    latency_ms  delay before every response at this level (default 0)
+    malformed   1 to return truncated XML
+    adomain     0 to omit <Adomain>, forcing the clickthrough fallback
+    xml_kb      pad each inline ad with roughly this many KB of extensions
+    seed        varies creative ids between otherwise identical tags
+ClickThrough URLs point at /click, which redirects to /landing/<advertiser>.
+"""
+import time
+import random
+import threading
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urlencode
+
+
+def _inline_ad(base_url, i, seed, with_adomain, xml_kb):
+    rnd = random.Random(f"{seed}:{i}")
+    creative = f"cr-{rnd.randint(1, 500)}"
+    advertiser = f"advertiser{rnd.randint(1, 50)}.example"
+    adomain = (f"<AdVerifications><Verification><AdVerificationParameters><Adomain>{advertiser}</Adomain>"
+               f"</AdVerificationParameters></Verification></AdVerifications>") if with_adomain else ''
+    padding = f"<Extension type=\"padding\"><![CDATA[{'x' * (xml_kb * 1024)}]]></Extension>" if xml_kb else ''
+    return f"""
+  <Ad id="ad-{seed}-{i}">
+    <InLine>
+      <AdSystem>mock</AdSystem>
+      <AdTitle>Mock ad {i}</AdTitle>
+      {adomain}
+      <Creatives>
+        <Creative id="{creative}">
+          <Linear>
+            <Duration>00:00:{15 + 15 * (i % 2):02d}</Duration>
+            <MediaFiles>
+              <MediaFile delivery="progressive" type="video/mp4" width="1920" height="1080">{base_url}/media/{creative}.mp4</MediaFile>
+              <MediaFile delivery="progressive" type="video/mp4" width="640" height="360">{base_url}/media/{creative}-low.mp4</MediaFile>
+            </MediaFiles>
+            <VideoClicks><ClickThrough>{base_url}/click?to={advertiser}</ClickThrough></VideoClicks>
+          </Linear>
+        </Creative>
+      </Creatives>
+      <Extensions>
+        <Extension type="FreeWheel"><SSAICreativeId>ssai-{creative}</SSAICreativeId></Extension>
+        {padding}
+      </Extensions>
+    </InLine>
+  </Ad>"""
+
+
+def _wrapper_ad(base_url, i, seed, child_query):
+    child = f"{base_url}/vast?{urlencode(dict(child_query, seed=f'{seed}-{i}'))}"
+    return f"""
+  <Ad id="wr-{seed}-{i}">
+    <Wrapper>
+      <AdSystem>mock-wrapper</AdSystem>
+      <VASTAdTagURI><![CDATA[{child}]]></VASTAdTagURI>
+      <Creatives><Creative id="wcr-{seed}-{i}"></Creative></Creatives>
+      <Extensions>
+        <Extension type="FreeWheel"><SSAICreativeId>wssai-{seed}-{i}</SSAICreativeId></Extension>
+      </Extensions>
+    </Wrapper>
+  </Ad>"""
+
+
+def build_vast(base_url, params):
+    ads = int(params.get('ads', 1))
+    depth = int(params.get('depth', 0))
+    seed = params.get('seed', '0')
+    if depth > 0:
+        # Each wrapper resolves to one ad at the next level down
+        child_query = dict(params, ads=1, depth=depth - 1)
+        body = ''.join(_wrapper_ad(base_url, i, seed, child_query) for i in range(ads))
+    else:
+        with_adomain = params.get('adomain', '1') != '0'
+        xml_kb = int(params.get('xml_kb', 0))
+        body = ''.join(_inline_ad(base_url, i, seed, with_adomain, xml_kb) for i in range(ads))
+    xml = f'<?xml version="1.0" encoding="UTF-8"?>\n<VAST version="4.0">{body}\n</VAST>\n'
+    if params.get('malformed') == '1':
+        xml = xml[:len(xml) * 2 // 3]
+    return xml.encode('utf-8')
+
+
+class MockVastHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b'', content_type='text/plain', headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        latency_ms = float(params.get('latency_ms', 0))
+        if latency_ms:
+            time.sleep(latency_ms / 1000.0)
+        base_url = f"http://{self.headers.get('Host')}"
+        if parsed.path == '/vast':
+            self._send(200, build_vast(base_url, params), 'application/xml')
+        elif parsed.path == '/click':
+            self._send(302, headers=[('Location', f"{base_url}/landing/{params.get('to', 'unknown')}")])
+        elif parsed.path.startswith('/landing/'):
+            self._send(200, b'landing', 'text/html')
+        elif parsed.path.startswith('/media/'):
+            self._send(200, b'\0' * 1024, 'video/mp4')
+        else:
+            self._send(404, b'not found')
+
+
+def start_server(host='127.0.0.1', port=0):
+    """Start the mock server in a daemon thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), MockVastHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='mock-vast', daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Serve mock VAST pods for benchmarking.')
+    ap.add_argument('--host', default='127.0.0.1')
+    ap.add_argument('--port', type=int, default=8765)
+    args = ap.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), MockVastHandler)
+    print(f"Mock VAST server on http://{args.host}:{args.port}/vast")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
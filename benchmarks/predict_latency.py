@@ -0,0 +1,65 @@
+"""Per-call latency of the DataFrame and native predict paths.
+
+Run from the directory holding creative_id_xgb_model.pkl and
+creative_id_dataset.csv:
+
+    python benchmarks/predict_latency.py --calls 2000
+
+Both paths bypass the prediction cache so every call runs the model.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+def time_calls(fn, rows, calls):
+    samples = []
+    for i in range(calls):
+        row = rows[i % len(rows)]
+        t0 = time.perf_counter()
+        fn(row)
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return samples
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--calls', type=int, default=2000)
+    args = ap.parse_args()
+
+    os.environ['MODEL_WATCH_SECONDS'] = '0'
+    import app
+    import pandas as pd
+
+    bundle = app._model['current']
+    if bundle is None:
+        sys.exit(f"Model not loaded: {app._model['last_error']}")
+    if bundle['predict_native'] is None:
+        sys.exit("Native path disabled for this model (see startup log)")
+    ref_df = pd.read_csv(app.DATA_PATH)
+    rows = app._sample_rows(bundle, ref_df, n=1000)
+    clf = bundle['clf']
+
+    def slow(row):
+        return app._predict_dataframe(clf, row)
+    fast = bundle['predict_native']
+
+    mismatches = sum(1 for r in rows if slow(r) != fast(r))
+    for name, fn in [('dataframe', slow), ('native', fast)]:
+        time_calls(fn, rows, min(100, args.calls))  # warm-up
+        samples = time_calls(fn, rows, args.calls)
+        print(f"{name:10s} p50={percentile(samples, 50):8.1f}us  p99={percentile(samples, 99):8.1f}us  "
+              f"mean={sum(samples) / len(samples):8.1f}us")
+    print(f"label mismatches: {mismatches} / {len(rows)}")
+
+
+if __name__ == "__main__":
+    main()
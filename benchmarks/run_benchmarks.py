@@ -0,0 +1,193 @@
+"""Reproducible throughput/latency benchmarks against a local mock ad server.
+
+    python benchmarks/run_benchmarks.py --out benchmarks/results/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/baseline.json
+
+Runs in a scratch directory (the app uses relative DB paths), so the
+working vast_ads.db is never touched. Pass --model-dir to include
+/predict_creative_id with a real model. With --baseline, exits non-zero if
+any case's p50 or p99 regressed by more than --threshold percent.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import sqlite3
+import platform
+import argparse
+import resource
+import tempfile
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_vast_server import start_server
+import generate_db
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))]
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0
+
+
+def run_case(name, fn, iterations, warmup=2):
+    for _ in range(min(warmup, iterations)):
+        fn()
+    samples = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    elapsed = time.perf_counter() - started
+    result = {
+        'iterations': iterations,
+        'throughput_per_s': round(iterations / elapsed, 2) if elapsed else None,
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+    print(f"{name:28s} {result['throughput_per_s']:>9} ops/s  p50={result['p50_ms']:>9.2f}ms  "
+          f"p99={result['p99_ms']:>9.2f}ms  rss={result['peak_rss_mb']}MB")
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for name, cur in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ('p50_ms', 'p99_ms'):
+            if base[key]:
+                change = (cur[key] - base[key]) / base[key] * 100.0
+                flag = ' REGRESSION' if change > threshold else ''
+                print(f"  {name:28s} {key} {base[key]:>9.2f} -> {cur[key]:>9.2f} ({change:+.1f}%){flag}")
+                if flag:
+                    regressions.append((name, key, change))
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument('--iterations', type=int, default=50)
+    ap.add_argument('--ads', type=int, default=3, help='ads per pod')
+    ap.add_argument('--depth', type=int, default=2, help='wrapper depth')
+    ap.add_argument('--latency-ms', type=float, default=0, help='injected per-response latency')
+    ap.add_argument('--rows', type=int, default=100000, help='synthetic vast_ads rows added for the query benchmarks')
+    ap.add_argument('--model-dir', help='directory holding the model .pkl and dataset .csv')
+    ap.add_argument('--workdir', help='scratch directory (default: a temp dir, removed afterwards)')
+    ap.add_argument('--out', help='write results JSON here')
+    ap.add_argument('--baseline', help='results JSON to compare against')
+    ap.add_argument('--threshold', type=float, default=10.0, help='allowed regression in percent')
+    args = ap.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='vast-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    if args.model_dir:
+        for name in ('creative_id_xgb_model.pkl', 'creative_id_dataset.csv'):
+            src = os.path.join(args.model_dir, name)
+            if os.path.exists(src):
+                shutil.copy(src, workdir)
+    out_path = os.path.abspath(args.out) if args.out else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+    os.chdir(workdir)
+    os.environ.setdefault('MODEL_WATCH_SECONDS', '0')
+    # Every case hits the one mock host; with host_guard's default budget
+    # the results would measure its rate-limit sleeps instead of the code
+    os.environ.setdefault('HOST_RATE_PER_SECOND', '1000000')
+    os.environ.setdefault('HOST_BURST', '1000000')
+
+    server, base_url = start_server()
+    import parser_1
+    import app as app_module
+    client = app_module.app.test_client()
+    headers = {"User-Agent": "Roku/DVP-14.5 (14.5.4.5934-46)"}
+    tag = f"{base_url}/vast?ads={args.ads}&depth={args.depth}&latency_ms={args.latency_ms}&csid=bench/channel"
+    n = args.iterations
+    results = {}
+    call_counter = iter(range(1, 10 ** 9))
+
+    results['fetch_and_parse_vast'] = run_case(
+        'fetch_and_parse_vast', lambda: parser_1.fetch_and_parse_vast(tag, headers), n)
+    results['fetch_malformed'] = run_case(
+        'fetch_malformed', lambda: parser_1.fetch_and_parse_vast(tag + '&malformed=1', headers), n)
+    results['fetch_deep_multi_ad'] = run_case(
+        'fetch_deep_multi_ad',
+        lambda: parser_1.fetch_and_parse_vast(f"{base_url}/vast?ads=5&depth=5&xml_kb=64", headers, with_xml=True), n)
+    results['parse_vast_and_store'] = run_case(
+        'parse_vast_and_store', lambda: parser_1.parse_vast_and_store(f"{tag}&seed={next(call_counter)}", 1), n)
+    results['parse_clickthrough_fallback'] = run_case(
+        'parse_clickthrough_fallback',
+        lambda: parser_1.parse_vast_and_store(f"{tag}&adomain=0&seed={next(call_counter)}", 1), n)
+    results['multi_5_calls'] = run_case(
+        'multi_5_calls', lambda: client.post('/multi', data={'url': tag, 'num_calls': 5}), max(1, n // 5))
+
+    generate_db.generate(generate_db.build_parser().parse_args(
+        ['--db', parser_1.DB_PATH, '--rows', str(args.rows), '--seed', '0']))
+    rows = sqlite3.connect(parser_1.DB_PATH).execute("SELECT COUNT(*) FROM vast_ads").fetchone()[0]
+    print(f"-- query benchmarks over {rows} rows")
+    results['results_page'] = run_case('results_page', lambda: client.get('/results'), n)
+    results['results_filtered'] = run_case(
+        'results_filtered', lambda: client.get('/results?creative_id=cr-1&sort=created_at&order=asc'), n)
+    results['results_deep_page'] = run_case(
+        'results_deep_page', lambda: client.get(f'/results?page={max(1, rows // 100)}'), n)
+    results['results_creatives'] = run_case(
+        'results_creatives', lambda: client.get('/results?view=creatives'), n)
+    results['export_csv'] = run_case('export_csv', lambda: client.get('/export_csv'), max(1, n // 10))
+
+    if app_module._model['current'] is not None:
+        ref = app_module.pd.read_csv(app_module.DATA_PATH)[app_module.features].head(500).to_dict('records')
+        rnd = random.Random(0)
+        results['predict_creative_id'] = run_case(
+            'predict_creative_id', lambda: client.post('/predict_creative_id', json=rnd.choice(ref)), n * 10)
+    else:
+        print("-- model not loaded, skipping /predict_creative_id (use --model-dir)")
+
+    server.shutdown()
+    report = {
+        'meta': {
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args),
+            'db_rows': rows,
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'results': results,
+    }
+    if out_path:
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        with open(out_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved results to {out_path}")
+    if not args.workdir:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    if baseline_path and compare(results, baseline_path, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
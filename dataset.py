@@ -0,0 +1,131 @@
+import os
+import sqlite3
+import argparse
+
+import pandas as pd
+
+from migrations import migrate
+
+DB_PATH = 'vast_ads.db'
+
+# Incremental export of the creative-id training set. Each run reads only
+# vast_ads rows above the stored watermark, derives the model features in
+# SQL and appends them as one Parquet part under DATASET_DIR plus rows of
+# DATASET_CSV (the creative_id_dataset.csv layout). Point training at
+# these; app.py's DATA_PATH must stay the file the live model was trained
+# on, since its category encoders are built from it.
+DATASET_DIR = os.environ.get('DATASET_DIR', 'dataset')
+DATASET_CSV = os.path.join(DATASET_DIR, 'creative_id_dataset.csv')
+WATERMARK_NAME = 'creative_id_dataset'
+EXPORT_CHUNK_ROWS = 100000
+PARQUET_COMPRESSION = 'zstd'
+
+DATASET_COLUMNS = ['initial_creative_id', 'wrapper_count', 'adomain', 'ssai_creative_id', 'wrapper_chain',
+                   'final_creative_id']
+
+# Rows ingested before wrapper_chain was recorded fall back to wrapped_ad
+# for the depth and an empty chain.
+FEATURES_SQL = '''
+    SELECT COALESCE(json_extract(initial_metadata_json, '$.creative_id'), creative_id) AS initial_creative_id,
+           COALESCE(wrapper_count, wrapped_ad, 0) AS wrapper_count,
+           adomain,
+           ssai_creative_id,
+           COALESCE(wrapper_chain, '') AS wrapper_chain,
+           creative_id AS final_creative_id
+    FROM vast_ads
+    WHERE id > ? AND id <= ? AND creative_id IS NOT NULL
+      AND (initial_metadata_json IS NULL OR json_valid(initial_metadata_json))
+    ORDER BY id
+'''
+
+
+def _arrow_schema():
+    import pyarrow as pa
+    return pa.schema([(c, pa.int64() if c == 'wrapper_count' else pa.string()) for c in DATASET_COLUMNS])
+
+
+def watermark(conn, name=WATERMARK_NAME):
+    row = conn.execute("SELECT last_id, row_count FROM dataset_watermarks WHERE name = ?", (name,)).fetchone()
+    return row if row else (0, 0)
+
+
+def _set_watermark(conn, name, last_id, row_count):
+    conn.execute('''
+        INSERT INTO dataset_watermarks (name, last_id, row_count, updated_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (name) DO UPDATE SET
+            last_id = excluded.last_id, row_count = excluded.row_count, updated_at = excluded.updated_at
+    ''', (name, last_id, row_count))
+
+
+def build_dataset(conn, dataset_dir=DATASET_DIR, csv_path=DATASET_CSV, name=WATERMARK_NAME, parquet=True):
+    """Export rows added since the last run; returns the number of rows written.
+
+    The watermark only moves after both outputs are written, so a failed run
+    is simply repeated (an interrupted CSV append can leave duplicate rows).
+    """
+    lo, row_count = watermark(conn, name)
+    hi = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vast_ads").fetchone()[0]
+    if hi <= lo:
+        return 0
+    os.makedirs(dataset_dir, exist_ok=True)
+    writer = None
+    part_path = os.path.join(dataset_dir, f"part-{lo + 1:012d}-{hi:012d}.parquet")
+    written = 0
+    try:
+        for chunk in pd.read_sql_query(FEATURES_SQL, conn, params=(lo, hi), chunksize=EXPORT_CHUNK_ROWS):
+            chunk['wrapper_count'] = chunk['wrapper_count'].astype('int64')
+            if parquet:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+                if writer is None:
+                    schema = _arrow_schema()
+                    writer = pq.ParquetWriter(part_path + '.tmp', schema, compression=PARQUET_COMPRESSION)
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            chunk.to_csv(csv_path, mode='a', header=not os.path.exists(csv_path), index=False)
+            written += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is not None:
+        os.replace(part_path + '.tmp', part_path)
+    _set_watermark(conn, name, hi, row_count + written)
+    return written
+
+
+def load_dataset(dataset_dir=DATASET_DIR):
+    """Every exported Parquet part as one DataFrame."""
+    parts = sorted(p for p in os.listdir(dataset_dir) if p.endswith('.parquet')) if os.path.isdir(dataset_dir) else []
+    if not parts:
+        return pd.DataFrame(columns=DATASET_COLUMNS)
+    return pd.concat([pd.read_parquet(os.path.join(dataset_dir, p)) for p in parts], ignore_index=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Export the creative-id training set from vast_ads incrementally.')
+    ap.add_argument('command', choices=['build', 'status', 'reset'])
+    ap.add_argument('--db', default=DB_PATH)
+    ap.add_argument('--dataset-dir', default=DATASET_DIR)
+    ap.add_argument('--csv', default=None, help="CSV to append to (default: <dataset-dir>/creative_id_dataset.csv)")
+    ap.add_argument('--no-parquet', action='store_true', help='only append to the CSV')
+    args = ap.parse_args()
+    csv_path = args.csv or os.path.join(args.dataset_dir, 'creative_id_dataset.csv')
+
+    conn = sqlite3.connect(args.db, timeout=30, isolation_level=None, check_same_thread=False)
+    migrate(conn)
+    if args.command == 'build':
+        written = build_dataset(conn, args.dataset_dir, csv_path, parquet=not args.no_parquet)
+        last_id, total = watermark(conn)
+        print(f"✅ Exported {written} new rows ({total} total, watermark id {last_id}).")
+    elif args.command == 'status':
+        last_id, total = watermark(conn)
+        pending = conn.execute("SELECT COUNT(*) FROM vast_ads WHERE id > ?", (last_id,)).fetchone()[0]
+        print(f"Watermark id {last_id}, {total} rows exported, {pending} rows pending.")
+    else:
+        # Next build starts from scratch; remove the old outputs first
+        conn.execute("DELETE FROM dataset_watermarks WHERE name = ?", (WATERMARK_NAME,))
+        print(f"Watermark cleared. Delete {args.dataset_dir} before the next build to avoid duplicates.")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
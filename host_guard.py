@@ -0,0 +1,126 @@
+import os
+import time
+import threading
+from collections import deque
+
+from metrics import inc, set_gauge
+
+# Per-host protection for outbound VAST and clickthrough fetches:
+#  - token bucket: at most HOST_RATE_PER_SECOND requests (HOST_BURST burst);
+#    callers wait up to HOST_RATE_WAIT_SECONDS for a token, then give up
+#  - adaptive timeout: HOST_TIMEOUT_FACTOR x the host's recent p95 latency,
+#    clamped to [HOST_TIMEOUT_MIN, caller's timeout]
+#  - circuit breaker: HOST_BREAKER_FAILURES consecutive failures open the
+#    circuit for HOST_BREAKER_COOLDOWN seconds, then one trial call decides;
+#    a trial whose outcome is never recorded stops blocking after another
+#    cooldown
+HOST_RATE_PER_SECOND = float(os.environ.get('HOST_RATE_PER_SECOND', 20))
+HOST_BURST = float(os.environ.get('HOST_BURST', 40))
+HOST_RATE_WAIT_SECONDS = float(os.environ.get('HOST_RATE_WAIT_SECONDS', 2.0))
+HOST_TIMEOUT_MIN = float(os.environ.get('HOST_TIMEOUT_MIN', 1.0))
+HOST_TIMEOUT_FACTOR = float(os.environ.get('HOST_TIMEOUT_FACTOR', 3.0))
+HOST_BREAKER_FAILURES = int(os.environ.get('HOST_BREAKER_FAILURES', 5))
+HOST_BREAKER_COOLDOWN = float(os.environ.get('HOST_BREAKER_COOLDOWN', 30.0))
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+
+_lock = threading.Lock()
+_hosts = {}
+
+
+def _state(host):
+    state = _hosts.get(host)
+    if state is None:
+        state = _hosts[host] = {
+            'tokens': HOST_BURST,
+            'refilled_at': time.monotonic(),
+            'latencies': deque(maxlen=LATENCY_WINDOW),
+            'failures': 0,
+            'open_until': None,
+            'trial_started_at': None,
+        }
+    return state
+
+
+def _p95(latencies):
+    ordered = sorted(latencies)
+    return ordered[int(0.95 * (len(ordered) - 1))]
+
+
+def _timeout_locked(state, max_timeout):
+    if len(state['latencies']) < LATENCY_MIN_SAMPLES:
+        return max_timeout
+    return max(HOST_TIMEOUT_MIN, min(max_timeout, HOST_TIMEOUT_FACTOR * _p95(state['latencies'])))
+
+
+def acquire(host, max_timeout=10.0):
+    """Ask to send one request to `host`.
+
+    Returns (allowed, reason, timeout): reason is 'circuit_open' or
+    'rate_limited' when not allowed; timeout is the adaptive timeout to use.
+    May sleep briefly waiting for a rate-limit token.
+    """
+    now = time.monotonic()
+    with _lock:
+        state = _state(host)
+        if state['open_until'] is not None:
+            trial_started_at = state['trial_started_at']
+            if now < state['open_until'] or (trial_started_at is not None
+                                             and now - trial_started_at < HOST_BREAKER_COOLDOWN):
+                reason = 'circuit_open'
+            else:
+                # Half-open: let exactly one trial request through
+                state['trial_started_at'] = now
+                reason = None
+            if reason:
+                inc('vast_host_rejected_total', host=host, reason=reason)
+                return False, reason, None
+        state['tokens'] = min(HOST_BURST, state['tokens'] + (now - state['refilled_at']) * HOST_RATE_PER_SECOND)
+        state['refilled_at'] = now
+        wait = 0.0 if state['tokens'] >= 1 else (1 - state['tokens']) / HOST_RATE_PER_SECOND
+        if wait > HOST_RATE_WAIT_SECONDS:
+            state['trial_started_at'] = None
+            inc('vast_host_rejected_total', host=host, reason='rate_limited')
+            return False, 'rate_limited', None
+        state['tokens'] -= 1  # reserve, possibly going negative while we wait
+        timeout = _timeout_locked(state, max_timeout)
+    if wait:
+        inc('vast_host_throttled_seconds_total', wait, host=host)
+        time.sleep(wait)
+    set_gauge('vast_host_timeout_seconds', round(timeout, 3), host=host)
+    return True, None, timeout
+
+
+def record(host, latency, ok):
+    """Report the outcome of a request allowed by acquire()."""
+    with _lock:
+        state = _state(host)
+        state['trial_started_at'] = None
+        if ok:
+            state['latencies'].append(latency)
+            state['failures'] = 0
+            if state['open_until'] is not None:
+                state['open_until'] = None
+                set_gauge('vast_host_circuit_open', 0, host=host)
+            return
+        state['failures'] += 1
+        if state['open_until'] is not None or state['failures'] >= HOST_BREAKER_FAILURES:
+            state['open_until'] = time.monotonic() + HOST_BREAKER_COOLDOWN
+            inc('vast_host_circuit_trips_total', host=host)
+            set_gauge('vast_host_circuit_open', 1, host=host)
+
+
+def snapshot():
+    now = time.monotonic()
+    with _lock:
+        return {
+            host: {
+                'tokens': round(min(HOST_BURST, s['tokens'] + (now - s['refilled_at']) * HOST_RATE_PER_SECOND), 2),
+                'consecutive_failures': s['failures'],
+                'circuit_open': s['open_until'] is not None,
+                'reopens_in_s': round(max(0.0, s['open_until'] - now), 1) if s['open_until'] else None,
+                'p95_latency_s': round(_p95(s['latencies']), 3) if s['latencies'] else None,
+                'timeout_s': round(_timeout_locked(s, 10.0), 3),
+            }
+            for host, s in _hosts.items()
+        }
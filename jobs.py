@@ -0,0 +1,272 @@
+import os
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from parser_1 import parse_vast_call
+
+DB_PATH = 'vast_ads.db'
+
+# Background ingestion. A job is one tag URL called `num_calls` times; each
+# call is queued per target host and dispatched to a shared pool, with at
+# most JOB_HOST_CONCURRENCY calls in flight per host so one slow ad server
+# cannot occupy every worker.
+# Jobs and their calls are recorded in the jobs/job_calls tables, so status
+# polls can land on any worker. Execution stays with the submitting
+# process: jobs whose process has exited are marked 'abandoned' by the next
+# process on the same host to start, or by any process once they are older
+# than JOB_STALE_SECONDS.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 8))
+JOB_HOST_CONCURRENCY = int(os.environ.get('JOB_HOST_CONCURRENCY', 2))
+JOB_HISTORY = int(os.environ.get('JOB_HISTORY', 500))
+JOB_STALE_SECONDS = int(os.environ.get('JOB_STALE_SECONDS', 6 * 3600))
+JOB_MAX_CALLS = 1000
+
+JOB_COLUMNS = ['id', 'kind', 'url', 'host', 'owner', 'status', 'total', 'completed', 'message', 'created_at',
+               'started_at', 'finished_at']
+CALL_COLUMNS = ['call_number', 'status', 'result', 'message', 'duration_ms', 'started_at']
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='vast-job')
+_lock = threading.Lock()
+_jobs = OrderedDict()      # jobs of this process not yet finished
+_pending = OrderedDict()   # host -> deque of (job, index)
+_active = {}               # host -> calls in flight
+_db = threading.local()
+_owner = f"{socket.gethostname()}:{os.getpid()}"
+_orphans_checked = False
+
+
+def _now():
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _abandon_orphans(conn):
+    stale_before = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time() - JOB_STALE_SECONDS))
+    hostname = socket.gethostname()
+    orphans = []
+    for job_id, owner, created_at in conn.execute(
+        "SELECT id, owner, created_at FROM jobs WHERE status IN ('queued', 'running')"
+    ):
+        host, _, pid = (owner or '').rpartition(':')
+        if created_at < stale_before or (host == hostname and pid.isdigit() and not _pid_alive(int(pid))):
+            orphans.append((job_id,))
+    conn.executemany("UPDATE jobs SET status = 'abandoned', finished_at = COALESCE(finished_at, ?) WHERE id = ?",
+                     [(_now(), job_id) for job_id, in orphans])
+    conn.executemany("UPDATE job_calls SET status = 'abandoned' WHERE job_id = ? AND status IN ('pending', 'running')",
+                     orphans)
+
+
+def _conn():
+    global _orphans_checked
+    conn = getattr(_db, 'conn', None)
+    if conn is None:
+        conn = _db.conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    if not _orphans_checked:
+        _orphans_checked = True
+        _abandon_orphans(conn)
+    return conn
+
+
+def _record_job(job):
+    conn = _conn()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' * len(JOB_COLUMNS))})",
+                     [job.get(c) for c in JOB_COLUMNS])
+        conn.executemany(
+            "INSERT INTO job_calls (job_id, call_number, status) VALUES (?, ?, ?)",
+            [(job['id'], c['call_number'], c['status']) for c in job['calls']]
+        )
+        # Keep the newest JOB_HISTORY jobs, never dropping unfinished ones
+        old = "SELECT id FROM jobs WHERE status NOT IN ('queued', 'running') AND rowid <= " \
+              "(SELECT rowid FROM jobs ORDER BY rowid DESC LIMIT 1 OFFSET ?)"
+        conn.execute(f"DELETE FROM job_calls WHERE job_id IN ({old})", (JOB_HISTORY,))
+        conn.execute(f"DELETE FROM jobs WHERE id IN ({old})", (JOB_HISTORY,))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def _dispatch_locked():
+    # Round-robin over hosts that have queued calls and free slots
+    for host in list(_pending):
+        queue = _pending[host]
+        while queue and _active.get(host, 0) < JOB_HOST_CONCURRENCY:
+            job, index = queue.popleft()
+            _active[host] = _active.get(host, 0) + 1
+            _executor.submit(_run_call, job, index)
+        if not queue:
+            del _pending[host]
+
+
+def _run_call(job, index):
+    call = job['calls'][index]
+    call['status'] = 'running'
+    call['started_at'] = _now()
+    if job['status'] == 'queued':
+        job['status'] = 'running'
+        job['started_at'] = call['started_at']
+    conn = _conn()
+    conn.execute("UPDATE job_calls SET status = 'running', started_at = ? WHERE job_id = ? AND call_number = ?",
+                 (call['started_at'], job['id'], call['call_number']))
+    conn.execute("UPDATE jobs SET status = 'running', started_at = COALESCE(started_at, ?) WHERE id = ?",
+                 (call['started_at'], job['id']))
+    started = time.perf_counter()
+    try:
+        call['result'], call['message'] = parse_vast_call(job['url'], call_number=call['call_number'])
+        call['status'] = 'done'
+    except Exception as e:
+        call['result'] = 'error'
+        call['message'] = str(e)
+        call['status'] = 'error'
+    call['duration_ms'] = round((time.perf_counter() - started) * 1000.0, 1)
+    with _lock:
+        _active[job['host']] -= 1
+        job['completed'] += 1
+        finished = job['completed'] == job['total']
+        if finished:
+            job['status'] = 'error' if any(c['status'] == 'error' for c in job['calls']) else 'done'
+            job['finished_at'] = _now()
+            _jobs.pop(job['id'], None)
+        _dispatch_locked()
+    try:
+        conn.execute("UPDATE job_calls SET status = ?, result = ?, message = ?, duration_ms = ? "
+                     "WHERE job_id = ? AND call_number = ?",
+                     (call['status'], call['result'], call['message'], call['duration_ms'], job['id'],
+                      call['call_number']))
+        conn.execute("UPDATE jobs SET completed = completed + 1 WHERE id = ?", (job['id'],))
+        if finished:
+            conn.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                         (job['status'], job['finished_at'], job['id']))
+    except Exception as e:
+        print(f"❌ Job {job['id']} call {call['call_number']} not recorded: {e}")
+    if finished and job['on_complete']:
+        try:
+            job['on_complete'](job)
+        except Exception as e:
+            print(f"❌ Job {job['id']} completion hook failed: {e}")
+
+
+def submit_job(url, num_calls, on_complete=None):
+    """Queue `num_calls` ingestions of `url`; returns the job id immediately.
+
+    `on_complete(job)` runs on a worker thread once every call has finished.
+    """
+    num_calls = max(1, min(int(num_calls), JOB_MAX_CALLS))
+    job_id = uuid.uuid4().hex[:12]
+    host = urlparse(url).netloc
+    job = {
+        'id': job_id,
+        'kind': 'ingest',
+        'url': url,
+        'host': host,
+        'owner': _owner,
+        'status': 'queued',
+        'total': num_calls,
+        'completed': 0,
+        'created_at': _now(),
+        'started_at': None,
+        'finished_at': None,
+        'calls': [{'call_number': i + 1, 'status': 'pending', 'result': None, 'message': None,
+                   'duration_ms': None, 'started_at': None} for i in range(num_calls)],
+        'on_complete': on_complete,
+    }
+    _record_job(job)
+    with _lock:
+        _jobs[job_id] = job
+        queue = _pending.setdefault(host, deque())
+        queue.extend((job, i) for i in range(num_calls))
+        _dispatch_locked()
+    return job_id
+
+
+def _run_task(job, fn, args, kwargs):
+    conn = _conn()
+    job['status'] = 'running'
+    job['started_at'] = _now()
+    conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (job['started_at'], job['id']))
+    try:
+        job['message'] = fn(*args, **kwargs)
+        job['status'] = 'done'
+    except Exception as e:
+        job['message'] = str(e)
+        job['status'] = 'error'
+    job['completed'] = 1
+    job['finished_at'] = _now()
+    with _lock:
+        _jobs.pop(job['id'], None)
+    conn.execute("UPDATE jobs SET status = ?, completed = 1, message = ?, finished_at = ? WHERE id = ?",
+                 (job['status'], None if job['message'] is None else str(job['message']), job['finished_at'],
+                  job['id']))
+
+
+def submit_task(kind, fn, *args, **kwargs):
+    """Run `fn(*args, **kwargs)` on the job pool, e.g. a large purge; returns the job id immediately.
+
+    Tracked and listed like ingestion jobs; the return value (or error)
+    ends up in the job's `message`. Not subject to the per-host caps.
+    """
+    job_id = uuid.uuid4().hex[:12]
+    job = {
+        'id': job_id,
+        'kind': kind,
+        'owner': _owner,
+        'status': 'queued',
+        'total': 1,
+        'completed': 0,
+        'message': None,
+        'created_at': _now(),
+        'started_at': None,
+        'finished_at': None,
+        'calls': [],
+    }
+    _record_job(job)
+    with _lock:
+        _jobs[job_id] = job
+    _executor.submit(_run_task, job, fn, args, kwargs)
+    return job_id
+
+
+def job_status(job_id, include_calls=True):
+    conn = _conn()
+    row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    status = dict(zip(JOB_COLUMNS, row))
+    if include_calls:
+        status['calls'] = [dict(zip(CALL_COLUMNS, r)) for r in conn.execute(
+            f"SELECT {', '.join(CALL_COLUMNS)} FROM job_calls WHERE job_id = ? ORDER BY call_number", (job_id,)
+        )]
+    return status
+
+
+def list_jobs(limit=50):
+    rows = _conn().execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs ORDER BY rowid DESC LIMIT ?", (limit,))
+    return [dict(zip(JOB_COLUMNS, r)) for r in rows]
+
+
+def queue_stats():
+    """This process's dispatch queue; other workers keep their own."""
+    with _lock:
+        return {
+            'queued_calls': sum(len(q) for q in _pending.values()),
+            'active_calls': dict((h, n) for h, n in _active.items() if n),
+            'workers': JOB_WORKERS,
+            'host_concurrency': JOB_HOST_CONCURRENCY,
+        }
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+
+from migrations import migrate
+from metrics import inc, observe
+import host_guard
+
+DB_PATH = 'vast_ads.db'
+
+# Health checks for MediaFile URLs. Each URL is probed with a HEAD request,
+# falling back to a one-byte range GET when the server rejects HEAD or omits
+# the size, and the outcome is cached in media_probes until expires_at, so a
+# URL is probed once however many ads reference it. With MEDIA_PROBE=1,
+# parse_vast_and_store queues the URLs of every stored call on a pool of
+# MEDIA_PROBE_WORKERS threads; pages only ever read the cache.
+MEDIA_PROBE = os.environ.get('MEDIA_PROBE', '0') == '1'
+MEDIA_PROBE_WORKERS = int(os.environ.get('MEDIA_PROBE_WORKERS', 4))
+MEDIA_PROBE_TTL_SECONDS = int(os.environ.get('MEDIA_PROBE_TTL_SECONDS', 86400))
+# Failures are retried sooner than successes
+MEDIA_PROBE_ERROR_TTL_SECONDS = int(os.environ.get('MEDIA_PROBE_ERROR_TTL_SECONDS', 900))
+MEDIA_PROBE_TIMEOUT = float(os.environ.get('MEDIA_PROBE_TIMEOUT', 5.0))
+# Files larger than this are flagged as oversized
+MEDIA_PROBE_MAX_BYTES = int(os.environ.get('MEDIA_PROBE_MAX_BYTES', 50 * 1024 * 1024))
+
+HEADERS = {"User-Agent": "Roku/DVP-14.5 (14.5.4.5934-46)"}
+PROBE_COLUMNS = ['url', 'status', 'http_status', 'content_type', 'size', 'latency_ms', 'error', 'probed_at',
+                 'expires_at']
+
+UPSERT_PROBE_SQL = '''
+    INSERT INTO media_probes (url, host, status, http_status, content_type, size, latency_ms, error, probed_at,
+                              expires_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, datetime('now', ?))
+    ON CONFLICT (url) DO UPDATE SET
+        host = excluded.host, status = excluded.status, http_status = excluded.http_status,
+        content_type = excluded.content_type, size = excluded.size, latency_ms = excluded.latency_ms,
+        error = excluded.error, probed_at = excluded.probed_at, expires_at = excluded.expires_at
+'''
+
+_executor = ThreadPoolExecutor(max_workers=MEDIA_PROBE_WORKERS, thread_name_prefix='media-probe')
+_queued = set()   # URLs queued or being probed in this process
+_queued_lock = threading.Lock()
+
+
+def _connect(db_path=None):
+    return sqlite3.connect(db_path or DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+
+
+def _size(response):
+    # Content-Range: bytes 0-0/12345 carries the full size of a range reply
+    content_range = response.headers.get('Content-Range', '')
+    if '/' in content_range and content_range.rsplit('/', 1)[1].isdigit():
+        return int(content_range.rsplit('/', 1)[1])
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and response.status_code != 206:
+        return int(length)
+    return None
+
+
+def _classify(http_status, content_type, size):
+    if http_status >= 400:
+        return 'broken'
+    if content_type and not content_type.startswith(('video/', 'audio/', 'application/')):
+        return 'wrong_type'
+    if size is not None and size > MEDIA_PROBE_MAX_BYTES:
+        return 'oversized'
+    return 'ok'
+
+
+def probe_url(url):
+    """Probe one media URL; returns a dict with the media_probes columns (no timestamps)."""
+    result = {'url': url, 'status': 'error', 'http_status': None, 'content_type': None, 'size': None,
+              'latency_ms': None, 'error': None}
+    host = urlparse(url).netloc
+    if not host:
+        result['error'] = 'invalid url'
+        return result
+    allowed, reason, timeout = host_guard.acquire(host, max_timeout=MEDIA_PROBE_TIMEOUT)
+    if not allowed:
+        # Not cached: the host is tripped or busy, try again on a later call
+        result['status'] = 'skipped'
+        result['error'] = reason
+        return result
+    started = time.perf_counter()
+    ok = False
+    try:
+        response = requests.head(url, headers=HEADERS, timeout=timeout, allow_redirects=True)
+        if response.status_code in (403, 405, 501) or _size(response) is None:
+            response.close()
+            response = requests.get(url, headers=dict(HEADERS, Range='bytes=0-0'), timeout=timeout,
+                                    allow_redirects=True, stream=True)
+            response.close()
+        result['http_status'] = response.status_code
+        result['content_type'] = (response.headers.get('Content-Type') or '').split(';')[0].strip() or None
+        result['size'] = _size(response)
+        result['status'] = _classify(response.status_code, result['content_type'], result['size'])
+        ok = response.status_code < 500
+    except Exception as e:
+        result['error'] = str(e)[:500]
+    latency = time.perf_counter() - started
+    host_guard.record(host, latency, ok=ok)
+    result['latency_ms'] = round(latency * 1000.0, 1)
+    observe('vast_media_probe_seconds', latency, host=host)
+    inc('vast_media_probes_total', host=host, status=result['status'])
+    return result
+
+
+def store_probe(conn, result):
+    ttl = MEDIA_PROBE_TTL_SECONDS if result['status'] == 'ok' else MEDIA_PROBE_ERROR_TTL_SECONDS
+    conn.execute(UPSERT_PROBE_SQL, (
+        result['url'], urlparse(result['url']).netloc, result['status'], result['http_status'],
+        result['content_type'], result['size'], result['latency_ms'], result['error'], f"+{ttl} seconds"
+    ))
+
+
+def stale_urls(conn, urls):
+    """The subset of `urls` with no unexpired cache entry."""
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return []
+    fresh = {r[0] for r in conn.execute(
+        "SELECT url FROM media_probes WHERE url IN (SELECT value FROM json_each(?)) AND expires_at > CURRENT_TIMESTAMP",
+        (json.dumps(urls),)
+    )}
+    return [u for u in urls if u not in fresh]
+
+
+def _probe_and_store(url, db_path):
+    try:
+        result = probe_url(url)
+        if result['status'] != 'skipped':
+            conn = _connect(db_path)
+            try:
+                store_probe(conn, result)
+            finally:
+                conn.close()
+    except Exception as e:
+        print(f"❌ Media probe failed for {url}: {e}")
+    finally:
+        with _queued_lock:
+            _queued.discard(url)
+
+
+def queue_probes(urls, db_path=None):
+    """Queue background probes for the URLs not cached or already queued; returns how many were queued."""
+    conn = _connect(db_path)
+    try:
+        stale = stale_urls(conn, urls)
+    finally:
+        conn.close()
+    with _queued_lock:
+        stale = [u for u in stale if u not in _queued]
+        _queued.update(stale)
+    for url in stale:
+        _executor.submit(_probe_and_store, url, db_path)
+    return len(stale)
+
+
+def probe_all(conn, urls, workers=MEDIA_PROBE_WORKERS):
+    """Probe the stale `urls` now, `workers` at a time; returns {status: count}."""
+    counts = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-probe-cli') as pool:
+        for result in pool.map(probe_url, stale_urls(conn, urls)):
+            if result['status'] != 'skipped':
+                store_probe(conn, result)
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+    return counts
+
+
+def probe_health(conn, urls):
+    """Cached probe rows for `urls` as {url: dict}; expired entries are included, unprobed URLs are not."""
+    urls = list(dict.fromkeys(u for u in urls if u))
+    if not urls:
+        return {}
+    rows = conn.execute(
+        f"SELECT {', '.join(PROBE_COLUMNS)} FROM media_probes WHERE url IN (SELECT value FROM json_each(?))",
+        (json.dumps(urls),)
+    ).fetchall()
+    return {r[0]: dict(zip(PROBE_COLUMNS, r)) for r in rows}
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Probe MediaFile URLs and cache their health.')
+    ap.add_argument('command', choices=['probe', 'status'])
+    ap.add_argument('--db', default=DB_PATH)
+    ap.add_argument('--workers', type=int, default=MEDIA_PROBE_WORKERS)
+    args = ap.parse_args()
+
+    conn = _connect(args.db)
+    migrate(conn)
+    if args.command == 'probe':
+        # Every distinct URL referenced by a known creative
+        urls = [r[0] for r in conn.execute(
+            "SELECT DISTINCT j.value FROM creatives, json_each(creatives.media_urls) AS j "
+            "WHERE json_valid(creatives.media_urls)"
+        )]
+        started = time.time()
+        counts = probe_all(conn, urls, workers=args.workers)
+        print(f"✅ Probed {sum(counts.values())} of {len(urls)} URLs in {time.time() - started:.1f}s: {counts}")
+    else:
+        for status, n, expired in conn.execute(
+            "SELECT status, COUNT(*), SUM(expires_at <= CURRENT_TIMESTAMP) FROM media_probes GROUP BY status"
+        ):
+            print(status, n, f"{expired} expired", sep='\t')
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from migrations import run_batched
+
+# Process-wide counters and histograms, rendered in the Prometheus text
+# format at /metrics. Per-call spans are additionally persisted to the
+# vast_call_metrics table by parse_vast_and_store.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Stored spans older than CALL_METRICS_RETENTION_DAYS are deleted in short
+# batches: in the background at most every CALL_METRICS_PRUNE_SECONDS per
+# process while calls are being stored, and by `partitions.py archive`.
+# 0 keeps them forever.
+CALL_METRICS_RETENTION_DAYS = float(os.environ.get('CALL_METRICS_RETENTION_DAYS', 30))
+CALL_METRICS_PRUNE_SECONDS = 3600
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_last_prune = None
+_help = {
+    'vast_stage_duration_seconds': 'Time spent in each VAST pipeline stage',
+    'vast_fetch_bytes': 'Size of VAST responses per wrapper hop',
+    'vast_fetch_total': 'VAST fetches by host and outcome',
+}
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+        for i, bound in enumerate(hist['buckets']):
+            if value <= bound:
+                hist['counts'][i] += 1
+        hist['sum'] += value
+        hist['count'] += 1
+
+
+def _fmt_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [(k, v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def render_prometheus():
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        histograms = {k: dict(v, counts=list(v['counts'])) for k, v in _histograms.items()}
+    seen = set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            if name in _help:
+                lines.append(f"# HELP {name} {_help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, 'counter')
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    for (name, labels), value in sorted(gauges.items()):
+        header(name, 'gauge')
+        lines.append(f"{name}{_fmt_labels(labels)} {value}")
+    for (name, labels), hist in sorted(histograms.items()):
+        header(name, 'histogram')
+        for bound, count in zip(hist['buckets'], hist['counts']):
+            lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', repr(float(bound)))])} {count}")
+        lines.append(f"{name}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {hist['count']}")
+        lines.append(f"{name}_sum{_fmt_labels(labels)} {hist['sum']}")
+        lines.append(f"{name}_count{_fmt_labels(labels)} {hist['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+# --- Per-call traces -------------------------------------------------------
+
+def new_trace(url):
+    return {'call_id': uuid.uuid4().hex, 'url': url, 'spans': []}
+
+
+@contextmanager
+def span(trace, stage, **attrs):
+    """Time a pipeline stage; the yielded dict can be filled with bytes/status.
+
+    `trace` may be None, in which case only the histograms are updated.
+    """
+    started = time.perf_counter()
+    try:
+        yield attrs
+    except Exception:
+        attrs.setdefault('status', 'error')
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        observe('vast_stage_duration_seconds', duration, stage=stage, host=attrs.get('host'))
+        if trace is not None:
+            trace['spans'].append(dict(attrs, stage=stage, duration_ms=duration * 1000.0))
+
+
+def save_trace(cur, trace):
+    cur.executemany('''
+        INSERT INTO vast_call_metrics (call_id, stage, depth, host, url, bytes, status, duration_ms)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (trace['call_id'], s['stage'], s.get('depth'), s.get('host'), s.get('url'),
+         s.get('bytes'), None if s.get('status') is None else str(s['status']), round(s['duration_ms'], 3))
+        for s in trace['spans']
+    ])
+
+
+def prune_call_metrics(conn, retention_days=CALL_METRICS_RETENTION_DAYS):
+    """Delete stored spans older than `retention_days`; expects an autocommit connection. Returns rows deleted."""
+    if not retention_days or retention_days <= 0:
+        return 0
+    # Oldest first in id order, so each batch finds its rows at the start of the table
+    return run_batched(conn, '''
+        DELETE FROM vast_call_metrics WHERE id IN (
+            SELECT id FROM vast_call_metrics WHERE created_at < datetime('now', ?) ORDER BY id LIMIT ?
+        )
+    ''', (f"-{retention_days} days",))
+
+
+def _prune_worker(db_path):
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        deleted = prune_call_metrics(conn)
+        if deleted:
+            inc('vast_call_metrics_pruned_total', deleted)
+    except Exception as e:
+        print(f"❌ Pruning vast_call_metrics failed: {e}")
+    finally:
+        conn.close()
+
+
+def prune_call_metrics_in_background(db_path):
+    """Start a prune unless this process ran one in the last CALL_METRICS_PRUNE_SECONDS."""
+    global _last_prune
+    now = time.monotonic()
+    with _lock:
+        if CALL_METRICS_RETENTION_DAYS <= 0 or (_last_prune is not None
+                                                and now - _last_prune < CALL_METRICS_PRUNE_SECONDS):
+            return False
+        _last_prune = now
+    threading.Thread(target=_prune_worker, args=(db_path,), name='call-metrics-prune', daemon=True).start()
+    return True
@@ -0,0 +1,788 @@
+import sqlite3
+import time
+import hashlib
+import argparse
+from collections import namedtuple
+
+DB_PATH = 'vast_ads.db'
+
+# Rows touched per transaction by batched backfills. Small enough that the
+# write lock is released every few milliseconds so ingestion can interleave.
+BACKFILL_BATCH_SIZE = 5000
+BACKFILL_PAUSE_SECONDS = 0.01
+
+# Migration 13 only runs its full VACUUM on files up to this size
+AUTO_VACUUM_MAX_BYTES = 64 * 1024 * 1024
+
+SCHEMA_VERSION_SQL = '''
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    description TEXT,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    duration_ms INTEGER
+)
+'''
+
+# Resume points for batched backfills, so a restarted migration neither
+# skips nor double-counts rows.
+MIGRATION_PROGRESS_SQL = '''
+CREATE TABLE IF NOT EXISTS migration_progress (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+)
+'''
+
+# `transactional` steps run inside one BEGIN IMMEDIATE together with their
+# schema_version row. Non-transactional steps manage their own (batched)
+# transactions and must be idempotent so an interrupted run can resume.
+Migration = namedtuple('Migration', ['version', 'description', 'apply', 'transactional'])
+
+
+def run_batched(conn, sql, params=(), batch_size=BACKFILL_BATCH_SIZE, pause=BACKFILL_PAUSE_SECONDS):
+    """Repeat `sql` in short write transactions until it touches no rows.
+
+    `sql` must select its own batch and take the batch size as its last
+    parameter, e.g. ``UPDATE t SET x = ? WHERE id IN (SELECT id FROM t WHERE x IS NULL LIMIT ?)``.
+    Returns the total number of rows changed.
+    """
+    total = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            changed = conn.execute(sql, tuple(params) + (batch_size,)).rowcount
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        total += changed
+        if changed < batch_size:
+            return total
+        if pause:
+            time.sleep(pause)
+
+
+def run_id_batches(conn, name, sql, batch_size=BACKFILL_BATCH_SIZE, pause=BACKFILL_PAUSE_SECONDS, max_id=None):
+    """Run `sql` over consecutive vast_ads id windows, resumably.
+
+    `sql` takes the window bounds as its two parameters, ``id > ? AND id <= ?``.
+    Each window commits together with its progress marker, so the step can
+    be non-idempotent (e.g. incrementing counters). Rows above `max_id`
+    (default: the highest id present when the step starts) are left to
+    live ingestion.
+    """
+    conn.execute(MIGRATION_PROGRESS_SQL)
+    row = conn.execute("SELECT last_id FROM migration_progress WHERE name = ?", (name,)).fetchone()
+    lo = row[0] if row else 0
+    if max_id is None:
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vast_ads").fetchone()[0]
+    while lo < max_id:
+        hi = min(lo + batch_size, max_id)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(sql, (lo, hi))
+            conn.execute("INSERT OR REPLACE INTO migration_progress (name, last_id) VALUES (?, ?)", (name, hi))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        lo = hi
+        if pause:
+            time.sleep(pause)
+
+
+def set_ceiling(conn, name):
+    # Called in the same transaction that creates a table live ingestion
+    # starts writing to: rows up to the ceiling are the backfill's, later
+    # ones were written by ingestion, so none is counted twice.
+    conn.execute(MIGRATION_PROGRESS_SQL)
+    conn.execute(
+        "INSERT OR REPLACE INTO migration_progress (name, last_id) SELECT ?, COALESCE(MAX(id), 0) FROM vast_ads",
+        (f"{name}_ceiling",)
+    )
+
+
+def get_ceiling(conn, name):
+    """The id recorded by set_ceiling, or None (then run_id_batches uses the current max)."""
+    conn.execute(MIGRATION_PROGRESS_SQL)
+    row = conn.execute("SELECT last_id FROM migration_progress WHERE name = ?", (f"{name}_ceiling",)).fetchone()
+    return row[0] if row else None
+
+
+def make_creative_hash(*fields):
+    # Here rather than in parser_1 so migrations and tools can hash without
+    # importing the parser, which migrates ./vast_ads.db on import
+    base = ':'.join([str(f) if f else '' for f in fields])
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+
+def table_columns(conn, table):
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+
+# --- Migration steps -------------------------------------------------------
+# Steps are history: never edit one that has shipped, append a new one.
+
+def _create_vast_ads(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vast_ads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            call_number INTEGER,
+            ad_id TEXT,
+            creative_id TEXT,
+            ssai_creative_id TEXT,
+            title TEXT,
+            duration TEXT,
+            clickthrough TEXT,
+            media_urls TEXT,
+            channel_name TEXT,
+            adomain TEXT,
+            creative_hash TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ad_xml TEXT,
+            wrapped_ad INTEGER DEFAULT 0,
+            initial_metadata_json TEXT
+        )
+    ''')
+
+
+def _add_parser_columns(conn):
+    # Databases created by the old init_db.py only have the slim schema.
+    existing = set(table_columns(conn, 'vast_ads'))
+    for name, ddl in [
+        ('ssai_creative_id', 'TEXT'),
+        ('adomain', 'TEXT'),
+        ('creative_hash', 'TEXT'),
+        ('ad_xml', 'TEXT'),
+        ('wrapped_ad', 'INTEGER DEFAULT 0'),
+        ('initial_metadata_json', 'TEXT'),
+    ]:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE vast_ads ADD COLUMN {name} {ddl}")
+
+
+def _backfill_creative_hash(conn):
+    import json
+
+    def legacy_hash(ssai_creative_id, creative_id, media_urls, adomain):
+        try:
+            urls = json.loads(media_urls) if media_urls else []
+        except ValueError:
+            urls = []
+        return make_creative_hash(ssai_creative_id, creative_id, ','.join(urls), adomain if adomain else '')
+
+    conn.create_function('legacy_creative_hash', 4, legacy_hash, deterministic=True)
+    run_batched(conn, '''
+        UPDATE vast_ads
+        SET creative_hash = legacy_creative_hash(ssai_creative_id, creative_id, media_urls, adomain)
+        WHERE id IN (SELECT id FROM vast_ads WHERE creative_hash IS NULL LIMIT ?)
+    ''')
+
+
+def _add_lookup_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vast_ads_ad_id ON vast_ads(ad_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vast_ads_creative_hash ON vast_ads(creative_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vast_ads_created_at ON vast_ads(created_at)")
+
+
+def _create_partition_catalog(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vast_ads_partitions (
+            path TEXT PRIMARY KEY,
+            partition TEXT NOT NULL,
+            row_count INTEGER,
+            min_id INTEGER,
+            max_id INTEGER,
+            min_created_at TEXT,
+            max_created_at TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vast_ads_partitions_range ON vast_ads_partitions(min_created_at, max_created_at)")
+
+
+def _create_creative_map(conn):
+    # Clustered on the wrapper id, so resolving one is a single B-tree seek.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS creative_map (
+            wrapper_id TEXT NOT NULL,
+            id_kind TEXT NOT NULL,
+            final_creative_id TEXT NOT NULL,
+            final_ssai_creative_id TEXT NOT NULL,
+            final_creative_hash TEXT,
+            hit_count INTEGER NOT NULL DEFAULT 0,
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (wrapper_id, id_kind, final_creative_id, final_ssai_creative_id)
+        ) WITHOUT ROWID
+    ''')
+    set_ceiling(conn, 'creative_map')
+
+
+# Aggregates wrapped vast_ads rows into creative_map. Formatted with the
+# wrapper id kind; takes an (id > ?, id <= ?) window.
+CREATIVE_MAP_AGGREGATE_SQL = '''
+    INSERT INTO creative_map (
+        wrapper_id, id_kind, final_creative_id, final_ssai_creative_id, final_creative_hash,
+        hit_count, first_seen, last_seen
+    )
+    SELECT json_extract(initial_metadata_json, '$.{kind}'), '{kind}',
+           COALESCE(creative_id, ''), COALESCE(ssai_creative_id, ''), MAX(creative_hash),
+           COUNT(*), MIN(created_at), MAX(created_at)
+    FROM vast_ads
+    WHERE id > ? AND id <= ? AND wrapped_ad = 1
+      AND json_valid(initial_metadata_json)
+      AND json_extract(initial_metadata_json, '$.{kind}') IS NOT NULL
+    GROUP BY 1, 3, 4
+    ON CONFLICT (wrapper_id, id_kind, final_creative_id, final_ssai_creative_id) DO UPDATE SET
+        hit_count = hit_count + excluded.hit_count,
+        final_creative_hash = excluded.final_creative_hash,
+        first_seen = MIN(first_seen, excluded.first_seen),
+        last_seen = MAX(last_seen, excluded.last_seen)
+'''
+
+
+def _backfill_creative_map(conn):
+    ceiling = get_ceiling(conn, 'creative_map')
+    for kind in ('creative_id', 'ssai_creative_id'):
+        run_id_batches(conn, f'creative_map_{kind}', CREATIVE_MAP_AGGREGATE_SQL.format(kind=kind), max_id=ceiling)
+
+
+def _create_call_metrics(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vast_call_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            call_id TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            depth INTEGER,
+            host TEXT,
+            url TEXT,
+            bytes INTEGER,
+            status TEXT,
+            duration_ms REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vast_call_metrics_call_id ON vast_call_metrics(call_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vast_call_metrics_host ON vast_call_metrics(host, created_at)")
+
+
+def _create_creatives(conn):
+    # One row per distinct creative_hash holding the heavy fields, plus a
+    # slim per-ad fact table keyed by the vast_ads id it was ingested as.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS creatives (
+            creative_hash TEXT PRIMARY KEY,
+            creative_id TEXT,
+            ssai_creative_id TEXT,
+            title TEXT,
+            duration TEXT,
+            clickthrough TEXT,
+            media_urls TEXT,
+            adomain TEXT,
+            ad_xml TEXT,
+            occurrence_count INTEGER NOT NULL DEFAULT 0,
+            first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_creatives_last_seen ON creatives(last_seen)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS creative_occurrences (
+            id INTEGER PRIMARY KEY,
+            creative_hash TEXT NOT NULL,
+            call_number INTEGER,
+            ad_id TEXT,
+            channel_name TEXT,
+            wrapped_ad INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_creative_occurrences_hash ON creative_occurrences(creative_hash, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_creative_occurrences_created_at ON creative_occurrences(created_at)")
+    set_ceiling(conn, 'creatives')
+
+
+# Aggregates vast_ads rows into creatives, taking the heavy fields from the
+# newest row of each hash in the window. Takes an (id > ?, id <= ?) window.
+CREATIVES_AGGREGATE_SQL = '''
+    INSERT INTO creatives (
+        creative_hash, creative_id, ssai_creative_id, title, duration, clickthrough, media_urls, adomain,
+        ad_xml, occurrence_count, first_seen, last_seen
+    )
+    SELECT w.creative_hash, v.creative_id, v.ssai_creative_id, v.title, v.duration, v.clickthrough,
+           v.media_urls, v.adomain, v.ad_xml, w.n, w.first_seen, w.last_seen
+    FROM (
+        SELECT creative_hash, MAX(id) AS last_id, COUNT(*) AS n,
+               MIN(created_at) AS first_seen, MAX(created_at) AS last_seen
+        FROM vast_ads
+        WHERE id > ? AND id <= ? AND creative_hash IS NOT NULL
+        GROUP BY creative_hash
+    ) AS w
+    JOIN vast_ads AS v ON v.id = w.last_id
+    WHERE 1
+    ON CONFLICT (creative_hash) DO UPDATE SET
+        occurrence_count = occurrence_count + excluded.occurrence_count,
+        ad_xml = COALESCE(ad_xml, excluded.ad_xml),
+        first_seen = MIN(first_seen, excluded.first_seen),
+        last_seen = MAX(last_seen, excluded.last_seen)
+'''
+
+CREATIVE_OCCURRENCES_COPY_SQL = '''
+    INSERT OR IGNORE INTO creative_occurrences (id, creative_hash, call_number, ad_id, channel_name, wrapped_ad, created_at)
+    SELECT id, creative_hash, call_number, ad_id, channel_name, wrapped_ad, created_at
+    FROM vast_ads
+    WHERE id > ? AND id <= ? AND creative_hash IS NOT NULL
+'''
+
+
+def _backfill_creatives(conn):
+    ceiling = get_ceiling(conn, 'creatives')
+    run_id_batches(conn, 'creatives', CREATIVES_AGGREGATE_SQL, max_id=ceiling)
+    run_id_batches(conn, 'creative_occurrences', CREATIVE_OCCURRENCES_COPY_SQL, max_id=ceiling)
+
+
+def _create_ad_rollups(conn):
+    # Hourly channel x adomain counts, plus per-creative counts in the same
+    # buckets so distinct creatives can be answered over any range without
+    # touching vast_ads. Both are kept current by the triggers below.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ad_rollups_hourly (
+            hour TEXT NOT NULL,
+            channel_name TEXT NOT NULL,
+            adomain TEXT NOT NULL,
+            ad_count INTEGER NOT NULL DEFAULT 0,
+            wrapped_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, channel_name, adomain)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ad_rollup_creatives (
+            hour TEXT NOT NULL,
+            channel_name TEXT NOT NULL,
+            adomain TEXT NOT NULL,
+            creative_hash TEXT NOT NULL,
+            ad_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (hour, channel_name, adomain, creative_hash)
+        ) WITHOUT ROWID
+    ''')
+    create_rollup_triggers(conn)
+    # Rows up to here are counted by the backfill, later ones by the triggers
+    set_ceiling(conn, 'ad_rollups')
+
+
+ROLLUP_HOUR_SQL = "strftime('%Y-%m-%d %H:00:00', {row}.created_at)"
+ROLLUP_KEY_SQL = (ROLLUP_HOUR_SQL + ", COALESCE({row}.channel_name, ''), COALESCE({row}.adomain, '')")
+ROLLUP_MATCH_SQL = (
+    "hour = " + ROLLUP_HOUR_SQL + " AND channel_name = COALESCE({row}.channel_name, '')"
+    " AND adomain = COALESCE({row}.adomain, '')"
+)
+
+ROLLUP_TRIGGERS = {
+    'trg_vast_ads_rollup_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_vast_ads_rollup_insert AFTER INSERT ON vast_ads
+        WHEN NEW.created_at IS NOT NULL
+        BEGIN
+            INSERT INTO ad_rollups_hourly (hour, channel_name, adomain, ad_count, wrapped_count)
+            VALUES ({ROLLUP_KEY_SQL.format(row='NEW')}, 1, COALESCE(NEW.wrapped_ad, 0))
+            ON CONFLICT (hour, channel_name, adomain) DO UPDATE SET
+                ad_count = ad_count + 1,
+                wrapped_count = wrapped_count + excluded.wrapped_count;
+            INSERT INTO ad_rollup_creatives (hour, channel_name, adomain, creative_hash, ad_count)
+            SELECT {ROLLUP_KEY_SQL.format(row='NEW')}, NEW.creative_hash, 1
+            WHERE NEW.creative_hash IS NOT NULL
+            ON CONFLICT (hour, channel_name, adomain, creative_hash) DO UPDATE SET ad_count = ad_count + 1;
+        END
+    ''',
+    # Rows removed by partitions.archive_old_partitions (inside a catalogued
+    # partition) keep their counts: the rollups cover archived history too.
+    'trg_vast_ads_rollup_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_vast_ads_rollup_delete AFTER DELETE ON vast_ads
+        WHEN OLD.created_at IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM vast_ads_partitions AS p
+            WHERE OLD.id BETWEEN p.min_id AND p.max_id AND p.partition = strftime('%Y-%m', OLD.created_at)
+        )
+        BEGIN
+            UPDATE ad_rollups_hourly
+            SET ad_count = ad_count - 1, wrapped_count = wrapped_count - COALESCE(OLD.wrapped_ad, 0)
+            WHERE {ROLLUP_MATCH_SQL.format(row='OLD')};
+            DELETE FROM ad_rollups_hourly WHERE {ROLLUP_MATCH_SQL.format(row='OLD')} AND ad_count <= 0;
+            UPDATE ad_rollup_creatives SET ad_count = ad_count - 1
+            WHERE {ROLLUP_MATCH_SQL.format(row='OLD')} AND creative_hash = OLD.creative_hash;
+            DELETE FROM ad_rollup_creatives
+            WHERE {ROLLUP_MATCH_SQL.format(row='OLD')} AND creative_hash = OLD.creative_hash AND ad_count <= 0;
+        END
+    ''',
+}
+
+
+def create_rollup_triggers(conn):
+    for sql in ROLLUP_TRIGGERS.values():
+        conn.execute(sql)
+
+
+def drop_rollup_triggers(conn):
+    # For bulk loads; follow with create_rollup_triggers and rebuild_ad_rollups
+    for name in ROLLUP_TRIGGERS:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+# Both take an (id > ?, id <= ?) window of vast_ads, and are formatted with
+# an extra row condition (empty, or ROLLUP_HOT_MONTH_SQL).
+AD_ROLLUPS_AGGREGATE_SQL = f'''
+    INSERT INTO ad_rollups_hourly (hour, channel_name, adomain, ad_count, wrapped_count)
+    SELECT {ROLLUP_KEY_SQL.format(row='vast_ads')}, COUNT(*), SUM(COALESCE(wrapped_ad, 0))
+    FROM vast_ads
+    WHERE id > ? AND id <= ? AND created_at IS NOT NULL {{extra}}
+    GROUP BY 1, 2, 3
+    ON CONFLICT (hour, channel_name, adomain) DO UPDATE SET
+        ad_count = ad_count + excluded.ad_count,
+        wrapped_count = wrapped_count + excluded.wrapped_count
+'''
+
+AD_ROLLUP_CREATIVES_AGGREGATE_SQL = f'''
+    INSERT INTO ad_rollup_creatives (hour, channel_name, adomain, creative_hash, ad_count)
+    SELECT {ROLLUP_KEY_SQL.format(row='vast_ads')}, creative_hash, COUNT(*)
+    FROM vast_ads
+    WHERE id > ? AND id <= ? AND created_at IS NOT NULL AND creative_hash IS NOT NULL {{extra}}
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (hour, channel_name, adomain, creative_hash) DO UPDATE SET
+        ad_count = ad_count + excluded.ad_count
+'''
+
+# Months with an archived partition only exist in the rollups now; a rebuild
+# keeps their rows and skips any of their rows still in the hot table.
+ROLLUP_HOT_MONTH_SQL = "AND strftime('%Y-%m', {column}) NOT IN (SELECT partition FROM vast_ads_partitions)"
+
+
+def _backfill_ad_rollups(conn):
+    ceiling = get_ceiling(conn, 'ad_rollups')
+    run_id_batches(conn, 'ad_rollups_hourly', AD_ROLLUPS_AGGREGATE_SQL.format(extra=''), max_id=ceiling)
+    run_id_batches(conn, 'ad_rollup_creatives', AD_ROLLUP_CREATIVES_AGGREGATE_SQL.format(extra=''), max_id=ceiling)
+
+
+def enable_incremental_vacuum(conn):
+    """Switch to incremental auto_vacuum; returns False if it already was.
+
+    An existing file only switches mode during a full VACUUM, which rewrites
+    it under the write lock. `python migrations.py vacuum` runs this.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+def _enable_incremental_vacuum(conn):
+    # Lets purges hand freed pages back with PRAGMA incremental_vacuum. Only
+    # small files are vacuumed here, since migrations run at startup; larger
+    # ones wait for an operator to run `python migrations.py vacuum`.
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    if page_count * page_size <= AUTO_VACUUM_MAX_BYTES:
+        enable_incremental_vacuum(conn)
+    elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        print("⚠️ Run `python migrations.py vacuum` off-peak to let purges return space to the OS.")
+
+
+def _add_wrapper_chain(conn):
+    # Older rows keep NULLs; only wrapped_ad says whether they were wrapped
+    existing = set(table_columns(conn, 'vast_ads'))
+    for name, ddl in [('wrapper_chain', 'TEXT'), ('wrapper_count', 'INTEGER')]:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE vast_ads ADD COLUMN {name} {ddl}")
+
+
+def _create_dataset_watermarks(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS dataset_watermarks (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL,
+            row_count INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _create_sweeps(conn):
+    # Registry of recurring tag sweeps and their run history. Times are UTC
+    # 'YYYY-MM-DD HH:MM:SS' like CURRENT_TIMESTAMP; next_slot_at is the
+    # un-jittered schedule slot, next_run_at adds the jitter.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sweep_tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            url TEXT NOT NULL,
+            interval_seconds INTEGER NOT NULL,
+            calls_per_run INTEGER NOT NULL DEFAULT 1,
+            jitter_seconds INTEGER NOT NULL DEFAULT 0,
+            runs_remaining INTEGER,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            next_slot_at TIMESTAMP,
+            next_run_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sweep_tags_due ON sweep_tags(enabled, next_run_at)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sweep_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tag_id INTEGER NOT NULL,
+            job_id TEXT,
+            scheduled_for TIMESTAMP,
+            catch_up INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL,
+            calls INTEGER,
+            ok_calls INTEGER,
+            empty_calls INTEGER,
+            error_calls INTEGER,
+            avg_call_ms REAL,
+            max_call_ms REAL,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sweep_runs_tag ON sweep_runs(tag_id, id)")
+
+
+def _create_media_probes(conn):
+    # Cached MediaFile health, one row per URL; see media_probe.py
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS media_probes (
+            url TEXT PRIMARY KEY,
+            host TEXT,
+            status TEXT NOT NULL,
+            http_status INTEGER,
+            content_type TEXT,
+            size INTEGER,
+            latency_ms REAL,
+            error TEXT,
+            probed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_media_probes_expires_at ON media_probes(expires_at)")
+
+
+def _keep_archived_rollups(conn):
+    # Recreate the delete trigger so archiving no longer subtracts from the rollups
+    conn.execute("DROP TRIGGER IF EXISTS trg_vast_ads_rollup_delete")
+    create_rollup_triggers(conn)
+
+
+def _add_sweep_run_due_at(conn):
+    # Catch-up runs wait as 'deferred' rows until due_at instead of firing together
+    if 'due_at' not in table_columns(conn, 'sweep_runs'):
+        conn.execute("ALTER TABLE sweep_runs ADD COLUMN due_at TIMESTAMP")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sweep_runs_deferred ON sweep_runs(due_at) WHERE status = 'deferred'")
+
+
+
+def _create_jobs(conn):
+    # Background jobs and their calls, so any worker can report on them and
+    # a restart leaves a record; see jobs.py. owner is 'hostname:pid'.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL DEFAULT 'ingest',
+            url TEXT,
+            host TEXT,
+            owner TEXT,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS job_calls (
+            job_id TEXT NOT NULL,
+            call_number INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            message TEXT,
+            duration_ms REAL,
+            started_at TIMESTAMP,
+            PRIMARY KEY (job_id, call_number)
+        ) WITHOUT ROWID
+    ''')
+
+
+MIGRATIONS = [
+    Migration(1, 'create vast_ads', _create_vast_ads, True),
+    Migration(2, 'add columns missing from the init_db.py schema', _add_parser_columns, True),
+    Migration(3, 'backfill creative_hash for legacy rows', _backfill_creative_hash, False),
+    Migration(4, 'index ad_id, creative_hash and created_at', _add_lookup_indexes, True),
+    Migration(5, 'catalog of archived vast_ads partitions', _create_partition_catalog, True),
+    Migration(6, 'wrapper to final creative reconciliation index', _create_creative_map, True),
+    Migration(7, 'backfill creative_map from wrapped rows', _backfill_creative_map, False),
+    Migration(8, 'per-stage VAST call timings', _create_call_metrics, True),
+    Migration(9, 'deduplicated creatives and their occurrences', _create_creatives, True),
+    Migration(10, 'backfill creatives and creative_occurrences', _backfill_creatives, False),
+    Migration(11, 'hourly channel x adomain rollups and their triggers', _create_ad_rollups, True),
+    Migration(12, 'backfill ad rollups', _backfill_ad_rollups, False),
+    Migration(13, 'switch small files to incremental auto_vacuum', _enable_incremental_vacuum, False),
+    Migration(14, 'record the wrapper chain walked for each ad', _add_wrapper_chain, True),
+    Migration(15, 'watermarks for incremental dataset exports', _create_dataset_watermarks, True),
+    Migration(16, 'scheduled tag sweeps and their run history', _create_sweeps, True),
+    Migration(17, 'cached media file probe results', _create_media_probes, True),
+    Migration(18, 'keep archived months in the ad rollups', _keep_archived_rollups, True),
+    Migration(19, 'spread sweep catch-up runs over the interval', _add_sweep_run_due_at, True),
+    Migration(20, 'background jobs and their calls', _create_jobs, True),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+# --- Derived-table rebuilds ------------------------------------------------
+# For bulk loads that bypass parse_vast_and_store (e.g. the synthetic
+# generator). Each runs in one transaction.
+
+def rebuild_creative_map(conn):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute("DELETE FROM creative_map")
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vast_ads").fetchone()[0]
+        for kind in ('creative_id', 'ssai_creative_id'):
+            conn.execute(CREATIVE_MAP_AGGREGATE_SQL.format(kind=kind), (0, max_id))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def rebuild_creatives(conn):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute("DELETE FROM creatives")
+        conn.execute("DELETE FROM creative_occurrences")
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vast_ads").fetchone()[0]
+        conn.execute(CREATIVES_AGGREGATE_SQL, (0, max_id))
+        conn.execute(CREATIVE_OCCURRENCES_COPY_SQL, (0, max_id))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def rebuild_ad_rollups(conn):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        hot_hours = ROLLUP_HOT_MONTH_SQL.format(column='hour')
+        conn.execute(f"DELETE FROM ad_rollups_hourly WHERE 1 {hot_hours}")
+        conn.execute(f"DELETE FROM ad_rollup_creatives WHERE 1 {hot_hours}")
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vast_ads").fetchone()[0]
+        hot_rows = ROLLUP_HOT_MONTH_SQL.format(column='created_at')
+        conn.execute(AD_ROLLUPS_AGGREGATE_SQL.format(extra=hot_rows), (0, max_id))
+        conn.execute(AD_ROLLUP_CREATIVES_AGGREGATE_SQL.format(extra=hot_rows), (0, max_id))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+
+def rebuild_derived_tables(conn):
+    rebuild_creative_map(conn)
+    rebuild_creatives(conn)
+    rebuild_ad_rollups(conn)
+
+
+# --- Runner ----------------------------------------------------------------
+
+def current_version(conn):
+    conn.execute(SCHEMA_VERSION_SQL)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def pending_migrations(conn):
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def _record(conn, migration, started):
+    conn.execute(
+        "INSERT OR IGNORE INTO schema_version (version, description, duration_ms) VALUES (?, ?, ?)",
+        (migration.version, migration.description, int((time.time() - started) * 1000))
+    )
+
+
+def migrate(conn, target=None, verbose=False):
+    """Apply pending migrations in order, up to `target` (default: latest).
+
+    Safe to call from several processes at once: each transactional step
+    re-checks the version under the write lock, and batched steps are
+    idempotent. Expects an autocommit connection (isolation_level=None).
+    Returns the list of versions applied by this call.
+    """
+    applied = []
+    for migration in pending_migrations(conn):
+        if target is not None and migration.version > target:
+            break
+        started = time.time()
+        if verbose:
+            print(f"→ Migration {migration.version}: {migration.description}")
+        if migration.transactional:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                if current_version(conn) >= migration.version:
+                    conn.execute('ROLLBACK')
+                    continue
+                migration.apply(conn)
+                _record(conn, migration, started)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        else:
+            migration.apply(conn)
+            _record(conn, migration, started)
+        applied.append(migration.version)
+    return applied
+
+
+def check_schema(conn, auto_migrate=True):
+    """Startup check: migrate if allowed, otherwise warn about pending steps."""
+    if auto_migrate:
+        applied = migrate(conn)
+        if applied:
+            print(f"✅ Applied schema migrations: {', '.join(str(v) for v in applied)}")
+        return []
+    pending = pending_migrations(conn)
+    if pending:
+        print(f"⚠️ Schema is at version {current_version(conn)}, {len(pending)} migration(s) pending. "
+              f"Run `python migrations.py upgrade`.")
+    return pending
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Manage the vast_ads schema version.')
+    ap.add_argument('command', choices=['status', 'upgrade', 'vacuum'])
+    ap.add_argument('--db', default=DB_PATH)
+    ap.add_argument('--target', type=int, default=None, help='stop after this version')
+    args = ap.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30, isolation_level=None, check_same_thread=False)
+    if args.command == 'status':
+        print(f"Schema version: {current_version(conn)} (latest {LATEST_VERSION})")
+        for m in pending_migrations(conn):
+            print(f"  pending {m.version}: {m.description}")
+    elif args.command == 'vacuum':
+        started = time.time()
+        if enable_incremental_vacuum(conn):
+            print(f"✅ Switched to incremental auto_vacuum in {time.time() - started:.1f}s.")
+        else:
+            print("Already using incremental auto_vacuum.")
+    else:
+        applied = migrate(conn, target=args.target, verbose=True)
+        print(f"✅ Schema at version {current_version(conn)} ({len(applied)} applied).")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
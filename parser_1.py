@@ -3,41 +3,43 @@ import requests
 from lxml import etree
 import json
 from urllib.parse import urlparse, parse_qs
-import hashlib
+import os
+import time
+from collections import namedtuple
+from migrations import check_schema, make_creative_hash
+from metrics import new_trace, span, save_trace, inc, observe, BYTES_BUCKETS, prune_call_metrics_in_background
+import host_guard
+import media_probe
 
 DB_PATH = 'vast_ads.db'
 
-CREATE_TABLE_SQL = '''
-CREATE TABLE IF NOT EXISTS vast_ads (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    call_number INTEGER,
-    ad_id TEXT,
-    creative_id TEXT,
-    ssai_creative_id TEXT,
-    title TEXT,
-    duration TEXT,
-    clickthrough TEXT,
-    media_urls TEXT,
-    channel_name TEXT,
-    adomain TEXT,
-    creative_hash TEXT,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    ad_xml TEXT,
-    wrapped_ad INTEGER DEFAULT 0,
-    initial_metadata_json TEXT
-)
-'''
+# Set AUTO_MIGRATE=0 on large databases to run `python migrations.py upgrade`
+# out of band; startup then only reports pending migrations.
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', '1') != '0'
+
+# The serialized inline XML is kept only once per creative_hash in
+# `creatives` (the first occurrence's) rather than on every vast_ads row;
+# DEDUP_AD_XML=0 keeps the per-row copy as well.
+DEDUP_AD_XML = os.environ.get('DEDUP_AD_XML', '1') == '1'
+
+# Fetch span statuses for requests host_guard refused to send
+GUARD_REJECTIONS = ('circuit_open', 'rate_limited')
+
+# vast_ads.wrapper_chain is the wrapper hosts joined with this, outermost first
+WRAPPER_CHAIN_SEPARATOR = ' > '
+
+# The vast_ads schema is owned by migrations.py.
 
 def setup_db():
     conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
-    cur = conn.cursor()
-    cur.execute(CREATE_TABLE_SQL)
-    conn.commit()
-    conn.close()
-
-def make_creative_hash(*fields):
-    base = ':'.join([str(f) if f else '' for f in fields])
-    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+    try:
+        pending = check_schema(conn, auto_migrate=AUTO_MIGRATE)
+    finally:
+        conn.close()
+    if pending:
+        # Ingestion writes tables and columns the pending steps create
+        raise RuntimeError(f"{DB_PATH} needs schema migrations {', '.join(str(m.version) for m in pending)} "
+                           f"before VAST calls can be stored; run `python migrations.py upgrade`.")
 
 def get_ssai_creative_id(ad_element):
     ssai = ad_element.xpath('.//Extensions/Extension[@type="FreeWheel"]/SSAICreativeId')
@@ -49,72 +51,224 @@ def get_ssai_creative_id(ad_element):
         return value
     return None
 
-def fetch_and_parse_vast(url, headers, max_depth=5, visited=None, is_wrapped=False):
-    import json as _json
+def extract_ad_metadata(ad):
+    ad_id = ad.get("id", "N/A")
+    # smart_strings=False: lxml's default text results keep a reference to
+    # their element, and so to the whole document
+    title = ad.xpath(".//AdTitle/text()", smart_strings=False)
+    duration = ad.xpath(".//Duration/text()", smart_strings=False)
+    click_url = ad.xpath(".//ClickThrough/text()", smart_strings=False)
+    creative_id = ad.xpath(".//Creative/@id", smart_strings=False)
+    creative_id = creative_id[0] if creative_id else None
+    media_files = ad.xpath(".//MediaFile")
+    media_urls = [mf.text.strip() for mf in media_files if mf.text]
+    ssai_creative_id = get_ssai_creative_id(ad)
+    adomain = None
+    adomain_nodes = ad.xpath('.//AdVerifications/Verification/AdVerificationParameters/Adomain/text()',
+                             smart_strings=False)
+    if not adomain_nodes:
+        adomain_nodes = ad.xpath('.//Extension[@type="advertiser"]/Adomain/text()', smart_strings=False)
+    if not adomain_nodes:
+        adomain_nodes = ad.xpath('.//Advertiser/text()', smart_strings=False)
+    adomain = adomain_nodes[0] if adomain_nodes else None
+    creative_hash = make_creative_hash(ssai_creative_id, creative_id, ','.join(media_urls), adomain if adomain else '')
+    return {
+        "ad_id": ad_id,
+        "creative_id": creative_id,
+        "ssai_creative_id": ssai_creative_id,
+        "title": title[0] if title else None,
+        "duration": duration[0] if duration else None,
+        "clickthrough": click_url[0] if click_url else None,
+        "media_urls": media_urls,
+        "adomain": adomain,
+        "creative_hash": creative_hash
+    }
+
+# One resolved inline ad, detached from the lxml tree it came from.
+# `initial_metadata` is the outermost wrapper's extract_ad_metadata() dict
+# (the ad's own for unwrapped ads); `wrapper_chain` holds the host of each
+# wrapper document walked, outermost first; `ad_xml` is only filled when
+# requested.
+AdRecord = namedtuple('AdRecord', [
+    'ad_id', 'creative_id', 'ssai_creative_id', 'title', 'duration', 'clickthrough', 'media_urls',
+    'adomain', 'creative_hash', 'ad_xml', 'wrapped', 'initial_metadata', 'wrapper_chain',
+])
+
+def _extract_steps(tree, is_wrapped, with_xml):
+    """Everything needed from one VAST document, in ad order.
+
+    Inline ads become AdRecords; wrappers become (tag URI, their metadata)
+    to follow later. Only plain strings are returned, so no element of the
+    tree is still referenced once this returns.
+    """
+    steps = []
+    for ad in tree.iter('Ad'):
+        meta = extract_ad_metadata(ad)
+        wrapper = ad.find("Wrapper")
+        if wrapper is not None:
+            vast_ad_tag_uri = wrapper.findtext("VASTAdTagURI")
+            if vast_ad_tag_uri:
+                steps.append((vast_ad_tag_uri.strip(), meta))
+        else:
+            ad_xml = etree.tostring(ad, pretty_print=True, encoding='unicode') if with_xml else None
+            steps.append((None, AdRecord(ad_xml=ad_xml, wrapped=is_wrapped, initial_metadata=meta,
+                                         wrapper_chain=(), **meta)))
+    return steps
+
+def fetch_and_parse_vast(url, headers, max_depth=5, visited=None, is_wrapped=False, trace=None, depth=0,
+                         with_xml=False):
+    """Resolve a VAST tag through its wrappers into a list of AdRecords.
+
+    Each document is parsed, extracted and released before the next hop is
+    fetched, so only compact records survive. Pass with_xml=True to keep
+    each inline <Ad> serialized in `ad_xml`.
+    """
     if visited is None:
         visited = set()
     if url in visited or max_depth <= 0:
-        return [], None, None
+        return []
     visited.add(url)
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-    except Exception:
-        return [], None, None
+    host = urlparse(url).netloc
+    allowed, reason, timeout = host_guard.acquire(host, max_timeout=10)
+    if not allowed:
+        # Fail fast: the host is tripped or over its rate budget
+        inc('vast_fetch_total', host=host, status=reason)
+        if trace is not None:
+            trace['spans'].append({'stage': 'fetch', 'host': host, 'depth': depth, 'url': url,
+                                   'status': reason, 'duration_ms': 0.0})
+        return []
+    with span(trace, 'fetch', host=host, depth=depth, url=url) as s:
+        started = time.perf_counter()
+        try:
+            response = requests.get(url, headers=headers, timeout=timeout)
+            s['status'] = response.status_code
+            s['bytes'] = len(response.content)
+        except Exception:
+            s['status'] = 'error'
+        host_guard.record(host, time.perf_counter() - started, ok=s['status'] != 'error' and s['status'] < 500)
+    inc('vast_fetch_total', host=host, status=s['status'])
+    if s['status'] == 'error':
+        return []
+    observe('vast_fetch_bytes', s['bytes'], buckets=BYTES_BUCKETS, host=host)
     if response.status_code != 200 or not response.content.strip():
-        return [], None, None
+        return []
     parser = etree.XMLParser(recover=True)
-    try:
-        tree = etree.fromstring(response.content, parser=parser)
-    except etree.XMLSyntaxError:
-        return [], None, None
-    ads = tree.xpath("//Ad")
-    initial_metadata = []
-    for ad in ads:
-        ad_id = ad.get("id", "N/A")
-        title = ad.xpath(".//AdTitle/text()")
-        duration = ad.xpath(".//Duration/text()")
-        click_url = ad.xpath(".//ClickThrough/text()")
-        creative_id = ad.xpath(".//Creative/@id")
-        creative_id = creative_id[0] if creative_id else None
-        media_files = ad.xpath(".//MediaFile")
-        media_urls = [mf.text.strip() for mf in media_files if mf.text]
-        ssai_creative_id = get_ssai_creative_id(ad)
-        adomain = None
-        adomain_nodes = ad.xpath('.//AdVerifications/Verification/AdVerificationParameters/Adomain/text()')
-        if not adomain_nodes:
-            adomain_nodes = ad.xpath('.//Extension[@type="advertiser"]/Adomain/text()')
-        if not adomain_nodes:
-            adomain_nodes = ad.xpath('.//Advertiser/text()')
-        adomain = adomain_nodes[0] if adomain_nodes else None
-        creative_hash = make_creative_hash(ssai_creative_id, creative_id, ','.join(media_urls), adomain if adomain else '')
-        meta = {
-            "ad_id": ad_id,
-            "creative_id": creative_id,
-            "ssai_creative_id": ssai_creative_id,
-            "title": title[0] if title else None,
-            "duration": duration[0] if duration else None,
-            "clickthrough": click_url[0] if click_url else None,
-            "media_urls": media_urls,
-            "adomain": adomain,
-            "creative_hash": creative_hash
-        }
-        initial_metadata.append(meta)
+    with span(trace, 'parse', host=host, depth=depth) as s:
+        try:
+            tree = etree.fromstring(response.content, parser=parser)
+        except etree.XMLSyntaxError:
+            s['status'] = 'error'
+            tree = None
+    del response
+    if tree is None:
+        return []
+    with span(trace, 'extract', host=host, depth=depth):
+        steps = _extract_steps(tree, is_wrapped, with_xml)
+    # Nothing from the document outlives _extract_steps, so this frees it
+    del tree
     final_ads = []
-    for idx, ad in enumerate(ads):
-        wrapper = ad.find("Wrapper")
-        if wrapper is not None:
-            vast_ad_tag_uri = wrapper.findtext("VASTAdTagURI")
-            if vast_ad_tag_uri:
-                child_ads, _, child_initial = fetch_and_parse_vast(vast_ad_tag_uri.strip(), headers, max_depth-1, visited, is_wrapped=True)
-                for c in child_ads:
-                    final_ads.append((c[0], True, _json.dumps(initial_metadata[idx] if idx < len(initial_metadata) else {})))
-        else:
-            final_ads.append((ad, is_wrapped, _json.dumps(initial_metadata[idx] if idx < len(initial_metadata) else {})))
-    return final_ads, response.content.decode(errors='replace'), initial_metadata
+    for child_url, item in steps:
+        if child_url is None:
+            final_ads.append(item)
+            continue
+        child_ads = fetch_and_parse_vast(child_url, headers, max_depth-1, visited, is_wrapped=True, trace=trace,
+                                         depth=depth+1, with_xml=with_xml)
+        # Record the outermost wrapper's ids against every inline ad it led to
+        final_ads.extend(c._replace(wrapped=True, initial_metadata=item, wrapper_chain=(host,) + c.wrapper_chain)
+                         for c in child_ads)
+    return final_ads
+
+UPSERT_CREATIVE_MAP_SQL = '''
+    INSERT INTO creative_map (
+        wrapper_id, id_kind, final_creative_id, final_ssai_creative_id, final_creative_hash, hit_count
+    )
+    VALUES (?, ?, ?, ?, ?, 1)
+    ON CONFLICT (wrapper_id, id_kind, final_creative_id, final_ssai_creative_id) DO UPDATE SET
+        hit_count = hit_count + 1,
+        final_creative_hash = excluded.final_creative_hash,
+        last_seen = CURRENT_TIMESTAMP
+'''
+
+def record_creative_mapping(cur, initial_metadata, creative_id, ssai_creative_id, creative_hash):
+    # Map the outermost wrapper's ids to the inline creative they resolved to
+    for kind in ('creative_id', 'ssai_creative_id'):
+        wrapper_id = initial_metadata.get(kind)
+        if wrapper_id:
+            cur.execute(UPSERT_CREATIVE_MAP_SQL, (
+                wrapper_id, kind, creative_id or '', ssai_creative_id or '', creative_hash
+            ))
+
+def lookup_creative_mapping(cur, wrapper_id, id_kind='creative_id'):
+    cur.execute('''
+        SELECT final_creative_id, final_ssai_creative_id, final_creative_hash, hit_count, first_seen, last_seen
+        FROM creative_map
+        WHERE wrapper_id = ? AND id_kind = ?
+        ORDER BY hit_count DESC, last_seen DESC
+    ''', (wrapper_id, id_kind))
+    columns = ['final_creative_id', 'final_ssai_creative_id', 'final_creative_hash', 'hit_count', 'first_seen', 'last_seen']
+    return [dict(zip(columns, r)) for r in cur.fetchall()]
+
+UPSERT_CREATIVE_SQL = '''
+    INSERT INTO creatives (
+        creative_hash, creative_id, ssai_creative_id, title, duration, clickthrough, media_urls, adomain,
+        ad_xml, occurrence_count
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT (creative_hash) DO UPDATE SET
+        occurrence_count = occurrence_count + 1,
+        ad_xml = COALESCE(ad_xml, excluded.ad_xml),
+        last_seen = CURRENT_TIMESTAMP
+'''
+
+def store_call(cur, call_number, channel_name, ads, trace):
+    """Write one call's ads, creatives, creative mappings and timings in a single transaction."""
+    cur.execute('BEGIN IMMEDIATE')
+    try:
+        for ad in ads:
+            media_urls = json.dumps(ad.media_urls)
+            cur.execute("""
+                INSERT INTO vast_ads (
+                    call_number, ad_id, creative_id, ssai_creative_id, title, duration, clickthrough, media_urls,
+                    channel_name, adomain, creative_hash, ad_xml, wrapped_ad, initial_metadata_json,
+                    wrapper_chain, wrapper_count
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                call_number, ad.ad_id, ad.creative_id, ad.ssai_creative_id, ad.title, ad.duration, ad.clickthrough,
+                media_urls, channel_name, ad.adomain, ad.creative_hash, None if DEDUP_AD_XML else ad.ad_xml,
+                int(ad.wrapped), json.dumps(ad.initial_metadata),
+                WRAPPER_CHAIN_SEPARATOR.join(ad.wrapper_chain), len(ad.wrapper_chain)
+            ))
+            cur.execute(
+                "INSERT INTO creative_occurrences (id, creative_hash, call_number, ad_id, channel_name, wrapped_ad) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cur.lastrowid, ad.creative_hash, call_number, ad.ad_id, channel_name, int(ad.wrapped))
+            )
+            cur.execute(UPSERT_CREATIVE_SQL, (
+                ad.creative_hash, ad.creative_id, ad.ssai_creative_id, ad.title, ad.duration, ad.clickthrough,
+                media_urls, ad.adomain, ad.ad_xml
+            ))
+            if ad.wrapped:
+                record_creative_mapping(cur, ad.initial_metadata, ad.creative_id, ad.ssai_creative_id, ad.creative_hash)
+        save_trace(cur, trace)
+        cur.execute('COMMIT')
+    except Exception:
+        cur.execute('ROLLBACK')
+        raise
 
 def parse_vast_and_store(url, call_number):
+    return parse_vast_call(url, call_number)[1]
+
+def parse_vast_call(url, call_number):
+    """Fetch, resolve and store one call; returns (call_status, message).
+
+    call_status is 'ok', 'no_ads' or one of GUARD_REJECTIONS, as recorded on
+    the call's 'call' span; the message is for display only.
+    """
     conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
     cur = conn.cursor()
+    trace = new_trace(url)
+    call_started = time.perf_counter()
 
     headers = {
         "User-Agent": "Roku/DVP-14.5 (14.5.4.5934-46)"
@@ -126,71 +280,66 @@ def parse_vast_and_store(url, call_number):
     csid_parts = csid.split("/")
     channel_name = csid_parts[1] if len(csid_parts) >= 2 else None
 
-    ads, last_xml, _ = fetch_and_parse_vast(url, headers)
-    if not ads:
-        conn.close()
-        return f"❌ No valid Inline ads found."
-
-    for ad, wrapped_flag, initial_metadata_json in ads:
-        ad_id = ad.get("id", "N/A")
-        title = ad.xpath(".//AdTitle/text()")
-        duration = ad.xpath(".//Duration/text()")
-        click_url = ad.xpath(".//ClickThrough/text()")
-        creative_id = ad.xpath(".//Creative/@id")
-        creative_id = creative_id[0] if creative_id else None
-        media_files = ad.xpath(".//MediaFile")
-        media_urls = [mf.text.strip() for mf in media_files if mf.text]
-
-        ssai_creative_id = get_ssai_creative_id(ad)
-
-        adomain = None
-        adomain_nodes = ad.xpath('.//AdVerifications/Verification/AdVerificationParameters/Adomain/text()')
-        if not adomain_nodes:
-            adomain_nodes = ad.xpath('.//Extension[@type="advertiser"]/Adomain/text()')
-        if not adomain_nodes:
-            adomain_nodes = ad.xpath('.//Advertiser/text()')
-        adomain = adomain_nodes[0] if adomain_nodes else None
+    ads = fetch_and_parse_vast(url, headers, trace=trace, with_xml=True)
+
+    for i, ad in enumerate(ads):
+        adomain = ad.adomain
+        click_url = ad.clickthrough
 
         # --- NEW: If no adomain, follow clickthrough and get domain ---
-        if adomain is None and click_url and click_url[0]:
-            try:
-                resp = requests.get(click_url[0], headers=headers, timeout=5, allow_redirects=True)
-                final_url = resp.url
-                adomain = urlparse(final_url).netloc
-            except Exception:
-                adomain = None
+        click_host = urlparse(click_url).netloc if click_url else None
+        allowed = False
+        if adomain is None and click_url:
+            allowed, reason, timeout = host_guard.acquire(click_host, max_timeout=5)
+        if allowed:
+            with span(trace, 'clickthrough', host=click_host, url=click_url) as s:
+                started = time.perf_counter()
+                try:
+                    resp = requests.get(click_url, headers=headers, timeout=timeout, allow_redirects=True)
+                    s['status'] = resp.status_code
+                    final_url = resp.url
+                    adomain = urlparse(final_url).netloc
+                except Exception:
+                    s['status'] = 'error'
+                    adomain = None
+                host_guard.record(click_host, time.perf_counter() - started, ok=s['status'] != 'error' and s['status'] < 500)
         # -------------------------------------------------------------
 
-        creative_hash = make_creative_hash(ssai_creative_id, creative_id, ','.join(media_urls), adomain if adomain else '')
+        if adomain != ad.adomain:
+            ads[i] = ad._replace(adomain=adomain, creative_hash=make_creative_hash(
+                ad.ssai_creative_id, ad.creative_id, ','.join(ad.media_urls), adomain if adomain else ''))
 
-        ad_xml = etree.tostring(ad, pretty_print=True, encoding='unicode')
+    # A call that found nothing because host_guard refused a fetch is not a
+    # genuinely empty response; its 'call' span carries the refusal instead.
+    rejected = [f for f in trace['spans'] if f['stage'] == 'fetch' and f.get('status') in GUARD_REJECTIONS]
+    if ads:
+        call_status = 'ok'
+    elif rejected:
+        call_status = rejected[0]['status']
+    else:
+        call_status = 'no_ads'
 
-        cur.execute("""
-            INSERT INTO vast_ads (
-                call_number, ad_id, creative_id, ssai_creative_id, title, duration, clickthrough, media_urls,
-                channel_name, adomain, creative_hash, ad_xml, wrapped_ad, initial_metadata_json
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            call_number,
-            ad_id,
-            creative_id,
-            ssai_creative_id,
-            title[0] if title else None,
-            duration[0] if duration else None,
-            click_url[0] if click_url else None,
-            json.dumps(media_urls),
-            channel_name,
-            adomain,
-            creative_hash,
-            ad_xml,
-            int(wrapped_flag),
-            initial_metadata_json
-        ))
-
-    conn.commit()
-    conn.close()
-    return f"✅ Parsed and stored {len(ads)} ads."
-
-# Ensure table exists at import
+    # The stored 'call' span covers resolution up to the insert; the insert
+    # itself is only visible in the db_insert histogram.
+    duration = time.perf_counter() - call_started
+    observe('vast_stage_duration_seconds', duration, stage='call')
+    trace['spans'].append({'stage': 'call', 'host': parsed_url.netloc, 'url': url,
+                           'status': call_status, 'duration_ms': duration * 1000.0})
+
+    # All network I/O is done; write the whole call in one short transaction
+    try:
+        with span(trace, 'db_insert'):
+            store_call(cur, call_number, channel_name, ads, trace)
+    finally:
+        conn.close()
+    prune_call_metrics_in_background(DB_PATH)
+    if media_probe.MEDIA_PROBE and ads:
+        media_probe.queue_probes([u for ad in ads for u in ad.media_urls], DB_PATH)
+    if call_status in GUARD_REJECTIONS:
+        return call_status, f"⚠️ Not fetched: {rejected[0]['host']} is {rejected[0]['status'].replace('_', ' ')}."
+    if not ads:
+        return call_status, "❌ No valid Inline ads found."
+    return call_status, f"✅ Parsed and stored {len(ads)} ads."
+
+# Ensure schema is current at import
 setup_db()
@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from migrations import migrate, run_batched, table_columns
+from metrics import prune_call_metrics
+
+DB_PATH = 'vast_ads.db'
+
+# vast_ads is the hot partition. Whole months older than RETENTION_DAYS are
+# moved to one compressed Parquet file per month under ARCHIVE_DIR and
+# catalogued in vast_ads_partitions so queries can prune them by created_at.
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+RETENTION_DAYS = int(os.environ.get('RETENTION_DAYS', 90))
+ARCHIVE_CHUNK_ROWS = 50000
+PARQUET_COMPRESSION = 'zstd'
+
+
+def _arrow_schema(conn):
+    import pyarrow as pa
+    types = {}
+    for _, name, decl, *_ in conn.execute("PRAGMA table_info(vast_ads)"):
+        types[name] = pa.int64() if decl.upper().startswith('INTEGER') else pa.string()
+    return pa.schema(list(types.items()))
+
+
+def _month_bounds(month):
+    start = datetime.strptime(month, '%Y-%m')
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def retention_cutoff(retention_days=RETENTION_DAYS, now=None):
+    """First instant of the oldest month that must stay in the hot table."""
+    now = now or datetime.utcnow()
+    return (now - timedelta(days=retention_days)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _delete_archived_rows(conn, entry):
+    # Rows are only deleted once their Parquet file is catalogued, so this is
+    # also how an archive run interrupted between the two steps is resumed.
+    start, end = _month_bounds(entry['partition'])
+    return run_batched(conn, '''
+        DELETE FROM vast_ads WHERE id IN (
+            SELECT id FROM vast_ads
+            WHERE created_at >= ? AND created_at < ? AND id BETWEEN ? AND ?
+            LIMIT ?
+        )
+    ''', (start, end, entry['min_id'], entry['max_id']))
+
+
+def _write_partition(conn, month, archive_dir):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    start, end = _month_bounds(month)
+    max_id = conn.execute(
+        "SELECT MAX(id) FROM vast_ads WHERE created_at >= ? AND created_at < ?", (start, end)
+    ).fetchone()[0]
+    if max_id is None:
+        return None
+    os.makedirs(archive_dir, exist_ok=True)
+    existing = conn.execute("SELECT COUNT(*) FROM vast_ads_partitions WHERE partition = ?", (month,)).fetchone()[0]
+    # Late-arriving rows for an already archived month get their own part file.
+    path = os.path.join(archive_dir, f"vast_ads_{month}.part{existing}.parquet")
+    tmp_path = path + '.tmp'
+
+    schema = _arrow_schema(conn)
+    entry = {'path': path, 'partition': month, 'row_count': 0, 'min_id': None, 'max_id': max_id,
+             'min_created_at': None, 'max_created_at': None}
+    writer = pq.ParquetWriter(tmp_path, schema, compression=PARQUET_COMPRESSION)
+    try:
+        chunks = pd.read_sql_query(
+            "SELECT * FROM vast_ads WHERE created_at >= ? AND created_at < ? AND id <= ? ORDER BY id",
+            conn, params=(start, end, max_id), chunksize=ARCHIVE_CHUNK_ROWS
+        )
+        for df in chunks:
+            writer.write_table(pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False))
+            entry['row_count'] += len(df)
+            entry['min_id'] = int(df['id'].iloc[0]) if entry['min_id'] is None else entry['min_id']
+            lo, hi = df['created_at'].min(), df['created_at'].max()
+            entry['min_created_at'] = lo if entry['min_created_at'] is None else min(entry['min_created_at'], lo)
+            entry['max_created_at'] = hi if entry['max_created_at'] is None else max(entry['max_created_at'], hi)
+    finally:
+        writer.close()
+    os.replace(tmp_path, path)
+    conn.execute('''
+        INSERT INTO vast_ads_partitions (path, partition, row_count, min_id, max_id, min_created_at, max_created_at)
+        VALUES (:path, :partition, :row_count, :min_id, :max_id, :min_created_at, :max_created_at)
+    ''', entry)
+    return entry
+
+
+def archive_old_partitions(conn, retention_days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR):
+    """Move every whole month older than the retention window to Parquet.
+
+    Safe to re-run at any time; returns the catalog entries written.
+    """
+    cur = conn.execute("SELECT path, partition, min_id, max_id FROM vast_ads_partitions")
+    for path, month, min_id, max_id in cur.fetchall():
+        _delete_archived_rows(conn, {'partition': month, 'min_id': min_id, 'max_id': max_id})
+
+    cutoff = retention_cutoff(retention_days).strftime('%Y-%m-%d %H:%M:%S')
+    months = [r[0] for r in conn.execute(
+        "SELECT DISTINCT strftime('%Y-%m', created_at) FROM vast_ads WHERE created_at < ? ORDER BY 1", (cutoff,)
+    ) if r[0]]
+    written = []
+    for month in months:
+        entry = _write_partition(conn, month, archive_dir)
+        if entry:
+            _delete_archived_rows(conn, entry)
+            written.append(entry)
+            print(f"✅ Archived {entry['row_count']} rows for {month} to {entry['path']}")
+    return written
+
+
+def _overlapping_partitions(conn, start=None, end=None):
+    sql = "SELECT path FROM vast_ads_partitions WHERE 1=1"
+    params = []
+    if start:
+        sql += " AND max_created_at >= ?"
+        params.append(start)
+    if end:
+        sql += " AND min_created_at < ?"
+        params.append(end)
+    return [r[0] for r in conn.execute(sql + " ORDER BY min_created_at", params)]
+
+
+def load_rows(conn, start=None, end=None, columns=None, include_hot=True):
+    """Rows from the hot table and every archived partition overlapping [start, end).
+
+    Partitions whose catalogued created_at range falls outside the window are
+    never opened. `start`/`end` use the SQLite 'YYYY-MM-DD HH:MM:SS' format.
+    """
+    columns = columns or table_columns(conn, 'vast_ads')
+    frames = []
+    paths = _overlapping_partitions(conn, start, end)
+    if paths:
+        filters = []
+        if start:
+            filters.append(('created_at', '>=', start))
+        if end:
+            filters.append(('created_at', '<', end))
+        import pyarrow.parquet as pq
+        for path in paths:
+            # Files written before a later migration lack its columns.
+            present = [c for c in columns if c in pq.read_schema(path).names]
+            df = pd.read_parquet(path, columns=present, filters=filters or None)
+            frames.append(df.reindex(columns=columns))
+    if include_hot:
+        where, params = [], []
+        if start:
+            where.append("created_at >= ?")
+            params.append(start)
+        if end:
+            where.append("created_at < ?")
+            params.append(end)
+        where_clause = f"WHERE {' AND '.join(where)}" if where else ''
+        frames.append(pd.read_sql_query(f"SELECT {', '.join(columns)} FROM vast_ads {where_clause}", conn, params=params))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Archive and inspect vast_ads time partitions.')
+    ap.add_argument('command', choices=['archive', 'list'])
+    ap.add_argument('--db', default=DB_PATH)
+    ap.add_argument('--retention-days', type=int, default=RETENTION_DAYS)
+    ap.add_argument('--archive-dir', default=ARCHIVE_DIR)
+    args = ap.parse_args()
+
+    conn = sqlite3.connect(args.db, timeout=30, isolation_level=None, check_same_thread=False)
+    migrate(conn)
+    if args.command == 'archive':
+        written = archive_old_partitions(conn, args.retention_days, args.archive_dir)
+        print(f"Archived {len(written)} partition file(s).")
+        print(f"Pruned {prune_call_metrics(conn)} call metric rows.")
+    else:
+        for row in conn.execute("SELECT partition, row_count, min_created_at, max_created_at, path FROM vast_ads_partitions ORDER BY partition"):
+            print(*row, sep='\t')
+        print('hot', *conn.execute("SELECT COUNT(*), MIN(created_at), MAX(created_at) FROM vast_ads").fetchone(), sep='\t')
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import sys
+import time
+import random
+import uuid
+import cProfile
+import functools
+import threading
+from collections import deque, Counter
+
+from flask import g, request, jsonify, send_file
+
+# Opt-in request profiling. With PROFILING unset no hooks are installed at
+# all. When PROFILING=1, a request is profiled if it sends `X-Profile: 1`,
+# has `?_profile=1`, or is picked by PROFILE_SAMPLE_RATE (0.0-1.0).
+#   PROFILE_MODE=cprofile  deterministic, writes .prof (snakeviz, flameprof)
+#   PROFILE_MODE=sample    stack sampler, writes .folded (flamegraph.pl, speedscope)
+PROFILING = os.environ.get('PROFILING', '0') == '1'
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0.0))
+PROFILE_MODE = os.environ.get('PROFILE_MODE', 'cprofile')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+_profiles = deque()
+_profiles_lock = threading.Lock()
+
+
+class _StackSampler:
+    """Samples one thread's Python stack into folded-stack counts."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _wants_profile():
+    return (request.headers.get('X-Profile') == '1'
+            or request.args.get('_profile') == '1'
+            or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE))
+
+
+def _start_profile():
+    if request.path.startswith('/admin/profiles') or not _wants_profile():
+        return
+    if PROFILE_MODE == 'sample':
+        profiler = _StackSampler(threading.get_ident())
+    else:
+        profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is active on this interpreter (e.g. a concurrent request)
+        return
+    g._profile = {'profiler': profiler, 'started': time.perf_counter(), 'started_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def _capture_status(response):
+    if getattr(g, '_profile', None) is not None:
+        g._profile['status'] = response.status_code
+    return response
+
+
+def _finish_profile(exc):
+    state = getattr(g, '_profile', None)
+    if state is None:
+        return
+    g._profile = None
+    state['profiler'].disable()
+    duration_ms = (time.perf_counter() - state['started']) * 1000.0
+    route = request.url_rule.rule if request.url_rule else request.path
+    ext = 'folded' if PROFILE_MODE == 'sample' else 'prof'
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    # Sortable by time; the uuid keeps ids unique across threads and workers
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex}"
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.{ext}")
+    if ext == 'prof':
+        state['profiler'].dump_stats(path)
+    else:
+        state['profiler'].dump(path)
+    entry = {
+        'id': profile_id,
+        'route': route,
+        'method': request.method,
+        'path': request.full_path,
+        'status': state.get('status', 500 if exc else None),
+        'duration_ms': round(duration_ms, 2),
+        'started_at': state['started_at'],
+        'file': path,
+    }
+    with _profiles_lock:
+        _profiles.append(entry)
+        while len(_profiles) > PROFILE_KEEP:
+            old = _profiles.popleft()
+            try:
+                os.remove(old['file'])
+            except OSError:
+                pass
+
+
+def list_profiles():
+    """Slowest retained request profiles first."""
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    with _profiles_lock:
+        entries = sorted(_profiles, key=lambda p: p['duration_ms'], reverse=True)[:limit]
+    return jsonify(entries)
+
+
+def download_profile(profile_id):
+    with _profiles_lock:
+        entry = next((p for p in _profiles if p['id'] == profile_id), None)
+    if entry is None:
+        return 'Profile not found.', 404
+    return send_file(os.path.abspath(entry['file']), as_attachment=True,
+                     download_name=os.path.basename(entry['file']), mimetype='application/octet-stream')
+
+
+def _guarded(view, authorize):
+    # Profiles expose code paths and timings, so they sit behind the admin check
+    @functools.wraps(view)
+    def guarded(*args, **kwargs):
+        if authorize is not None and not authorize():
+            return jsonify({'error': 'Forbidden'}), 403
+        return view(*args, **kwargs)
+    return guarded
+
+
+def init_profiling(app, authorize=None):
+    """Install the hooks and /admin/profiles routes; `authorize()` returning False answers 403."""
+    if not PROFILING:
+        return
+    app.before_request(_start_profile)
+    app.after_request(_capture_status)
+    app.teardown_request(_finish_profile)
+    app.add_url_rule('/admin/profiles', 'admin_profiles', _guarded(list_profiles, authorize))
+    app.add_url_rule('/admin/profiles/<profile_id>', 'admin_profile_download', _guarded(download_profile, authorize))
+    print(f"⚠️ Request profiling enabled ({PROFILE_MODE}, sample rate {PROFILE_SAMPLE_RATE})")
@@ -0,0 +1,161 @@
+import os
+import time
+import json
+import sqlite3
+import argparse
+from datetime import datetime
+
+from migrations import migrate, BACKFILL_BATCH_SIZE, BACKFILL_PAUSE_SECONDS
+
+DB_PATH = 'vast_ads.db'
+
+# Deletes vast_ads rows matching a WHERE clause in short write transactions
+# so ingestion keeps going, adjusting creatives, creative_occurrences and
+# creative_map in the same transaction (the rollups follow via triggers).
+# Freed pages are then returned to the OS with incremental vacuum.
+VACUUM_STEP_PAGES = 2000
+# app.py purges more matching rows than this as a background job
+PURGE_SYNC_MAX_ROWS = int(os.environ.get('PURGE_SYNC_MAX_ROWS', 5000))
+
+PURGE_BATCH_SQL = "CREATE TEMP TABLE IF NOT EXISTS purge_batch (id INTEGER PRIMARY KEY)"
+
+CREATIVES_RELEASE_SQL = '''
+    UPDATE creatives SET occurrence_count = occurrence_count - d.n
+    FROM (
+        SELECT creative_hash, COUNT(*) AS n FROM vast_ads
+        WHERE id IN (SELECT id FROM purge_batch) AND creative_hash IS NOT NULL
+        GROUP BY creative_hash
+    ) AS d
+    WHERE creatives.creative_hash = d.creative_hash
+'''
+
+# Formatted with the wrapper id kind, like CREATIVE_MAP_AGGREGATE_SQL
+CREATIVE_MAP_RELEASE_SQL = '''
+    UPDATE creative_map SET hit_count = hit_count - d.n
+    FROM (
+        SELECT json_extract(initial_metadata_json, '$.{kind}') AS wrapper_id,
+               COALESCE(creative_id, '') AS final_creative_id,
+               COALESCE(ssai_creative_id, '') AS final_ssai_creative_id, COUNT(*) AS n
+        FROM vast_ads
+        WHERE id IN (SELECT id FROM purge_batch) AND wrapped_ad = 1
+          AND json_valid(initial_metadata_json)
+          AND json_extract(initial_metadata_json, '$.{kind}') IS NOT NULL
+        GROUP BY 1, 2, 3
+    ) AS d
+    WHERE creative_map.wrapper_id = d.wrapper_id AND creative_map.id_kind = '{kind}'
+      AND creative_map.final_creative_id = d.final_creative_id
+      AND creative_map.final_ssai_creative_id = d.final_ssai_creative_id
+'''
+
+
+def _purge_batch(conn, where_clause, params, batch_size):
+    conn.execute("DELETE FROM purge_batch")
+    conn.execute(f"INSERT INTO purge_batch (id) SELECT id FROM vast_ads {where_clause} LIMIT ?",
+                 tuple(params) + (batch_size,))
+    conn.execute(CREATIVES_RELEASE_SQL)
+    for kind in ('creative_id', 'ssai_creative_id'):
+        conn.execute(CREATIVE_MAP_RELEASE_SQL.format(kind=kind))
+    conn.execute("DELETE FROM creative_occurrences WHERE id IN (SELECT id FROM purge_batch)")
+    return conn.execute("DELETE FROM vast_ads WHERE id IN (SELECT id FROM purge_batch)").rowcount
+
+
+def purge_rows(conn, where_clause, params=(), batch_size=BACKFILL_BATCH_SIZE, pause=BACKFILL_PAUSE_SECONDS,
+               vacuum=True):
+    """Delete the vast_ads rows matching `where_clause` (e.g. from build_ads_filter).
+
+    Expects an autocommit connection. Refuses an empty filter. Returns the
+    number of rows deleted.
+    """
+    if not where_clause.strip():
+        raise ValueError("Refusing to purge without a filter")
+    conn.execute(PURGE_BATCH_SQL)
+    total = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            deleted = _purge_batch(conn, where_clause, params, batch_size)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        total += deleted
+        if deleted < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    if total:
+        # Dimension and mapping rows no longer backed by any hot row
+        conn.execute("DELETE FROM creatives WHERE occurrence_count <= 0")
+        conn.execute("DELETE FROM creative_map WHERE hit_count <= 0")
+        if vacuum:
+            incremental_vacuum(conn, pause=pause)
+    return total
+
+
+def purge_ids(conn, ids, **kwargs):
+    # One JSON parameter instead of one per id, so any number of ids is fine
+    return purge_rows(conn, "WHERE id IN (SELECT value FROM json_each(?))",
+                      [json.dumps([int(i) for i in ids])], **kwargs)
+
+
+def incremental_vacuum(conn, step_pages=VACUUM_STEP_PAGES, pause=BACKFILL_PAUSE_SECONDS):
+    """Release free pages a chunk at a time; a no-op unless auto_vacuum is INCREMENTAL."""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    released = 0
+    while True:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free:
+            return released
+        # executescript steps the pragma to completion; execute() would
+        # free a single page per call
+        conn.executescript(f"PRAGMA incremental_vacuum({min(free, step_pages)});")
+        released += min(free, step_pages)
+        if pause:
+            time.sleep(pause)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Delete vast_ads rows in small batches and reclaim the space.')
+    ap.add_argument('--db', default=DB_PATH)
+    ap.add_argument('--created-from', help='YYYY-MM-DD[ HH:MM:SS], inclusive')
+    ap.add_argument('--created-to', help='YYYY-MM-DD[ HH:MM:SS], exclusive')
+    ap.add_argument('--channel-name')
+    ap.add_argument('--adomain')
+    ap.add_argument('--call-number', type=int)
+    ap.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE)
+    ap.add_argument('--dry-run', action='store_true', help='only count matching rows')
+    args = ap.parse_args()
+
+    where = []
+    params = []
+    for column, op, value in [
+        ('created_at', '>=', args.created_from),
+        ('created_at', '<', args.created_to),
+        ('channel_name', '=', args.channel_name),
+        ('adomain', '=', args.adomain),
+        ('call_number', '=', args.call_number),
+    ]:
+        if value is not None:
+            if column == 'created_at':
+                datetime.strptime(value[:10], '%Y-%m-%d')
+            where.append(f"{column} {op} ?")
+            params.append(value)
+    if not where:
+        ap.error('give at least one filter')
+    where_clause = f"WHERE {' AND '.join(where)}"
+
+    conn = sqlite3.connect(args.db, timeout=30, isolation_level=None, check_same_thread=False)
+    migrate(conn)
+    matching = conn.execute(f"SELECT COUNT(*) FROM vast_ads {where_clause}", params).fetchone()[0]
+    if args.dry_run:
+        print(f"{matching} rows match.")
+    else:
+        started = time.time()
+        deleted = purge_rows(conn, where_clause, params, batch_size=args.batch_size)
+        print(f"✅ Purged {deleted} rows in {time.time() - started:.1f}s.")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import os
+import time
+import random
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+from migrations import migrate
+from metrics import inc
+
+DB_PATH = 'vast_ads.db'
+
+# Recurring tag sweeps. Each registered tag runs `calls_per_run` calls every
+# `interval_seconds`, started up to `jitter_seconds` late so tags sharing an
+# interval do not fire together. Runs go through jobs.submit_job, so they
+# share its worker pool and per-host caps with manual background jobs.
+# Slots missed while nothing was scheduling are caught up, at most
+# SWEEP_MAX_CATCH_UP extra runs per tag: the latest slot runs at once and
+# the others are deferred, spread evenly over the following interval. A tag
+# whose previous run is still in flight skips its slot, deferred or not.
+# SWEEP_SCHEDULER=1 starts the scheduler in app.py.
+SWEEP_SCHEDULER = os.environ.get('SWEEP_SCHEDULER', '0') == '1'
+SWEEP_TICK_SECONDS = float(os.environ.get('SWEEP_TICK_SECONDS', 5))
+SWEEP_MAX_CATCH_UP = int(os.environ.get('SWEEP_MAX_CATCH_UP', 3))
+# A run still queued this long after it was created is presumed lost
+SWEEP_STALE_SECONDS = int(os.environ.get('SWEEP_STALE_SECONDS', 6 * 3600))
+MIN_INTERVAL_SECONDS = 10
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+TAG_COLUMNS = ['id', 'name', 'url', 'interval_seconds', 'calls_per_run', 'jitter_seconds', 'runs_remaining',
+               'enabled', 'next_slot_at', 'next_run_at', 'created_at']
+RUN_COLUMNS = ['id', 'tag_id', 'job_id', 'scheduled_for', 'catch_up', 'status', 'calls', 'ok_calls', 'empty_calls',
+               'error_calls', 'avg_call_ms', 'max_call_ms', 'due_at', 'started_at', 'finished_at', 'created_at']
+
+_in_flight = {}   # tag id -> runs queued or running in this process
+_in_flight_lock = threading.Lock()
+_scheduler_started = False
+
+
+def _connect(db_path=None):
+    return sqlite3.connect(db_path or DB_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+
+
+def _fmt(dt):
+    return dt.strftime(TIME_FORMAT)
+
+
+def _parse(value):
+    return datetime.strptime(value[:19], TIME_FORMAT)
+
+
+def _clean_fields(fields):
+    """Coerce tag settings to their stored types; raises ValueError for non-numeric values."""
+    cleaned = {}
+    for key, value in fields.items():
+        if key == 'name':
+            cleaned[key] = value or None
+        elif key == 'runs_remaining':
+            cleaned[key] = None if value in (None, '') else max(0, int(value))
+        elif key == 'enabled':
+            cleaned[key] = int(str(value).lower() not in ('0', 'false', ''))
+        elif key == 'interval_seconds':
+            cleaned[key] = max(MIN_INTERVAL_SECONDS, int(value))
+        elif key == 'calls_per_run':
+            cleaned[key] = max(1, int(value))
+        elif key == 'jitter_seconds':
+            cleaned[key] = max(0, int(value))
+    return cleaned
+
+
+def add_tag(conn, url, interval_seconds, calls_per_run=1, jitter_seconds=0, runs_remaining=None, name=None,
+            start_at=None):
+    """Register a tag; its first run is due at `start_at` (default: now) plus jitter."""
+    tag = _clean_fields({'name': name, 'interval_seconds': interval_seconds, 'calls_per_run': calls_per_run,
+                         'jitter_seconds': jitter_seconds, 'runs_remaining': runs_remaining})
+    tag['jitter_seconds'] = min(tag['jitter_seconds'], tag['interval_seconds'])
+    slot = start_at or datetime.utcnow()
+    cur = conn.execute('''
+        INSERT INTO sweep_tags (name, url, interval_seconds, calls_per_run, jitter_seconds, runs_remaining,
+                                next_slot_at, next_run_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (tag['name'], url, tag['interval_seconds'], tag['calls_per_run'], tag['jitter_seconds'],
+          tag['runs_remaining'], _fmt(slot), _fmt(slot + timedelta(seconds=random.uniform(0, tag['jitter_seconds'])))))
+    return cur.lastrowid
+
+
+def update_tag(conn, tag_id, **fields):
+    """Change a tag's settings; values are validated like add_tag's (ValueError if non-numeric)."""
+    allowed = _clean_fields({k: v for k, v in fields.items()
+                             if k in ('name', 'interval_seconds', 'calls_per_run', 'jitter_seconds',
+                                      'runs_remaining', 'enabled')})
+    if not allowed:
+        return 0
+    assignments = ', '.join(f"{k} = ?" for k in allowed)
+    updated = conn.execute(f"UPDATE sweep_tags SET {assignments} WHERE id = ?",
+                           list(allowed.values()) + [tag_id]).rowcount
+    if allowed.get('enabled') == 0:
+        conn.execute("UPDATE sweep_runs SET status = 'skipped' WHERE tag_id = ? AND status = 'deferred'", (tag_id,))
+    # Jitter never exceeds the (possibly new) interval
+    conn.execute("UPDATE sweep_tags SET jitter_seconds = MIN(jitter_seconds, interval_seconds) WHERE id = ?",
+                 (tag_id,))
+    return updated
+
+
+def delete_tag(conn, tag_id):
+    conn.execute("DELETE FROM sweep_runs WHERE tag_id = ?", (tag_id,))
+    return conn.execute("DELETE FROM sweep_tags WHERE id = ?", (tag_id,)).rowcount
+
+
+def list_tags(conn):
+    rows = conn.execute(f'''
+        SELECT {', '.join('t.' + c for c in TAG_COLUMNS)}, r.status, r.finished_at, r.ok_calls, r.calls
+        FROM sweep_tags AS t
+        LEFT JOIN sweep_runs AS r ON r.id = (SELECT MAX(id) FROM sweep_runs WHERE tag_id = t.id)
+        ORDER BY t.id
+    ''').fetchall()
+    tags = []
+    for row in rows:
+        tag = dict(zip(TAG_COLUMNS, row))
+        tag['last_run'] = dict(zip(['status', 'finished_at', 'ok_calls', 'calls'], row[len(TAG_COLUMNS):]))
+        tags.append(tag)
+    return tags
+
+
+def get_tag(conn, tag_id, runs=50):
+    row = conn.execute(f"SELECT {', '.join(TAG_COLUMNS)} FROM sweep_tags WHERE id = ?", (tag_id,)).fetchone()
+    if row is None:
+        return None
+    tag = dict(zip(TAG_COLUMNS, row))
+    tag['runs'] = [dict(zip(RUN_COLUMNS, r)) for r in conn.execute(
+        f"SELECT {', '.join(RUN_COLUMNS)} FROM sweep_runs WHERE tag_id = ? ORDER BY id DESC LIMIT ?", (tag_id, runs)
+    )]
+    return tag
+
+
+def _finish_run(run_id, tag_id, job):
+    durations = [c['duration_ms'] for c in job['calls'] if c['duration_ms'] is not None]
+    # Calls host_guard refused to send count as errors, not as empty responses
+    errors = sum(1 for c in job['calls'] if c['result'] not in ('ok', 'no_ads'))
+    empty = sum(1 for c in job['calls'] if c['result'] == 'no_ads')
+    conn = _connect()
+    try:
+        conn.execute('''
+            UPDATE sweep_runs SET status = ?, calls = ?, ok_calls = ?, empty_calls = ?, error_calls = ?,
+                avg_call_ms = ?, max_call_ms = ?, started_at = ?, finished_at = ?
+            WHERE id = ?
+        ''', (job['status'], job['total'], job['total'] - errors - empty, empty, errors,
+              round(sum(durations) / len(durations), 1) if durations else None, max(durations, default=None),
+              job['started_at'], job['finished_at'], run_id))
+    finally:
+        conn.close()
+        with _in_flight_lock:
+            _in_flight[tag_id] -= 1
+            if not _in_flight[tag_id]:
+                del _in_flight[tag_id]
+    inc('sweep_runs_total', status=job['status'])
+
+
+def _submit_run(conn, tag_id, url, calls, scheduled_for, catch_up=False, run_id=None):
+    from jobs import submit_job
+
+    if run_id is None:
+        run_id = conn.execute(
+            "INSERT INTO sweep_runs (tag_id, scheduled_for, catch_up, status) VALUES (?, ?, ?, 'queued')",
+            (tag_id, scheduled_for, int(catch_up))
+        ).lastrowid
+    with _in_flight_lock:
+        _in_flight[tag_id] = _in_flight.get(tag_id, 0) + 1
+    job_id = submit_job(url, calls, on_complete=lambda job: _finish_run(run_id, tag_id, job))
+    conn.execute("UPDATE sweep_runs SET job_id = ? WHERE id = ? AND job_id IS NULL", (job_id, run_id))
+    return run_id
+
+
+def run_tag_now(conn, tag_id):
+    """Queue one run outside the schedule; returns the run id, or None if the tag is unknown."""
+    row = conn.execute("SELECT url, calls_per_run FROM sweep_tags WHERE id = ?", (tag_id,)).fetchone()
+    if row is None:
+        return None
+    return _submit_run(conn, tag_id, row[0], row[1], _fmt(datetime.utcnow()))
+
+
+def _schedule_tag(conn, now, tag_id, url, interval, calls, jitter, remaining, next_slot_at, next_run_at):
+    queued = []
+    # Rows written before update_tag validated may hold a zero interval
+    interval = max(MIN_INTERVAL_SECONDS, int(interval or 0))
+    slot = _parse(next_slot_at)
+    missed = max(0, int((now - slot).total_seconds() // interval))
+    slots = [slot + timedelta(seconds=i * interval)
+             for i in range(max(0, missed - SWEEP_MAX_CATCH_UP), missed + 1)]
+    with _in_flight_lock:
+        busy = tag_id in _in_flight
+    if busy:
+        slots = []
+    elif remaining is not None:
+        slots = slots[-remaining:] if remaining > 0 else []
+    next_slot = slot + timedelta(seconds=(missed + 1) * interval)
+    next_run = next_slot + timedelta(seconds=random.uniform(0, jitter))
+    left = None if remaining is None else remaining - len(slots)
+    # Claim the slot; another scheduler process may have advanced it already
+    claimed = conn.execute('''
+        UPDATE sweep_tags SET next_slot_at = ?, next_run_at = ?, runs_remaining = ?, enabled = ?
+        WHERE id = ? AND next_run_at = ?
+    ''', (_fmt(next_slot), _fmt(next_run), left, int(left is None or left > 0), tag_id, next_run_at)).rowcount
+    if not claimed:
+        return queued
+    if busy:
+        conn.execute(
+            "INSERT INTO sweep_runs (tag_id, scheduled_for, status) VALUES (?, ?, 'skipped')", (tag_id, _fmt(slot))
+        )
+        inc('sweep_runs_total', status='skipped')
+    if not slots:
+        return queued
+    # The latest slot runs now; older missed ones follow, one every
+    # interval / len(slots), rather than all at once
+    *catch_up, latest = slots
+    step = interval / len(slots)
+    conn.executemany(
+        "INSERT INTO sweep_runs (tag_id, scheduled_for, catch_up, status, due_at) VALUES (?, ?, 1, 'deferred', ?)",
+        [(tag_id, _fmt(s), _fmt(now + timedelta(seconds=(i + 1) * step))) for i, s in enumerate(reversed(catch_up))]
+    )
+    queued.append(_submit_run(conn, tag_id, url, calls, _fmt(latest)))
+    return queued
+
+
+def _run_deferred(conn, now):
+    queued = []
+    due = conn.execute('''
+        SELECT r.id, r.tag_id, t.url, t.calls_per_run, r.scheduled_for, r.due_at, t.interval_seconds
+        FROM sweep_runs AS r JOIN sweep_tags AS t ON t.id = r.tag_id
+        WHERE r.status = 'deferred' AND r.due_at <= ?
+        ORDER BY r.due_at
+    ''', (_fmt(now),)).fetchall()
+    for run_id, tag_id, url, calls, scheduled_for, due_at, interval in due:
+        with _in_flight_lock:
+            busy = tag_id in _in_flight
+        # A catch-up run overdue by a whole interval (the scheduler was down)
+        # is dropped rather than fired together with the others
+        late = (now - _parse(due_at)).total_seconds() >= interval
+        status = 'skipped' if busy or late else 'queued'
+        claimed = conn.execute("UPDATE sweep_runs SET status = ? WHERE id = ? AND status = 'deferred'",
+                               (status, run_id)).rowcount
+        if not claimed:
+            continue
+        if status == 'skipped':
+            inc('sweep_runs_total', status='skipped')
+        else:
+            queued.append(_submit_run(conn, tag_id, url, calls, scheduled_for, run_id=run_id))
+    return queued
+
+
+def run_due(conn, now=None):
+    """Queue every due run and advance each tag's schedule; returns the run ids queued."""
+    now = now or datetime.utcnow()
+    queued = []
+    due = conn.execute('''
+        SELECT id, url, interval_seconds, calls_per_run, jitter_seconds, runs_remaining, next_slot_at, next_run_at
+        FROM sweep_tags
+        WHERE enabled = 1 AND next_run_at <= ?
+        ORDER BY next_run_at
+    ''', (_fmt(now),)).fetchall()
+    for row in due:
+        # One bad tag must not stop the others from running
+        try:
+            queued.extend(_schedule_tag(conn, now, *row))
+        except Exception as e:
+            print(f"❌ Sweep {row[0]} not scheduled: {e}")
+            inc('sweep_runs_total', status='error')
+    queued.extend(_run_deferred(conn, now))
+    return queued
+
+
+def _scheduler_loop():
+    conn = _connect()
+    while True:
+        try:
+            run_due(conn)
+        except Exception as e:
+            print(f"❌ Sweep scheduler error: {e}")
+        time.sleep(SWEEP_TICK_SECONDS)
+
+
+def start_scheduler():
+    """Start the background scheduler once per process, if SWEEP_SCHEDULER=1."""
+    global _scheduler_started
+    if not SWEEP_SCHEDULER or _scheduler_started:
+        return False
+    _scheduler_started = True
+    conn = _connect()
+    # Runs left queued by a process that has since exited will never finish.
+    # Only stale ones: another process may still be working on recent runs.
+    conn.execute(
+        "UPDATE sweep_runs SET status = 'abandoned' "
+        "WHERE status IN ('queued', 'running') AND created_at < datetime('now', ?)",
+        (f"-{SWEEP_STALE_SECONDS} seconds",)
+    )
+    conn.close()
+    threading.Thread(target=_scheduler_loop, name='sweep-scheduler', daemon=True).start()
+    print(f"✅ Sweep scheduler running (tick {SWEEP_TICK_SECONDS}s, catch-up {SWEEP_MAX_CATCH_UP})")
+    return True
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Manage and run scheduled VAST tag sweeps.')
+    ap.add_argument('command', choices=['add', 'list'])
+    ap.add_argument('url', nargs='?')
+    ap.add_argument('--db', default=DB_PATH)
+    ap.add_argument('--name')
+    ap.add_argument('--interval', type=int, default=300, help='seconds between runs')
+    ap.add_argument('--calls', type=int, default=1, help='calls per run')
+    ap.add_argument('--jitter', type=int, default=0, help='max seconds to delay each run')
+    ap.add_argument('--runs', type=int, default=None, help='stop after this many runs (default: forever)')
+    args = ap.parse_args()
+
+    conn = _connect(args.db)
+    migrate(conn)
+    if args.command == 'add':
+        if not args.url:
+            ap.error('add needs a url')
+        tag_id = add_tag(conn, args.url, args.interval, args.calls, args.jitter, args.runs, args.name)
+        print(f"✅ Added sweep {tag_id}.")
+    else:
+        for tag in list_tags(conn):
+            print(tag['id'], tag['name'] or '', tag['url'], f"every {tag['interval_seconds']}s",
+                  f"next {tag['next_run_at']}", 'enabled' if tag['enabled'] else 'disabled', sep='\t')
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import unittest
+from unittest import mock
+
+import host_guard
+
+
+class FakeClock:
+    """Stands in for the time module; sleeps are recorded but do not advance
+    the clock, as if every caller waited in its own thread."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class HostGuardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        settings = {'HOST_RATE_PER_SECOND': 2.0, 'HOST_BURST': 3.0, 'HOST_RATE_WAIT_SECONDS': 1.0,
+                    'HOST_TIMEOUT_MIN': 0.5, 'HOST_TIMEOUT_FACTOR': 3.0, 'HOST_BREAKER_FAILURES': 3,
+                    'HOST_BREAKER_COOLDOWN': 30.0}
+        patches = [mock.patch.object(host_guard, 'time', self.clock), mock.patch.dict(host_guard._hosts, clear=True)]
+        patches += [mock.patch.object(host_guard, name, value) for name, value in settings.items()]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _trip(self, host='ads.example'):
+        for _ in range(3):
+            self.assertTrue(host_guard.acquire(host)[0])
+            host_guard.record(host, 0.1, ok=False)
+
+    def test_token_bucket_bursts_waits_then_refuses(self):
+        for _ in range(3):
+            self.assertEqual(host_guard.acquire('ads.example'), (True, None, 10.0))
+        self.assertEqual(self.clock.slept, [])
+        # Out of tokens: the next caller waits for one, within HOST_RATE_WAIT_SECONDS
+        self.assertTrue(host_guard.acquire('ads.example')[0])
+        self.assertEqual(self.clock.slept, [0.5])
+        self.assertTrue(host_guard.acquire('ads.example')[0])
+        self.assertEqual(self.clock.slept, [0.5, 1.0])
+        # Two reserved tokens ahead would need 1.5s (> 1.0), so refuse
+        self.assertEqual(host_guard.acquire('ads.example'), (False, 'rate_limited', None))
+        self.clock.advance(10)
+        self.assertTrue(host_guard.acquire('ads.example')[0])
+        # Hosts have separate buckets
+        self.assertEqual(host_guard.acquire('other.example'), (True, None, 10.0))
+
+    def test_timeout_follows_p95_latency(self):
+        host_guard.record('ads.example', 0.05, ok=True)
+        self.assertEqual(host_guard.acquire('ads.example', max_timeout=8.0)[2], 8.0)
+        for _ in range(host_guard.LATENCY_MIN_SAMPLES):
+            host_guard.record('ads.example', 0.05, ok=True)
+        self.clock.advance(10)
+        # 3 x 0.05 is clamped up to HOST_TIMEOUT_MIN
+        self.assertEqual(host_guard.acquire('ads.example', max_timeout=8.0)[2], 0.5)
+        for _ in range(host_guard.LATENCY_WINDOW):
+            host_guard.record('ads.example', 1.0, ok=True)
+        self.clock.advance(10)
+        self.assertEqual(host_guard.acquire('ads.example', max_timeout=8.0)[2], 3.0)
+        self.assertEqual(host_guard.acquire('ads.example', max_timeout=2.0)[2], 2.0)
+
+    def test_breaker_opens_and_a_successful_trial_closes_it(self):
+        self._trip()
+        self.assertEqual(host_guard.acquire('ads.example'), (False, 'circuit_open', None))
+        self.clock.advance(30)
+        # Half-open: one trial, everyone else is still refused
+        self.assertTrue(host_guard.acquire('ads.example')[0])
+        self.assertEqual(host_guard.acquire('ads.example'), (False, 'circuit_open', None))
+        host_guard.record('ads.example', 0.1, ok=True)
+        self.assertTrue(host_guard.acquire('ads.example')[0])
+        self.assertFalse(host_guard.snapshot()['ads.example']['circuit_open'])
+
+    def test_failed_trial_reopens_for_a_full_cooldown(self):
+        self._trip()
+        self.clock.advance(30)
+        self.assertTrue(host_guard.acquire('ads.example')[0])
+        host_guard.record('ads.example', 0.1, ok=False)
+        self.clock.advance(29)
+        self.assertEqual(host_guard.acquire('ads.example'), (False, 'circuit_open', None))
+        self.clock.advance(1)
+        self.assertTrue(host_guard.acquire('ads.example')[0])
+
+    def test_unrecorded_trial_does_not_block_forever(self):
+        self._trip()
+        self.clock.advance(30)
+        self.assertTrue(host_guard.acquire('ads.example')[0])
+        self.clock.advance(29)
+        self.assertEqual(host_guard.acquire('ads.example'), (False, 'circuit_open', None))
+        self.clock.advance(1)
+        self.assertTrue(host_guard.acquire('ads.example')[0])
+
+    def test_rate_limited_trial_frees_the_slot(self):
+        self._trip()
+        host_guard._hosts['ads.example']['tokens'] = -5
+        self.clock.advance(30)
+        host_guard._hosts['ads.example']['refilled_at'] = self.clock.now
+        self.assertEqual(host_guard.acquire('ads.example'), (False, 'rate_limited', None))
+        self.clock.advance(5)
+        self.assertTrue(host_guard.acquire('ads.example')[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from migrations import migrate
+
+
+class PersistedJobsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        # parser_1, imported by jobs, migrates ./vast_ads.db at import
+        os.chdir(self.tmp.name)
+        import jobs
+        self.jobs = jobs
+        self.db_path = os.path.join(self.tmp.name, 'jobs.db')
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        migrate(conn)
+        conn.close()
+        for p in [mock.patch.object(jobs, 'DB_PATH', self.db_path),
+                  mock.patch.object(jobs, '_db', jobs.threading.local()),
+                  mock.patch.object(jobs, '_orphans_checked', True),
+                  mock.patch.object(jobs, 'parse_vast_call', lambda url, call_number: ('no_ads', 'nothing'))]:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def _wait(self, job_id):
+        for _ in range(200):
+            status = self.jobs.job_status(job_id)
+            if status['status'] not in ('queued', 'running'):
+                return status
+            time.sleep(0.01)
+        self.fail(f"job {job_id} did not finish")
+
+    def test_status_is_read_from_the_table(self):
+        job_id = self.jobs.submit_job('http://ads.example/vast', 3)
+        status = self._wait(job_id)
+        self.assertEqual((status['status'], status['completed'], status['total']), ('done', 3, 3))
+        self.assertEqual([c['result'] for c in status['calls']], ['no_ads'] * 3)
+        # Another worker only has the table
+        self.assertNotIn(job_id, self.jobs._jobs)
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone(), ('done',))
+        conn.close()
+        self.assertEqual(self.jobs.list_jobs()[0]['id'], job_id)
+
+    def test_task_message_is_recorded(self):
+        job_id = self.jobs.submit_task('purge', lambda n: f"Purged {n} rows.", 7)
+        status = self._wait(job_id)
+        self.assertEqual((status['kind'], status['status'], status['message']), ('purge', 'done', 'Purged 7 rows.'))
+
+    def test_jobs_of_exited_processes_are_abandoned(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        now = self.jobs._now()
+        conn.executemany(
+            "INSERT INTO jobs (id, owner, status, total, created_at) VALUES (?, ?, 'running', 1, ?)",
+            [('dead', f"{self.jobs.socket.gethostname()}:999999999", now),
+             ('alive', f"{self.jobs.socket.gethostname()}:{os.getpid()}", now),
+             ('elsewhere', 'otherhost:1', now),
+             ('stale', 'otherhost:1', '2000-01-01 00:00:00')]
+        )
+        conn.execute("INSERT INTO job_calls (job_id, call_number, status) VALUES ('dead', 1, 'running')")
+        self.jobs._abandon_orphans(conn)
+        self.assertEqual(dict(conn.execute("SELECT id, status FROM jobs")),
+                         {'dead': 'abandoned', 'alive': 'running', 'elsewhere': 'running', 'stale': 'abandoned'})
+        self.assertEqual(conn.execute("SELECT status FROM job_calls").fetchone(), ('abandoned',))
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
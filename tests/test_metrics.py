@@ -0,0 +1,37 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from migrations import migrate
+from metrics import prune_call_metrics
+
+
+class PruneCallMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.tmp.name, 'vast_ads.db'), isolation_level=None)
+        migrate(self.conn)
+        self.conn.executemany(
+            "INSERT INTO vast_call_metrics (call_id, stage, duration_ms, created_at) "
+            "VALUES (?, 'call', 1.0, datetime('now', ?))",
+            [(f"c{days}", f"-{days} days") for days in (90, 45, 31, 29, 1, 0)]
+        )
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def test_prunes_only_rows_past_retention(self):
+        self.assertEqual(prune_call_metrics(self.conn, retention_days=30), 3)
+        self.assertEqual([r[0] for r in self.conn.execute("SELECT call_id FROM vast_call_metrics ORDER BY id")],
+                         ['c29', 'c1', 'c0'])
+
+    def test_zero_keeps_everything(self):
+        self.assertEqual(prune_call_metrics(self.conn, retention_days=0), 0)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM vast_call_metrics").fetchone()[0], 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
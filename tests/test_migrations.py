@@ -0,0 +1,40 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from migrations import migrate, make_creative_hash
+
+
+class CreativeHashBackfillTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.conn = sqlite3.connect(os.path.join(self.tmp.name, 'old.db'), isolation_level=None)
+        migrate(self.conn, target=2)
+        self.conn.execute(
+            "INSERT INTO vast_ads (creative_id, ssai_creative_id, media_urls, adomain) VALUES (?, ?, ?, ?)",
+            ('cr-1', None, '["https://cdn.example/a.mp4", "https://cdn.example/b.mp4"]', 'adv.com')
+        )
+
+    def tearDown(self):
+        self.conn.close()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_backfill_matches_ingestion_hash(self):
+        migrate(self.conn, target=3)
+        stored = self.conn.execute("SELECT creative_hash FROM vast_ads").fetchone()[0]
+        self.assertEqual(stored, make_creative_hash(None, 'cr-1', 'https://cdn.example/a.mp4,https://cdn.example/b.mp4',
+                                                    'adv.com'))
+
+    def test_backfill_leaves_the_working_directory_alone(self):
+        # Migration 3 once imported parser_1, which migrates ./vast_ads.db
+        migrate(self.conn, target=3)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, 'vast_ads.db')))
+
+
+if __name__ == '__main__':
+    unittest.main()
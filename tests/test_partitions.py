@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from migrations import migrate
+from partitions import archive_old_partitions
+from purge import purge_rows
+
+ROLLUPS_SQL = "SELECT hour, channel_name, adomain, ad_count, wrapped_count FROM ad_rollups_hourly ORDER BY 1, 2, 3"
+CREATIVES_SQL = "SELECT hour, creative_hash, ad_count FROM ad_rollup_creatives ORDER BY 1, 2"
+
+
+class ArchiveKeepsRollupsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.conn = sqlite3.connect(os.path.join(self.tmp.name, 'vast_ads.db'), isolation_level=None)
+        migrate(self.conn)
+        rows = [(i, 'ch', 'adv.com', f"hash{i % 3}", i % 2, '2025-01-15 10:%02d:00' % i) for i in range(10)]
+        rows += [(10 + i, 'ch', 'adv.com', 'hash0', 0, '2099-01-01 00:00:00') for i in range(2)]
+        self.conn.executemany(
+            "INSERT INTO vast_ads (call_number, channel_name, adomain, creative_hash, wrapped_ad, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def test_archiving_a_month_keeps_its_rollups(self):
+        before = self.conn.execute(ROLLUPS_SQL).fetchall(), self.conn.execute(CREATIVES_SQL).fetchall()
+        written = archive_old_partitions(self.conn, retention_days=30, archive_dir=os.path.join(self.tmp.name, 'a'))
+        self.assertEqual([e['partition'] for e in written], ['2025-01'])
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM vast_ads").fetchone()[0], 2)
+        after = self.conn.execute(ROLLUPS_SQL).fetchall(), self.conn.execute(CREATIVES_SQL).fetchall()
+        self.assertEqual(after, before)
+        self.assertIn(('2025-01-15 10:00:00', 'ch', 'adv.com', 10, 5), after[0])
+
+    def test_purge_still_decrements(self):
+        purge_rows(self.conn, "WHERE created_at >= ?", ['2099-01-01'], pause=0)
+        self.assertEqual(self.conn.execute(ROLLUPS_SQL).fetchall(),
+                         [('2025-01-15 10:00:00', 'ch', 'adv.com', 10, 5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
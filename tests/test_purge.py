@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+from benchmarks.generate_db import build_parser, generate
+from migrations import rebuild_derived_tables
+from purge import purge_rows, purge_ids
+
+# What purge_rows maintains incrementally, in a comparable form
+DERIVED_SQL = {
+    'creatives': "SELECT creative_hash, occurrence_count FROM creatives ORDER BY 1",
+    'creative_occurrences': "SELECT id, creative_hash FROM creative_occurrences ORDER BY 1",
+    'creative_map': "SELECT wrapper_id, id_kind, final_creative_id, final_ssai_creative_id, hit_count "
+                    "FROM creative_map ORDER BY 1, 2, 3, 4",
+    'ad_rollups_hourly': "SELECT hour, channel_name, adomain, ad_count, wrapped_count FROM ad_rollups_hourly "
+                         "WHERE ad_count > 0 ORDER BY 1, 2, 3",
+    'ad_rollup_creatives': "SELECT hour, channel_name, adomain, creative_hash, ad_count FROM ad_rollup_creatives "
+                           "WHERE ad_count > 0 ORDER BY 1, 2, 3, 4",
+}
+
+
+class PurgeMatchesRebuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmp.name, 'vast_ads.db')
+        args = build_parser().parse_args(['--db', db_path, '--rows', '3000', '--creatives', '60', '--ad-ids', '200',
+                                          '--advertisers', '20', '--channels', '6', '--days', '3', '--xml-kb', '0'])
+        with redirect_stdout(StringIO()):
+            generate(args)
+        self.conn = sqlite3.connect(db_path, isolation_level=None)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def _derived(self):
+        return {name: self.conn.execute(sql).fetchall() for name, sql in DERIVED_SQL.items()}
+
+    def assertMatchesRebuild(self):
+        incremental = self._derived()
+        rebuild_derived_tables(self.conn)
+        rebuilt = self._derived()
+        for name in DERIVED_SQL:
+            self.assertEqual(incremental[name], rebuilt[name], name)
+
+    def test_filter_purge_in_small_batches(self):
+        before = self.conn.execute("SELECT COUNT(*) FROM vast_ads").fetchone()[0]
+        deleted = purge_rows(self.conn, "WHERE channel_name IN (?, ?) OR call_number = ?",
+                             ['channel0', 'channel3', 2], batch_size=97, pause=0, vacuum=False)
+        self.assertGreater(deleted, 500)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM vast_ads").fetchone()[0], before - deleted)
+        self.assertMatchesRebuild()
+
+    def test_purge_ids(self):
+        ids = [r[0] for r in self.conn.execute("SELECT id FROM vast_ads WHERE wrapped_ad = 1 LIMIT 50")]
+        self.assertEqual(purge_ids(self.conn, ids, batch_size=7, pause=0, vacuum=False), 50)
+        self.assertMatchesRebuild()
+
+    def test_purging_every_row_of_a_creative_drops_it(self):
+        creative_hash = self.conn.execute("SELECT creative_hash FROM creatives ORDER BY occurrence_count LIMIT 1"
+                                          ).fetchone()[0]
+        purge_rows(self.conn, "WHERE creative_hash = ?", [creative_hash], pause=0, vacuum=False)
+        self.assertIsNone(self.conn.execute("SELECT 1 FROM creatives WHERE creative_hash = ?",
+                                            (creative_hash,)).fetchone())
+        self.assertMatchesRebuild()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import sqlite3
+import tempfile
+import types
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+import sweeps
+from migrations import migrate
+
+NOW = datetime(2025, 1, 15, 12, 0, 0)
+INTERVAL = 400
+
+
+class SweepSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        db_path = os.path.join(self.tmp.name, 'vast_ads.db')
+        self.conn = sqlite3.connect(db_path, isolation_level=None)
+        migrate(self.conn)
+        # Capture submitted jobs instead of running them; _finish_run reopens DB_PATH
+        self.submitted = []
+        fake_jobs = types.ModuleType('jobs')
+        fake_jobs.submit_job = self._submit_job
+        patches = [mock.patch.dict(sys.modules, {'jobs': fake_jobs}), mock.patch.object(sweeps, 'DB_PATH', db_path),
+                   mock.patch.object(sweeps, 'SWEEP_MAX_CATCH_UP', 3), mock.patch.dict(sweeps._in_flight, clear=True)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def _submit_job(self, url, calls, on_complete=None):
+        self.submitted.append(on_complete)
+        return f"job{len(self.submitted)}"
+
+    def _finish(self, index):
+        call = {'status': 'done', 'result': 'ok', 'duration_ms': 5.0}
+        self.submitted[index]({'status': 'done', 'total': 1, 'calls': [call], 'started_at': None,
+                               'finished_at': None})
+
+    def _runs(self, status):
+        return self.conn.execute("SELECT scheduled_for, catch_up, due_at FROM sweep_runs WHERE status = ? ORDER BY id",
+                                 (status,)).fetchall()
+
+    def test_slot_is_claimed_once(self):
+        tag_id = sweeps.add_tag(self.conn, 'http://ads.example/vast', INTERVAL, start_at=NOW)
+        self.assertEqual(len(sweeps.run_due(self.conn, NOW)), 1)
+        self._finish(0)
+        self.assertEqual(sweeps.run_due(self.conn, NOW), [])
+        # A scheduler that read the row before the claim loses the race
+        row = self.conn.execute("SELECT id, url, interval_seconds, calls_per_run, jitter_seconds, runs_remaining "
+                                "FROM sweep_tags WHERE id = ?", (tag_id,)).fetchone()
+        stale = (sweeps._fmt(NOW), sweeps._fmt(NOW))
+        self.assertEqual(sweeps._schedule_tag(self.conn, NOW, *row, *stale), [])
+        self.assertEqual(len(self.submitted), 1)
+
+    def test_catch_up_runs_are_spread_over_the_interval(self):
+        sweeps.add_tag(self.conn, 'http://ads.example/vast', INTERVAL, start_at=NOW - timedelta(seconds=10 * INTERVAL))
+        self.assertEqual(len(sweeps.run_due(self.conn, NOW)), 1)
+        self.assertEqual(self._runs('queued'), [(sweeps._fmt(NOW), 0, None)])
+        deferred = self._runs('deferred')
+        self.assertEqual([r[0] for r in deferred],
+                         [sweeps._fmt(NOW - timedelta(seconds=i * INTERVAL)) for i in (1, 2, 3)])
+        self.assertEqual([r[2] for r in deferred],
+                         [sweeps._fmt(NOW + timedelta(seconds=i * INTERVAL / 4)) for i in (1, 2, 3)])
+        self._finish(0)
+        self.assertEqual(len(sweeps.run_due(self.conn, NOW + timedelta(seconds=INTERVAL / 4))), 1)
+        self.assertEqual(len(self._runs('deferred')), 2)
+
+    def test_busy_tag_skips_its_slot_and_catch_up(self):
+        sweeps.add_tag(self.conn, 'http://ads.example/vast', INTERVAL, start_at=NOW - timedelta(seconds=INTERVAL))
+        self.assertEqual(len(sweeps.run_due(self.conn, NOW)), 1)
+        # The first run is still in flight when the deferred one and the next slot come due
+        self.assertEqual(sweeps.run_due(self.conn, NOW + timedelta(seconds=INTERVAL)), [])
+        self.assertEqual(len(self._runs('skipped')), 2)
+        self.assertEqual(len(self.submitted), 1)
+        self._finish(0)
+        self.assertEqual(len(sweeps.run_due(self.conn, NOW + timedelta(seconds=2 * INTERVAL))), 1)
+
+    def test_overdue_catch_up_is_dropped(self):
+        sweeps.add_tag(self.conn, 'http://ads.example/vast', INTERVAL, start_at=NOW - timedelta(seconds=INTERVAL))
+        sweeps.run_due(self.conn, NOW)
+        self._finish(0)
+        self.conn.execute("UPDATE sweep_tags SET enabled = 0")
+        self.assertEqual(sweeps.run_due(self.conn, NOW + timedelta(seconds=3 * INTERVAL)), [])
+        self.assertEqual(len(self._runs('skipped')), 1)
+
+    def test_disabling_cancels_deferred_runs(self):
+        tag_id = sweeps.add_tag(self.conn, 'http://ads.example/vast', INTERVAL,
+                                start_at=NOW - timedelta(seconds=2 * INTERVAL))
+        sweeps.run_due(self.conn, NOW)
+        sweeps.update_tag(self.conn, tag_id, enabled=0)
+        self.assertEqual(self._runs('deferred'), [])
+        self.assertEqual(len(self._runs('skipped')), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()